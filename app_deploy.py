@@ -1,30 +1,37 @@
 import streamlit as st
-import pandas as pd
 from modules.auth import check_password
-from modules.database import fetch_table, get_master_list
+from modules.database import fetch_table, get_master_options, warm_up, apply_write_results, replay_journal
 from modules.ui import (
     load_css, custom_title, render_sidebar, 
     render_activity_log, render_related_parties, render_assets_management,
     render_person_registration, render_reports, render_data_management, render_settings
 )
-from modules.utils import calculate_age
-from modules.constants import MAP_PERSONS
+from modules.utils import calculate_age_series
+from modules.metrics import export_textfile
+from modules.constants import MAP_PERSONS, PAGE_TABLES
 
 st.set_page_config(page_title="成年後見業務支援システム", layout="wide")
 
 def main():
     if not check_password(): return
+
+    # バックグラウンドで送信が終わった書き込みをキャッシュへ反映
+    apply_write_results()
+    # 接続できずに端末内へ保存していた書き込みを再送
+    replay_journal()
     
     load_css()
     custom_title("成年後見業務支援システム")
 
+    menu = render_sidebar()
+
+    # 表示する画面で使うテーブルを並列に取得しておく（初回表示の待ち時間を短縮）
+    warm_up(PAGE_TABLES.get(menu, ['persons', 'master_options']))
+
     df_persons = fetch_table("persons", MAP_PERSONS)
     
     if '生年月日' in df_persons.columns and not df_persons.empty:
-        df_persons['年齢'] = df_persons['生年月日'].apply(calculate_age)
-        df_persons['年齢'] = pd.to_numeric(df_persons['年齢'], errors='coerce')
-
-    menu = render_sidebar()
+        df_persons['年齢'] = calculate_age_series(df_persons['生年月日'])
 
     # Session State Initialization
     for key in ['selected_person_id', 'delete_confirm_id', 'edit_asset_id', 'delete_asset_id', 
@@ -32,10 +39,11 @@ def main():
         if key not in st.session_state: st.session_state[key] = None
 
     # マスタデータキャッシュの取得とフォールバック
-    act_opts = get_master_list('activity') or ["面会", "打ち合わせ", "電話", "メール", "行政手続き", "財産管理", "その他"]
-    rel_opts = get_master_list('relationship') or ["親族", "ケアマネ", "施設相談員", "病院SW", "主治医", "弁護士", "行政", "その他"]
-    ast_opts = get_master_list('asset') or ["預貯金", "現金", "有価証券", "保険", "不動産", "負債", "その他"]
-    guard_opts = get_master_list('guardian_type') or ["後見", "保佐", "補助", "任意", "未成年後見", "その他"]
+    master = get_master_options()
+    act_opts = master.names.get('activity') or ["面会", "打ち合わせ", "電話", "メール", "行政手続き", "財産管理", "その他"]
+    rel_opts = master.names.get('relationship') or ["親族", "ケアマネ", "施設相談員", "病院SW", "主治医", "弁護士", "行政", "その他"]
+    ast_opts = master.names.get('asset') or ["預貯金", "現金", "有価証券", "保険", "不動産", "負債", "その他"]
+    guard_opts = master.names.get('guardian_type') or ["後見", "保佐", "補助", "任意", "未成年後見", "その他"]
 
     if menu == "利用者情報・活動記録":
         render_activity_log(df_persons, act_opts)
@@ -52,5 +60,8 @@ def main():
     elif menu == "初期設定":
         render_settings()
 
+    # 設定されていれば計測結果をPrometheus形式のファイルに書き出す
+    export_textfile()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
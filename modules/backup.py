@@ -0,0 +1,157 @@
+import datetime
+import hashlib
+import io
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import streamlit as st
+from .constants import TABLE_MAPS, TABLE_ID_COLUMNS, RESTORE_WAVES
+from .utils import to_int_id
+from .database import init_supabase, iter_pages, bulk_upsert, _make_chunks, _to_db_value, _invalidate
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# バックアップ形式のバージョン（復元時の互換性確認用）
+BACKUP_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _fetch_rows(client, table_name):
+    """
+    テーブルの全行をDBカラム名・DBの値のまま取得する（復元で元どおりに戻せるように型変換しない）
+    """
+    id_col_en = TABLE_MAPS[table_name][TABLE_ID_COLUMNS[table_name]]
+    rows = []
+    for page, _ in iter_pages(client, table_name, order_col=id_col_en):
+        rows.extend(page)
+    return rows
+
+def create_backup():
+    """
+    全テーブルを並列に取得し、Parquet・CSV・マニフェスト（件数とチェックサム）をまとめたZIPのバイト列を返す
+    """
+    client = init_supabase()
+    tables = [t for wave in RESTORE_WAVES for t in wave]
+    with ThreadPoolExecutor(max_workers=len(tables)) as pool:
+        results = dict(zip(tables, pool.map(lambda t: _fetch_rows(client, t), tables)))
+
+    manifest = {
+        'format': BACKUP_FORMAT,
+        'created_at': datetime.datetime.now().astimezone().isoformat(timespec='seconds'),
+        'tables': {},
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for table_name in tables:
+            rows = results[table_name]
+            # 欠損を含む整数カラムがfloat（1.0等）で書き出されないよう、nullable型に変換
+            df = pd.DataFrame(rows).convert_dtypes(convert_string=False) if rows else pd.DataFrame(columns=list(TABLE_MAPS[table_name].values()))
+            info = {'rows': len(df), 'columns': list(df.columns), 'files': {}}
+            # CSVは表計算ソフトでの確認用（UTF-8 BOM付き、全文字を保持）
+            csv_bytes = df.to_csv(index=False).encode('utf-8-sig')
+            zf.writestr(f"{table_name}.csv", csv_bytes)
+            info['files']['csv'] = {'name': f"{table_name}.csv", 'sha256': _sha256(csv_bytes)}
+            if HAS_PARQUET:
+                parquet_bytes = df.to_parquet(index=False, compression='zstd')
+                zf.writestr(f"{table_name}.parquet", parquet_bytes)
+                info['files']['parquet'] = {'name': f"{table_name}.parquet", 'sha256': _sha256(parquet_bytes)}
+            manifest['tables'][table_name] = info
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    return buffer.getvalue()
+
+def read_backup(file_obj):
+    """
+    バックアップZIPを読み込み、チェックサムを検証して (マニフェスト, {テーブル名: DataFrame}) を返す
+    検証に失敗した場合は ValueError を送出する
+    """
+    with zipfile.ZipFile(file_obj) as zf:
+        manifest = json.loads(zf.read(MANIFEST_NAME))
+        if manifest.get('format') != BACKUP_FORMAT:
+            raise ValueError(f"対応していないバックアップ形式です: {manifest.get('format')}")
+        frames = {}
+        for table_name, info in manifest['tables'].items():
+            if table_name not in TABLE_MAPS:
+                raise ValueError(f"不明なテーブルです: {table_name}")
+            # Parquetを優先し（型を保持）、読めない環境ではCSVを使う
+            kind = 'parquet' if HAS_PARQUET and 'parquet' in info['files'] else 'csv'
+            entry = info['files'][kind]
+            data = zf.read(entry['name'])
+            if _sha256(data) != entry['sha256']:
+                raise ValueError(f"{entry['name']} のチェックサムが一致しません（ファイルが破損しています）")
+            if kind == 'parquet':
+                # 読み込み時も同様にnullable型へ変換
+                df = pd.read_parquet(io.BytesIO(data)).convert_dtypes(convert_string=False)
+            else:
+                df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, na_values=[''], encoding='utf-8-sig')
+            if len(df) != info['rows']:
+                raise ValueError(f"{table_name} の件数がマニフェストと一致しません")
+            frames[table_name] = df
+    return manifest, frames
+
+def _to_records(df):
+    """
+    DataFrameを送信用のレコード（欠損はNone、numpyの値はPythonの値）に変換する
+    """
+    return [{col: _to_db_value(val) for col, val in row.items()} for row in df.astype(object).to_dict('records')]
+
+def _fetch_ids(client, table_name):
+    """
+    テーブルの全行のIDを取得する（復元後の検証用）
+    """
+    id_col_en = TABLE_MAPS[table_name][TABLE_ID_COLUMNS[table_name]]
+    ids = set()
+    for page, _ in iter_pages(client, table_name, order_col=id_col_en, columns=id_col_en):
+        ids.update(to_int_id(r[id_col_en]) for r in page)
+    return ids
+
+def _restore_table(client, table_name, df):
+    id_col_en = TABLE_MAPS[table_name][TABLE_ID_COLUMNS[table_name]]
+    return bulk_upsert(client, table_name, _make_chunks(_to_records(df), id_col_en), id_col_en)
+
+def restore_backup(file_obj):
+    """
+    バックアップZIPから全テーブルを復元し、テーブルごとの検証結果（DataFrame）を返す
+    外部キーの順（利用者 → 活動・財産・関係者）に、依存関係のないテーブルは並列に一括登録する
+    既存の行はIDが同じものを上書きし、バックアップにない行は削除しない
+    """
+    manifest, frames = read_backup(file_obj)
+    client = init_supabase()
+    results = {}
+    for wave in RESTORE_WAVES:
+        targets = [t for t in wave if t in frames]
+        if not targets: continue
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            results.update(zip(targets, pool.map(lambda t: _restore_table(client, t, frames[t]), targets)))
+        failed = [t for t in targets if results[t]['error'] is not None]
+        for t in targets: _invalidate(t)
+        if failed:
+            # 依存するテーブルを登録しても外部キーで失敗するため中断
+            errors = ", ".join(f"{t}: {results[t]['error']}" for t in failed)
+            raise RuntimeError(f"復元に失敗しました（{errors}）")
+
+    # IDを指定して登録したため、自動採番の続きを最大IDの次に合わせる（sql/reset_sequences.sql）
+    try:
+        client.rpc('reset_id_sequences', {}).execute()
+    except Exception as e:
+        st.warning(f"自動採番の再設定ができませんでした。sql/reset_sequences.sql を実行してください: {e}")
+
+    # 検証: 復元後のIDを読み直し、件数が一致し、バックアップの全IDが登録されていることを確認
+    report = []
+    for table_name, info in manifest['tables'].items():
+        id_col_en = TABLE_MAPS[table_name][TABLE_ID_COLUMNS[table_name]]
+        backup_ids = {to_int_id(v) for v in frames[table_name][id_col_en].dropna()} if info['rows'] else set()
+        db_ids = _fetch_ids(client, table_name)
+        missing = len(backup_ids - db_ids)
+        report.append({
+            'テーブル': table_name, 'バックアップ件数': info['rows'], '登録件数': results.get(table_name, {}).get('count', 0),
+            '復元後の件数': len(db_ids), '不足ID数': missing,
+            '検証': 'OK' if len(db_ids) == info['rows'] and missing == 0 else 'NG',
+        })
+    return pd.DataFrame(report)
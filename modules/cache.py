@@ -0,0 +1,145 @@
+import threading
+import time
+import streamlit as st
+
+# キャッシュの有効期間（秒）
+CACHE_TTL = 600
+# 保持する派生データの上限件数（利用者・期間ごとの集計などが増え続けないように、古いものから破棄）
+MAX_DERIVED = 256
+
+class DoNotCache(Exception):
+    """
+    derive() の作成関数から送出すると、valueを返すが保持しない（取得エラー・古いデータから作った場合）
+    """
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+class TableCache:
+    """
+    テーブル単位でバージョン管理するDataFrameキャッシュ
+    書き込み時は該当テーブルのバージョンを上げ、そのテーブル（および派生するフィルタ結果）のみ破棄する
+    """
+    def __init__(self, ttl=CACHE_TTL, max_derived=MAX_DERIVED):
+        self.ttl = ttl
+        self.max_derived = max_derived
+        self._lock = threading.RLock()
+        self._versions = {}  # テーブル名 -> バージョン番号
+        self._entries = {}   # テーブル名 -> {フィルタキー: {'df': DataFrame, 'fetched_at': 取得時刻, ...付加情報}}
+        self._derived = {}   # 派生データ名 -> (元テーブル名, 各テーブルのバージョン, 作成時刻, 値)
+
+    def version(self, table_name):
+        """
+        テーブルの現在のバージョン番号を返す
+        """
+        with self._lock:
+            return self._versions.get(table_name, 0)
+
+    def get(self, table_name, filter_key=()):
+        """
+        キャッシュ済みのDataFrameを返す（未取得・期限切れの場合はNone）
+        """
+        with self._lock:
+            entry = self._entries.get(table_name, {}).get(filter_key)
+            if entry is None: return None
+            if time.monotonic() - entry['fetched_at'] > self.ttl:
+                return None
+            return entry['df']
+
+    def entry(self, table_name, filter_key=()):
+        """
+        期限切れも含めてキャッシュエントリ（付加情報つき）を返す（差分同期用）
+        """
+        with self._lock:
+            entry = self._entries.get(table_name, {}).get(filter_key)
+            return dict(entry) if entry is not None else None
+
+    def entries(self, table_name):
+        """
+        テーブルのキャッシュエントリを期限切れも含めてすべて返す（{フィルタキー: エントリ}、全件のエントリを先頭に）
+        """
+        with self._lock:
+            entries = self._entries.get(table_name, {})
+            keys = sorted(entries, key=lambda k: k != ())
+            return {k: dict(entries[k]) for k in keys}
+
+    def put(self, table_name, filter_key, df, version, **meta):
+        """
+        取得結果を格納する（metaには差分同期用の最終更新日時などを保持）
+        取得中に書き込みでバージョンが上がっていた場合は古いデータなので格納しない
+        """
+        with self._lock:
+            if self._versions.get(table_name, 0) != version:
+                return False
+            self._entries.setdefault(table_name, {})[filter_key] = dict(meta, df=df, fetched_at=time.monotonic())
+            return True
+
+    def patch(self, table_name, merge):
+        """
+        書き込み結果をキャッシュ済みの各エントリに反映し、バージョンを上げる（再取得は行わない）
+        merge: (フィルタキー, DataFrame) を受け取り、反映後のDataFrameを返す関数
+        """
+        with self._lock:
+            self._versions[table_name] = self._versions.get(table_name, 0) + 1
+            entries = self._entries.get(table_name, {})
+            for filter_key, entry in list(entries.items()):
+                entries[filter_key] = dict(entry, df=merge(filter_key, entry['df']))
+
+    def derive(self, name, table_names, build):
+        """
+        複数テーブルから作る派生データ（索引など）を、元テーブルのバージョンが変わるまで使い回す
+        build: 派生データを作成する関数（引数なし）
+        """
+        table_names = tuple(table_names)
+        with self._lock:
+            versions = self._current_versions(table_names)
+            cached = self._derived.get(name)
+            if cached and cached[1] == versions and time.monotonic() - cached[2] <= self.ttl:
+                return cached[3]
+        # 作成中は他スレッドを待たせない（作成後にバージョンが変わっていれば次回作り直す）
+        try:
+            value = build()
+        except DoNotCache as e:
+            return e.value
+        with self._lock:
+            self._evict_derived()
+            self._derived[name] = (table_names, versions, time.monotonic(), value)
+        return value
+
+    def _current_versions(self, table_names):
+        return tuple(self._versions.get(t, 0) for t in table_names)
+
+    def _evict_derived(self):
+        """
+        期限切れ・元テーブルが更新済みの派生データを破棄し、上限を超える分は古いものから破棄する
+        """
+        now = time.monotonic()
+        for name, (table_names, versions, created_at, _) in list(self._derived.items()):
+            if now - created_at > self.ttl or self._current_versions(table_names) != versions:
+                del self._derived[name]
+        while len(self._derived) >= self.max_derived:
+            del self._derived[min(self._derived, key=lambda n: self._derived[n][2])]
+
+    def invalidate(self, *table_names):
+        """
+        指定テーブルのバージョンを上げ、そのテーブルのキャッシュ（フィルタ結果を含む）を破棄する
+        """
+        with self._lock:
+            for table_name in table_names:
+                self._versions[table_name] = self._versions.get(table_name, 0) + 1
+                self._entries.pop(table_name, None)
+
+    def clear(self):
+        """
+        全テーブルのキャッシュを破棄する
+        """
+        with self._lock:
+            self.invalidate(*set(self._versions) | set(self._entries))
+            self._derived.clear()
+
+@st.cache_resource
+def get_table_cache():
+    """
+    プロセス内で共有するテーブルキャッシュを返す
+    """
+    return TableCache()
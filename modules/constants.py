@@ -1,16 +1,28 @@
 # 定数・マッピング定義
 
+# カラムの型定義（TYPES_*）で使用する型
+# id: 主キー・外部キー / int: 金額・時間などの整数 / date: 日付 / datetime: 日時
+# bool: 真偽値 / category: マスタ参照の選択肢 / text: 文字列
+
 MAP_PERSONS = {
     'person_id': 'person_id', 'ケース番号': 'case_number', '基本事件番号': 'basic_case_number',
     '氏名': 'name', 'ｼﾒｲ': 'kana', '生年月日': 'dob', '住所': 'address', '居所': 'residence',
     '類型': 'guardianship_type', '障害類型': 'disability_type', '申立人': 'petitioner',
     '審判確定日': 'judgment_date', '管轄家裁': 'court', '家裁報告月': 'report_month', '現在の状態': 'status'
 }
+TYPES_PERSONS = {
+    'person_id': 'id', '生年月日': 'date', '類型': 'category', '審判確定日': 'date', '現在の状態': 'category'
+}
 
 MAP_ACTIVITIES = {
     'activity_id': 'activity_id', 'person_id': 'person_id', '記録日': 'activity_date',
     '活動': 'activity_type', '場所': 'location', '所要時間': 'duration',
-    '交通費・立替金': 'expense', '重要': 'is_important', '要点': 'note', '作成日時': 'created_at'
+    '交通費・立替金': 'expense', '重要': 'is_important', '要点': 'note', '作成日時': 'created_at',
+    '更新日時': 'updated_at'
+}
+TYPES_ACTIVITIES = {
+    'activity_id': 'id', 'person_id': 'id', '記録日': 'date', '活動': 'category',
+    '所要時間': 'int', '交通費・立替金': 'int', '重要': 'bool', '作成日時': 'datetime', '更新日時': 'datetime'
 }
 
 MAP_ASSETS = {
@@ -18,6 +30,9 @@ MAP_ASSETS = {
     '名称・機関名': 'name', '支店・詳細': 'detail', '口座番号・記号': 'account_number',
     '評価額・残高': 'value', '保管場所': 'storage_location', '備考': 'note', '更新日': 'updated_at'
 }
+TYPES_ASSETS = {
+    'asset_id': 'id', 'person_id': 'id', '財産種別': 'category', '評価額・残高': 'int', '更新日': 'datetime'
+}
 
 MAP_RELATED = {
     'related_id': 'related_id', 'person_id': 'person_id', '関係種別': 'relationship',
@@ -25,15 +40,62 @@ MAP_RELATED = {
     '住所': 'address', 'e-mail': 'email', '連携メモ': 'note', '更新日': 'updated_at',
     'キーパーソン': 'is_keyperson'
 }
+TYPES_RELATED = {
+    'related_id': 'id', 'person_id': 'id', '関係種別': 'category', '更新日': 'datetime', 'キーパーソン': 'bool'
+}
 
 MAP_SYSTEM = {
     'id': 'id', '氏名': 'name', 'シメイ': 'kana', '生年月日': 'dob',
     '〒': 'postal_code', '住所': 'address', '連絡先電話番号': 'phone', 'e-mail': 'email'
 }
+TYPES_SYSTEM = {
+    'id': 'id', '生年月日': 'date'
+}
 
 MAP_MASTER = {
     'id': 'id', 'カテゴリ': 'category', '名称': 'name', '順序': 'sort_order'
 }
+TYPES_MASTER = {
+    'id': 'id', 'カテゴリ': 'category', '順序': 'int'
+}
+
+# 小口現金出納帳（sql/petty_cash.sql の petty_cash_ledger の戻り値）
+PETTY_CASH_TYPES = ['入金', '出金']
+MAP_CASH_LEDGER = {
+    'activity_id': 'activity_id', 'person_id': 'person_id', '記録日': 'activity_date', '活動': 'activity_type',
+    '場所': 'location', '交通費・立替金': 'expense', '要点': 'note', '作成日時': 'created_at', '残高': 'balance'
+}
+TYPES_CASH_LEDGER = {
+    'activity_id': 'id', 'person_id': 'id', '記録日': 'date', '活動': 'category',
+    '交通費・立替金': 'int', '作成日時': 'datetime', '残高': 'int'
+}
+
+# テーブル名とマッピングの対応
+TABLE_MAPS = {
+    'persons': MAP_PERSONS, 'activities': MAP_ACTIVITIES, 'assets': MAP_ASSETS,
+    'related_parties': MAP_RELATED, 'app_system_user': MAP_SYSTEM, 'master_options': MAP_MASTER
+}
+
+# テーブルごとのカラム型定義（記載のないカラムは text）
+TABLE_TYPES = {
+    'persons': TYPES_PERSONS, 'activities': TYPES_ACTIVITIES, 'assets': TYPES_ASSETS,
+    'related_parties': TYPES_RELATED, 'app_system_user': TYPES_SYSTEM, 'master_options': TYPES_MASTER
+}
+
+# ID（主キー・外部キー）のカラム（DBカラム名）
+ID_COLUMNS = {'person_id', 'activity_id', 'asset_id', 'related_id', 'id'}
+
+# テーブルごとの主キー（日本語カラム名）
+TABLE_ID_COLUMNS = {
+    'persons': 'person_id', 'activities': 'activity_id', 'assets': 'asset_id',
+    'related_parties': 'related_id', 'app_system_user': 'id', 'master_options': 'id'
+}
+
+# 差分同期に使う更新日時カラム（日本語カラム名）
+# sql/updated_at.sql のトリガーで、登録・更新のたびにサーバー側で設定される
+SYNC_COLUMNS = {
+    'activities': '更新日時', 'assets': '更新日', 'related_parties': '更新日'
+}
 
 # 逆引き用辞書
 R_MAP_PERSONS = {v: k for k, v in MAP_PERSONS.items()}
@@ -84,3 +146,29 @@ COL_BANK_NUMBER = 17      # Q: 口座番号
 COL_BANK_DATE = 21        # U: 最終確認日
 COL_BANK_VALUE = 24       # X: 残高
 COL_BANK_ADMIN = 28       # AB: 管理者
+
+# マスタのカテゴリ -> 選択肢を使用しているテーブルとカラム（DBカラム名）
+MASTER_USAGE = {
+    'activity': ('activities', 'activity_type'),
+    'asset': ('assets', 'asset_type'),
+    'relationship': ('related_parties', 'relationship'),
+    'guardian_type': ('persons', 'guardianship_type'),
+}
+
+# 画面ごとに使用するテーブル（ログイン直後の事前取得用）
+# 活動・財産・関係者は選択中の利用者の分だけを画面で取得するため、全件の事前取得はしない
+PAGE_TABLES = {
+    "利用者情報・活動記録": ['persons', 'master_options'],
+    "関係者・連絡先": ['persons', 'master_options'],
+    "財産管理": ['persons', 'master_options'],
+    "利用者情報登録": ['persons', 'master_options'],
+    "帳票作成": ['persons', 'master_options', 'app_system_user'],
+    "データ管理・移行": ['persons', 'master_options'],
+    "初期設定": ['persons', 'master_options', 'app_system_user'],
+}
+
+# バックアップの復元順（外部キーの順。同じ段のテーブルは並列に登録する）
+RESTORE_WAVES = [
+    ['persons', 'app_system_user', 'master_options'],
+    ['activities', 'assets', 'related_parties'],
+]
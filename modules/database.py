@@ -1,16 +1,57 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client
-from .constants import MAP_MASTER
-from .utils import to_safe_id
 import time
+import codecs
+import threading
+import inspect
+import json
+import logging
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from supabase import create_client, ClientOptions
+from postgrest.types import ReturnMethod
+from .constants import MAP_MASTER, MAP_ACTIVITIES, MAP_CASH_LEDGER, TYPES_CASH_LEDGER, PETTY_CASH_TYPES, TABLE_MAPS, TABLE_TYPES, TABLE_ID_COLUMNS, ID_COLUMNS, SYNC_COLUMNS, MASTER_USAGE
+from .utils import to_int_id, clean_columns, apply_schema
+from .cache import get_table_cache, DoNotCache
+from .replica import ReadReplica, REPLICA_PATH
+from .resilience import CircuitBreaker, call_with_retry, is_transient, is_unreachable
+from .metrics import Span, trace, get_process_metrics
+from .write_queue import WriteQueue, WRITE_BATCH_DELAY
+from .journal import WriteJournal, JOURNAL_PATH, JOURNAL_TEMP_ID_BASE
+
+logger = logging.getLogger(__name__)
 
 # --- Supabase接続設定 ---
+# HTTP接続プールの設定（同時取得数に合わせてKeep-Alive接続を使い回す）
+HTTP_TIMEOUT = 20
+HTTP_MAX_CONNECTIONS = 20
+HTTP_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 60
+
+def _client_options():
+    """
+    接続プールとタイムアウトを設定したクライアントオプションを返す
+    httpxクライアントを指定できないsupabaseのバージョンではタイムアウトのみ設定する
+    """
+    params = inspect.signature(ClientOptions).parameters
+    options = {'postgrest_client_timeout': HTTP_TIMEOUT} if 'postgrest_client_timeout' in params else {}
+    if 'httpx_client' in params:
+        import httpx
+        options['httpx_client'] = httpx.Client(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+        )
+    return ClientOptions(**options)
+
 def get_supabase_client():
     try:
         url = st.secrets["supabase"]["url"]
         key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
+        return create_client(url, key, options=_client_options())
     except KeyError:
         st.error("【設定エラー】Secretsが見つかりません。.streamlit/secrets.toml を確認してください。")
         st.stop()
@@ -22,22 +63,612 @@ def init_supabase():
     """
     return get_supabase_client()
 
-@st.cache_data(ttl=600)
-def fetch_table(table_name, mapping_dict):
+# --- ローカル読み取りレプリカ ---
+# secrets.toml の [replica] enabled = true で有効化（path, sync_interval は任意）
+REPLICA_SYNC_INTERVAL = 300
+
+def get_replica():
     """
-    指定されたテーブルからデータを取得し、DataFrameとして返す
+    ローカル読み取りレプリカを返す（有効化されていない場合はNone）
+    """
+    try:
+        conf = st.secrets.get("replica", {})
+    except Exception:
+        return None
+    if not conf.get("enabled"): return None
+    return _open_replica(conf.get("path", REPLICA_PATH), conf.get("sync_interval", REPLICA_SYNC_INTERVAL))
+
+@st.cache_resource
+def _open_replica(path, sync_interval):
     """
+    レプリカを開き、Supabaseからの同期スレッドを起動する（プロセスで1つ）
+    """
+    replica = ReadReplica(path)
     client = init_supabase()
+    thread = threading.Thread(target=_replica_sync_loop, args=(replica, client, sync_interval, get_process_metrics()), daemon=True)
+    thread.start()
+    return replica
+
+def _replica_sync_loop(replica, client, sync_interval, registry):
+    while True:
+        for table_name in TABLE_MAPS:
+            try:
+                # 同期スレッドにはセッションがないため、プロセス全体の計測にのみ記録する
+                with Span([registry], table_name, 'replica_sync') as span:
+                    span.rows = sync_replica_table(replica, client, table_name)
+            except Exception as e:
+                # Supabaseに接続できない間は、最後に同期した内容のまま読み取りを継続する
+                logger.warning("レプリカ同期エラー (%s): %s", table_name, e)
+        replica.wait_for_sync_request(sync_interval)
+
+def sync_replica_table(replica, client, table_name):
+    """
+    Supabaseのテーブルをレプリカへ同期し、取得した行数を返す
+    更新日時を持つテーブルは前回の同期以降に登録・更新された行のみ取得し、RECONCILE_INTERVALごとに全件を置き換える
+    """
+    mapping_dict = TABLE_MAPS[table_name]
+    id_col_en = mapping_dict[TABLE_ID_COLUMNS[table_name]]
+    sync_col_en = mapping_dict.get(SYNC_COLUMNS.get(table_name))
+    watermark = replica.watermark(table_name) if sync_col_en and replica.is_ready(table_name) else None
+    if watermark and time.time() - replica.reconciled_at(table_name) <= RECONCILE_INTERVAL:
+        delta_key = ((sync_col_en, 'gte', _delta_since(watermark)),)
+        fetched = 0
+        for rows, _ in iter_pages(client, table_name, delta_key, order_col=id_col_en):
+            replica.upsert_rows(table_name, rows)
+            watermark = _latest_timestamp(rows, sync_col_en, watermark)
+            fetched += len(rows)
+        replica.mark_synced(table_name, watermark)
+        return fetched
+    latest = [None]
+    fetched = [0]
+    def pages():
+        for rows, _ in iter_pages(client, table_name, order_col=id_col_en):
+            if sync_col_en: latest[0] = _latest_timestamp(rows, sync_col_en, latest[0])
+            fetched[0] += len(rows)
+            yield rows
+    replica.replace_all(table_name, pages())
+    replica.mark_synced(table_name, latest[0], full=True)
+    return fetched[0]
+
+def _latest_timestamp(rows, col_en, current=None):
+    """
+    取得した行の日時カラムの最大値を返す（ISO形式の文字列のまま。行に値がなければcurrent）
+    """
+    values = [r[col_en] for r in rows if r.get(col_en)]
+    if current: values.append(current)
+    return max(values, key=pd.Timestamp) if values else current
+
+# --- 書き込みキュー（write-behind） ---
+# secrets.toml の [write_queue] enabled = true で有効化（batch_delay は任意）
+
+def get_write_queue():
+    """
+    書き込みキューを返す（有効化されていない場合はNone）
+    """
     try:
-        response = client.table(table_name).select("*").execute()
-        data = response.data
-    except Exception as e:
-        # エラー発生時はユーザーに通知しないと原因不明になるため表示（本番ではログへ）
-        st.error(f"データ取得エラー ({table_name}): {e}")
-        return pd.DataFrame(columns=mapping_dict.keys())
-    
+        conf = st.secrets.get("write_queue", {})
+    except Exception:
+        return None
+    if not conf.get("enabled"): return None
+    return _open_write_queue(conf.get("batch_delay", WRITE_BATCH_DELAY))
+
+@st.cache_resource
+def _open_write_queue(batch_delay):
+    return WriteQueue(init_supabase(), batch_delay=batch_delay, registry=get_process_metrics())
+
+def _cached_row(table_name, mapping_dict, id_col_jp, target_id):
+    """
+    キャッシュ済みのデータ（全件、なければ利用者ごと等の絞り込み結果）から1行をDBカラム名のdictで返す
+    見つからない場合はNone
+    """
+    for entry in get_table_cache().entries(table_name).values():
+        rows = entry['df'][entry['df'][id_col_jp] == target_id]
+        if not rows.empty:
+            return {mapping_dict[jp]: _to_db_value(val) for jp, val in rows.iloc[0].items() if jp in mapping_dict}
+    return None
+
+def _apply_optimistic(table_name, kind, mapping_dict, id_col_jp, target_id, db_data=None):
+    """
+    送信前の書き込みをキャッシュへ反映する（登録の場合、target_idは仮ID）
+    """
+    id_col_en = mapping_dict[id_col_jp]
+    if kind == 'insert':
+        _write_through(table_name, mapping_dict, id_col_jp, rows=[dict(db_data, **{id_col_en: target_id})])
+    elif kind == 'update':
+        current = _cached_row(table_name, mapping_dict, id_col_jp, target_id)
+        if current is not None:
+            _write_through(table_name, mapping_dict, id_col_jp, rows=[dict(current, **db_data)])
+    else:
+        _write_through(table_name, mapping_dict, id_col_jp, deleted_ids=[target_id])
+
+def _enqueue_write(queue, table_name, kind, mapping_dict, id_col_jp, target_id=None, db_data=None):
+    """
+    書き込みをキューに入れ、送信を待たずにキャッシュへ反映する（楽観的更新）
+    """
+    id_col_en = mapping_dict[id_col_jp]
+    if kind == 'insert':
+        target_id = queue.new_temp_id()
+    _apply_optimistic(table_name, kind, mapping_dict, id_col_jp, target_id, db_data)
+    op_id = queue.submit(table_name, kind, id_col_en, target_id, db_data, owner=_session_owner())
+    st.session_state.setdefault('write_ops', [])
+    if op_id not in st.session_state.write_ops:
+        st.session_state.write_ops.append(op_id)
+    return op_id
+
+def apply_write_results():
+    """
+    送信が終わった書き込みをキャッシュへ反映する（画面描画の最初に呼ぶ）
+    成功した登録は仮IDの行を実際の行に置き換え、失敗した書き込みはテーブルを再取得して楽観的更新を取り消す
+    接続できずに失敗した書き込みは、同じ行への送信待ちの書き込みと一緒にジャーナルへ移す
+    """
+    queue = get_write_queue()
+    if queue is None: return
+    for op in queue.drain_results():
+        table_name = op['table']
+        mapping_dict = TABLE_MAPS[table_name]
+        id_col_jp = TABLE_ID_COLUMNS[table_name]
+        if op['status'] == 'failed' and op['transient']:
+            _move_to_journal(queue, queue.take_held(op['op_id']))
+        elif op['status'] != 'done' or (op['kind'] != 'delete' and op['row'] is None):
+            _invalidate(table_name)
+        elif op['kind'] == 'insert':
+            _write_through(table_name, mapping_dict, id_col_jp, rows=[op['row']], deleted_ids=[op['target_id']])
+        elif op['kind'] == 'update':
+            _write_through(table_name, mapping_dict, id_col_jp, rows=[op['row']])
+
+def _move_to_journal(queue, ops):
+    """
+    書き込みキューから取り出した書き込みを受け付け順にジャーナルへ保存する
+    キューの仮IDはジャーナルの仮IDに付け替える（キャッシュの行も付け替える）
+    """
+    journal = get_journal()
+    temp_ids = {}
+    for op in ops:
+        table_name, kind = op['table'], op['kind']
+        mapping_dict = TABLE_MAPS[table_name]
+        id_col_jp = TABLE_ID_COLUMNS[table_name]
+        target = queue.resolve_id(op['target_id'])
+        target = temp_ids.get(target, target)
+        _, temp_id = journal.append(table_name, kind, op['id_col'], None if kind == 'insert' else target, op['data'],
+                                    kind == 'insert' and op['attempted'], owner=op['owner'])
+        if kind == 'insert':
+            temp_ids[op['target_id']] = temp_id
+            current = _cached_row(table_name, mapping_dict, id_col_jp, op['target_id'])
+            _write_through(table_name, mapping_dict, id_col_jp, rows=[dict(current or op['data'], **{op['id_col']: temp_id})],
+                           deleted_ids=[op['target_id']])
+    if ops:
+        logger.info("送信できなかった %d 件の書き込みを一時保存しました (%s)", len(ops), ops[0]['table'])
+
+def _is_queue_temp_id(target_id):
+    """
+    書き込みキューの仮ID（キューで登録を送信待ちの行）か（ジャーナルの仮IDはより小さい値）
+    """
+    return target_id is not None and JOURNAL_TEMP_ID_BASE < target_id < 0
+
+def get_write_status():
+    """
+    このセッションで受け付けた書き込みのうち、未完了・失敗のものを返す
+    """
+    queue = get_write_queue()
+    if queue is None: return []
+    ops = queue.status(st.session_state.get('write_ops', []))
+    # 完了した書き込みは一覧から外す
+    st.session_state.write_ops = [op['op_id'] for op in ops if op['status'] in ('pending', 'sending', 'failed')]
+    return [op for op in ops if op['status'] in ('pending', 'sending', 'failed')]
+
+def retry_write(op_id):
+    queue = get_write_queue()
+    if queue is not None: queue.retry(op_id)
+
+def discard_write(op_id):
+    """
+    失敗した書き込みを破棄する（キャッシュは取得し直して元に戻す）
+    """
+    queue = get_write_queue()
+    if queue is None: return
+    for op in queue.status([op_id]):
+        _invalidate(op['table'])
+    queue.forget(op_id)
+    st.session_state.write_ops = [i for i in st.session_state.get('write_ops', []) if i != op_id]
+
+# --- 未送信の書き込みの保存（オフライン対策） ---
+# 接続できずに送信できなかった書き込みはサーバー上のファイルに保存し、接続回復後に受け付け順に再送する
+JOURNAL_REPLAY_INTERVAL = 30
+
+@st.cache_resource
+def get_journal():
+    """
+    書き込みジャーナルを返す（secrets.toml の [journal] path で保存先を変更可能）
+    """
+    try:
+        path = st.secrets.get("journal", {}).get("path", JOURNAL_PATH)
+    except Exception:
+        path = JOURNAL_PATH
+    return WriteJournal(path)
+
+def _session_owner():
+    """
+    書き込んだセッションの識別子（保存した書き込みの表示・破棄をそのセッションに限るため）
+    """
+    if 'session_owner' not in st.session_state:
+        st.session_state.session_owner = uuid.uuid4().hex
+    return st.session_state.session_owner
+
+def _journal_write(table_name, kind, mapping_dict, id_col_jp, target_id=None, db_data=None, attempted=False):
+    """
+    書き込みをジャーナルに保存し、キャッシュへ反映する（入力内容を失わないように）
+    """
+    seq, temp_id = get_journal().append(table_name, kind, mapping_dict[id_col_jp], target_id, db_data, attempted,
+                                        owner=_session_owner())
+    _apply_optimistic(table_name, kind, mapping_dict, id_col_jp, temp_id if kind == 'insert' else target_id, db_data)
+    st.warning("サーバーに接続できないため、入力内容を一時保存しました。接続が回復すると自動で送信します。")
+    return True
+
+def _should_journal():
+    """
+    送信を試みずにジャーナルへ保存すべきか（未送信の記録がある間は順序を守るため、その後ろに追加する）
+    """
+    return READ_BREAKER.state == 'open' or get_journal().count_pending() > 0
+
+def replay_journal(force=False):
+    """
+    保存した書き込みを受け付け順に再送する（画面描画の最初に呼ぶ）
+    接続できない間は途中で止め、次回その続きから再送する。送信した件数を返す
+    """
+    journal = get_journal()
+    if not force and time.monotonic() - getattr(journal, 'last_replay', 0) < JOURNAL_REPLAY_INTERVAL:
+        return 0
+    if not force and READ_BREAKER.state == 'open': return 0
+    journal.last_replay = time.monotonic()
+    entries = journal.pending()
+    if not entries: return 0
+    client = init_supabase()
+    sent = 0
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        table_name, kind, id_col_en = entry['table_name'], entry['kind'], entry['id_col']
+        mapping_dict = TABLE_MAPS[table_name]
+        id_col_jp = TABLE_ID_COLUMNS[table_name]
+        # 送信を試みていない連続する登録は1回のリクエストにまとめる
+        batch = [entry]
+        if kind == 'insert' and not entry['attempted']:
+            while (i + len(batch) < len(entries) and entries[i + len(batch)]['table_name'] == table_name
+                   and entries[i + len(batch)]['kind'] == 'insert' and not entries[i + len(batch)]['attempted']
+                   and set(entries[i + len(batch)]['data']) == set(entry['data'])):
+                batch.append(entries[i + len(batch)])
+        i += len(batch)
+        if kind == 'insert' and entry['attempted']:
+            # サーバーに届いた可能性があり、同じ内容の行があっても別の入力（同日・同額の出金等）かもしれないため
+            # 自動では再送せず、利用者に確認してもらう
+            journal.mark_failed(entry['seq'], "送信済みか確認できませんでした。登録されていないことを確認して再送してください")
+            continue
+        try:
+            target = journal.resolve(entry['target_id'])
+            if kind != 'insert' and target is None:
+                if journal.insert_status(entry['target_id']) in ('pending', 'failed'):
+                    # 先行する登録の確認待ち（再送・破棄されるまで送らない）
+                    continue
+                # 先行する登録が破棄された行への書き込み
+                journal.mark_failed(entry['seq'], "対象の行が登録されていません")
+                continue
+            with trace(table_name, f"replay_{kind}") as span:
+                if kind == 'insert':
+                    for e in batch: journal.mark_attempted(e['seq'])
+                    rows = client.table(table_name).insert([e['data'] for e in batch], returning=ReturnMethod.representation).execute().data or []
+                    for e, row in zip(batch, rows):
+                        journal.mark_done(e['seq'], row.get(id_col_en))
+                        _write_through(table_name, mapping_dict, id_col_jp, rows=[row], deleted_ids=[journal.temp_id(e['seq'])])
+                elif kind == 'update':
+                    rows = client.table(table_name).update(entry['data'], returning=ReturnMethod.representation).eq(id_col_en, target).execute().data
+                    journal.mark_done(entry['seq'], target)
+                    _reflect_write(table_name, mapping_dict, rows, id_col_jp)
+                else:
+                    client.table(table_name).delete(returning=ReturnMethod.minimal).eq(id_col_en, target).execute()
+                    journal.mark_done(entry['seq'], target)
+                    _write_through(table_name, mapping_dict, id_col_jp, deleted_ids=[target])
+                span.rows = len(batch)
+            sent += len(batch)
+        except Exception as e:
+            if kind == 'insert' and is_unreachable(e):
+                # サーバーに届いていないことが確実なため、次回そのまま再送する
+                for b in batch: journal.mark_attempted(b['seq'], False)
+            if is_transient(e):
+                # まだ接続できない（以降の書き込みも順序を守るため送らない）
+                logger.info("再送を中断しました (%s): %s", table_name, e)
+                break
+            for b in batch: journal.mark_failed(b['seq'], e)
+            _invalidate(table_name)
+    if sent:
+        st.toast(f"保存していた {sent} 件の書き込みを送信しました", icon="📤")
+    return sent
+
+def get_journal_status():
+    """
+    このセッションで保存した書き込みのうち、未送信の件数と再送に失敗した書き込みを返す
+    """
+    journal = get_journal()
+    owner = _session_owner()
+    return journal.count_pending(owner=owner), journal.failed(owner=owner)
+
+def retry_journal_entry(seq):
+    """
+    再送に失敗した書き込みを未送信に戻し、すぐに再送する
+    """
+    get_journal().requeue(seq, owner=_session_owner())
+    replay_journal(force=True)
+
+def discard_journal_entry(seq, table_name):
+    """
+    再送に失敗した書き込みを破棄する（キャッシュは取得し直して元に戻す）
+    """
+    get_journal().discard(seq, owner=_session_owner())
+    _invalidate(table_name)
+
+# フィルタで使用できる演算子（PostgRESTのメソッド名に対応）
+FILTER_OPS = {'eq': 'eq', 'neq': 'neq', 'gt': 'gt', 'gte': 'gte', 'lt': 'lt', 'lte': 'lte', 'in': 'in_'}
+
+def normalize_filters(filters, mapping_dict):
+    """
+    フィルタ指定を (DBカラム名, 演算子, 値) のタプルに正規化する（キャッシュキーとしても使用）
+    例: {'person_id': 12, '記録日': [('gte', '2025-01-01'), ('lte', '2025-12-31')], '活動': ('in', ['入金', '出金'])}
+    """
+    if not filters: return ()
+    normalized = []
+    for col_jp, cond in filters.items():
+        col_en = mapping_dict.get(col_jp, col_jp)
+        if isinstance(cond, tuple) and len(cond) == 2 and cond[0] in FILTER_OPS:
+            conds = [cond]
+        elif isinstance(cond, list) and cond and all(isinstance(c, tuple) and len(c) == 2 and c[0] in FILTER_OPS for c in cond):
+            conds = cond
+        else:
+            conds = [('eq', cond)]
+        for op, val in conds:
+            # IDは整数に揃える（"12" と 12 で別のキャッシュにならないように）
+            if col_en in ID_COLUMNS:
+                val = tuple(to_int_id(v) for v in val) if op == 'in' else to_int_id(val)
+            elif op == 'in':
+                val = tuple(val)
+            normalized.append((col_en, op, val))
+    return tuple(sorted(normalized, key=lambda f: (f[0], f[1])))
+
+def _apply_filters(query, filter_key):
+    """
+    正規化済みフィルタをSupabaseのクエリに適用する
+    """
+    for col_en, op, val in filter_key:
+        if op == 'in':
+            query = query.in_(col_en, list(val))
+        else:
+            query = getattr(query, FILTER_OPS[op])(col_en, val)
+    return query
+
+def fetch_table(table_name, mapping_dict, filters=None):
+    """
+    指定されたテーブルからデータを取得し、DataFrameとして返す
+    filtersを指定した場合はSupabase側で絞り込み、フィルタ条件ごとにキャッシュする
+    """
+    filter_key = normalize_filters(filters, mapping_dict)
+    with trace(table_name, 'fetch', filter_key) as span:
+        df = _fetch_frame(table_name, mapping_dict, filter_key, span)
+        span.rows = len(df)
+        return df
+
+def _fetch_frame(table_name, mapping_dict, filter_key, span):
+    replica = get_replica()
+    if replica is not None and replica.is_ready(table_name):
+        # レプリカが有効な場合はローカルのSQLiteをインデックス付きで検索する
+        span.source = 'replica'
+        id_col_jp = TABLE_ID_COLUMNS.get(table_name)
+        order_col = mapping_dict.get(id_col_jp) if id_col_jp else None
+        return _to_frame(replica.query(table_name, filter_key, order_col), mapping_dict, TABLE_TYPES.get(table_name, {}))
+
+    cache = get_table_cache()
+    df = cache.get(table_name, filter_key)
+    if df is None:
+        try:
+            df = _fill_cache(init_supabase(), cache, table_name, mapping_dict, filter_key)
+            span.bytes = int(df.memory_usage(index=False).sum())
+        except Exception as e:
+            span.error = repr(e)
+            entry = cache.entry(table_name, filter_key)
+            if entry is not None:
+                # 取得できない間は最後に取得できたデータを表示する（空の一覧で誤解させない）
+                span.source = 'stale'
+                fetched = time.strftime('%H:%M', time.localtime(time.time() - (time.monotonic() - entry['fetched_at'])))
+                st.warning(f"サーバーに接続できないため、{fetched} 時点のデータを表示しています ({table_name})")
+                df = entry['df'].copy()
+                df.attrs['stale'] = True
+                return df
+            # エラー発生時はユーザーに通知しないと原因不明になるため表示（本番ではログへ）
+            st.error(f"データ取得エラー ({table_name}): {e}")
+            df = pd.DataFrame(columns=mapping_dict.keys())
+            df.attrs['error'] = True
+            return df
+    else:
+        span.source = 'cache'
+    # 呼び出し側での列追加等がキャッシュに影響しないようコピーを返す
+    return df.copy()
+
+def is_degraded(df):
+    """
+    fetch_tableの結果が取得エラー時の空データ、または接続できない間の古いデータか
+    （このようなデータから作った集計・索引は保持しない）
+    """
+    return bool(df.attrs.get('error') or df.attrs.get('stale'))
+
+def _fill_cache(client, cache, table_name, mapping_dict, filter_key=()):
+    """
+    テーブルを取得してキャッシュに格納し、DataFrameを返す（Streamlitの機能は使わないため別スレッドからも呼べる）
+    """
+    version = cache.version(table_name)
+    entry = cache.entry(table_name, filter_key)
+    if entry is not None and entry.get('watermark'):
+        # 期限切れのキャッシュがあれば差分のみ取得してマージ
+        df, meta = _sync_delta(client, table_name, mapping_dict, filter_key, entry)
+    else:
+        df = _load_table(client, table_name, mapping_dict, filter_key)
+        meta = _sync_meta(table_name, df)
+    cache.put(table_name, filter_key, df, version, **meta)
+    return df
+
+def _warm_table(span, client, cache, table_name):
+    with span:
+        df = _fill_cache(client, cache, table_name, TABLE_MAPS[table_name])
+        span.rows = len(df)
+        span.bytes = int(df.memory_usage(index=False).sum())
+    return df
+
+def warm_up(table_names):
+    """
+    画面で使うテーブルを並列に取得してキャッシュを温める（ログイン直後の初回表示用）
+    取得に失敗したテーブルは、通常のfetch_tableで改めて取得・エラー表示する
+    """
+    cache = get_table_cache()
+    replica = get_replica()
+    targets = [t for t in table_names
+               if cache.get(t) is None and not (replica is not None and replica.is_ready(t))]
+    if not targets: return
+    # st.cache_resource等はスレッド内で呼ばないよう、クライアントはここで取得して渡す
+    client = init_supabase()
+    # 計測のSpanもセッションを参照するため、ここで作ってスレッドに渡す
+    spans = {t: trace(t, 'warm_up') for t in targets}
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        futures = {t: pool.submit(_warm_table, spans[t], client, cache, t) for t in targets}
+    for table_name, future in futures.items():
+        if future.exception() is not None:
+            logger.warning("事前取得エラー (%s): %s", table_name, future.exception())
+
+# 読み取りのサーキットブレーカー（プロセス内で共有）
+READ_BREAKER = CircuitBreaker()
+
+# ページ取得の設定（PostgRESTの上限行数に合わせる）
+PAGE_SIZE = 1000
+FETCH_WORKERS = 4
+
+def iter_pages(client, table_name, filter_key=(), order_col=None, columns="*", page_size=PAGE_SIZE, workers=FETCH_WORKERS):
+    """
+    テーブルをページ単位で取得し、(ページの行リスト, 総件数) を順に返すジェネレータ（総件数が不明な場合はNone）
+    1ページ目で総件数(count='exact')を取得し、残りのページは先読み数をworkersに抑えて並列取得する
+    サーバーの上限行数（max-rows）がpage_sizeより小さい場合は、1ページ目の行数をページの大きさとする
+    """
+    def fetch(start, size, count=None):
+        query = client.table(table_name).select(columns, count=count) if count else client.table(table_name).select(columns)
+        query = _apply_filters(query, filter_key)
+        if order_col: query = query.order(order_col)
+        return call_with_retry(query.range(start, start + size - 1).execute, breaker=READ_BREAKER)
+
+    first = fetch(0, page_size, count='exact')
+    total = first.count
+    yield first.data, total
+    if not first.data: return
+    # 要求より少ない行数で打ち切られた場合は、サーバーの上限行数に合わせて取得する
+    step = min(page_size, len(first.data))
+
+    if total is None:
+        # 総件数が取得できない場合は、空のページが返るまで順に取得
+        start = step
+        while True:
+            rows = fetch(start, step).data
+            if not rows: return
+            yield rows, None
+            start += len(rows)
+
+    starts = iter(range(step, total, step))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(fetch, start, step) for start in islice(starts, workers))
+        while pending:
+            res = pending.popleft().result()
+            nxt = next(starts, None)
+            if nxt is not None:
+                pending.append(executor.submit(fetch, nxt, step))
+            yield res.data, total
+
+def _load_table(client, table_name, mapping_dict, filter_key=()):
+    """
+    Supabaseから全ページを取得してDataFrameに変換する（エラーは呼び出し元へ送出）
+    ページはカラムごとのリストへ追記して破棄し、DataFrameは最後に一度だけ構築する
+    """
+    id_col_jp = TABLE_ID_COLUMNS.get(table_name)
+    order_col = mapping_dict.get(id_col_jp) if id_col_jp else None
+    columns = {}
+    total = 0
+    for rows, total in iter_pages(client, table_name, filter_key, order_col):
+        if not rows: continue
+        for key in rows[0].keys():
+            columns.setdefault(key, []).extend(r.get(key) for r in rows)
+    df = _to_frame(columns, mapping_dict, TABLE_TYPES.get(table_name, {}))
+    df.attrs['total_count'] = total if total is not None else len(df)
+    return df
+
+# 全件を取得し直して、削除・取りこぼしを反映する間隔（秒）
+RECONCILE_INTERVAL = 3600
+# 差分取得で前回の最終更新日時より遡る秒数（更新日時より後にコミットされた行を取りこぼさないように）
+SYNC_OVERLAP = 60
+
+def _watermark_of(df, col_jp):
+    """
+    差分同期の基準となる最終更新日時（カラムの最大値）を返す
+    """
+    if df.empty or col_jp not in df.columns: return None
+    val = df[col_jp].dropna().max()
+    if pd.isna(val): return None
+    return val.isoformat() if hasattr(val, 'isoformat') else str(val)
+
+def _delta_since(watermark):
+    """
+    差分取得の開始日時（最終更新日時からSYNC_OVERLAP秒遡る）を返す
+    """
+    return (pd.Timestamp(watermark) - pd.Timedelta(seconds=SYNC_OVERLAP)).isoformat()
+
+def _sync_meta(table_name, df, reconciled_at=None):
+    """
+    差分同期用の付加情報（最終更新日時・前回の全件取得時刻）を作成する
+    更新日時カラムがない（sql/updated_at.sql が未実行の）場合は差分同期せず、期限切れごとに全件取得する
+    """
+    if table_name not in SYNC_COLUMNS: return {}
+    return {
+        'watermark': _watermark_of(df, SYNC_COLUMNS[table_name]),
+        'reconciled_at': reconciled_at if reconciled_at is not None else time.monotonic()
+    }
+
+def _fetch_ids(client, table_name, mapping_dict, filter_key=()):
+    """
+    主キーのみを全件取得する（削除の照合用）
+    """
+    id_col_en = mapping_dict[TABLE_ID_COLUMNS[table_name]]
+    ids = set()
+    for rows, _ in iter_pages(client, table_name, filter_key, order_col=id_col_en, columns=id_col_en):
+        ids.update(to_int_id(r.get(id_col_en)) for r in rows)
+    return ids
+
+def _sync_delta(client, table_name, mapping_dict, filter_key, entry):
+    """
+    前回の最終更新日時以降に追加・更新された行のみ取得し、主キーでキャッシュ済みのDataFrameにマージする
+    削除は差分に現れないため、RECONCILE_INTERVALごとに全件を取得し直す
+    """
+    if time.monotonic() - entry.get('reconciled_at', 0) > RECONCILE_INTERVAL:
+        df = _load_table(client, table_name, mapping_dict, filter_key)
+        return df, _sync_meta(table_name, df)
+
+    id_col_jp = TABLE_ID_COLUMNS[table_name]
+    sync_col_jp = SYNC_COLUMNS[table_name]
+    # 少し遡って gte で取得し、重複は主キーで吸収する
+    delta_key = filter_key + ((mapping_dict[sync_col_jp], 'gte', _delta_since(entry['watermark'])),)
+    delta = _load_table(client, table_name, mapping_dict, delta_key)
+    df = _merge_rows(entry['df'], delta, id_col_jp)
+
+    meta = _sync_meta(table_name, df, entry.get('reconciled_at'))
+    meta['watermark'] = max(filter(None, [meta['watermark'], entry['watermark']]))
+    return df, meta
+
+def _to_frame(data, mapping_dict, column_types=None):
+    """
+    APIレスポンス（dictのリスト、またはカラムごとのリスト）を日本語カラム名のDataFrameに変換する
+    column_typesを指定した場合は型定義を適用する（画面ごとの型変換を不要にするため）
+    """
     if not data:
-        return pd.DataFrame(columns=mapping_dict.keys())
+        return apply_schema(pd.DataFrame(columns=mapping_dict.keys()), column_types or {})
     
     df = pd.DataFrame(data)
     reverse_map = {v: k for k, v in mapping_dict.items()}
@@ -47,70 +678,437 @@ def fetch_table(table_name, mapping_dict):
         if col not in df.columns:
             df[col] = None
     
-    id_cols = ['person_id', 'activity_id', 'asset_id', 'related_id', 'id']
-    for col in id_cols:
-        if col in df.columns:
-            df[col] = df[col].apply(to_safe_id)
-            
-    return df
+    return apply_schema(df, column_types) if column_types is not None else df
+
+def _record_matches(record, filter_key):
+    """
+    書き込み結果の行（DBカラム名のdict）がフィルタ条件を満たすか判定する
+    """
+    for col_en, op, val in filter_key:
+        cell = record.get(col_en)
+        if op == 'in':
+            if not any(_compare(cell, v, 'eq') for v in val): return False
+        elif not _compare(cell, val, op):
+            return False
+    return True
 
-def get_master_list(category):
+def _compare(a, b, op):
     """
-    マスタデータから選択肢リストを取得する
+    フィルタ値との比較（ID等の数値と文字列の違いを吸収する）
     """
+    if a is None or b is None:
+        if op == 'eq': return a is None and b is None
+        if op == 'neq': return (a is None) != (b is None)
+        return False
     try:
-        df_master = fetch_table("master_options", MAP_MASTER)
-        if df_master.empty: return []
-        filtered = df_master[df_master['カテゴリ'] == category].copy()
-        if filtered.empty: return []
-        if '順序' in filtered.columns:
-            filtered['順序'] = pd.to_numeric(filtered['順序'], errors='coerce')
-            filtered = filtered.sort_values('順序')
-        return filtered['名称'].tolist()
-    except Exception:
-        return []
+        a, b = float(a), float(b)
+    except (TypeError, ValueError):
+        a, b = str(a), str(b)
+    if op == 'eq': return a == b
+    if op == 'neq': return a != b
+    if op == 'gt': return a > b
+    if op == 'gte': return a >= b
+    if op == 'lt': return a < b
+    if op == 'lte': return a <= b
+    return False
+
+def _reflect_write(table_name, mapping_dict, rows, id_col_jp=None):
+    """
+    書き込みAPIの戻り値をキャッシュへ反映する
+    行が返らなかった場合（RLS等）は、そのテーブルのキャッシュのみ破棄して次回再取得する
+    """
+    id_col_jp = id_col_jp or TABLE_ID_COLUMNS.get(table_name)
+    if rows and id_col_jp:
+        _write_through(table_name, mapping_dict, id_col_jp, rows=rows)
+    else:
+        _invalidate(table_name)
+
+def _invalidate(table_name):
+    """
+    テーブルのキャッシュを破棄し、レプリカには再同期を依頼する
+    """
+    get_table_cache().invalidate(table_name)
+    replica = get_replica()
+    if replica is not None:
+        replica.request_sync()
+
+def _write_through(table_name, mapping_dict, id_col_jp, rows=(), deleted_ids=()):
+    """
+    書き込み結果（returning=representation で返された行）をキャッシュに直接反映する
+    再取得を行わずに、書き込んだ内容をそのまま次回の表示に使う（read-your-writes）
+    """
+    rows = list(rows)
+    changed = _to_frame(rows, mapping_dict, TABLE_TYPES.get(table_name, {}))
+    removed = {to_int_id(i) for i in deleted_ids}
+
+    def merge(filter_key, df):
+        mask = [_record_matches(r, filter_key) for r in rows]
+        matched = changed[mask] if rows else changed
+        # 削除された行と、更新によりフィルタ条件から外れた行を除外
+        drop = removed | set(changed.loc[[not m for m in mask], id_col_jp]) if rows else removed
+        return _merge_rows(df, matched, id_col_jp, drop)
+
+    get_table_cache().patch(table_name, merge)
+
+    replica = get_replica()
+    if replica is not None:
+        id_col_en = mapping_dict[id_col_jp]
+        if rows: replica.upsert_rows(table_name, rows)
+        if deleted_ids: replica.delete_ids(table_name, id_col_en, deleted_ids)
+
+def _merge_rows(df, changed, id_col_jp, drop_ids=()):
+    """
+    主キーでDataFrameに行をマージする（drop_idsの行は除外）
+    既存行は表示順を保ったまま値を差し替え、新規行は末尾に追加する
+    型付きの列へ値を代入するとcategory等で失敗するため、結合と並べ替えで組み立てる
+    """
+    df = df[~df[id_col_jp].isin(set(drop_ids))]
+    if changed.empty: return df.reset_index(drop=True)
+    if df.empty: return changed.reset_index(drop=True)
+    changed = changed.drop_duplicates(id_col_jp, keep='last')
+    known_ids = set(df[id_col_jp])
+    order = list(df[id_col_jp]) + [i for i in changed[id_col_jp] if i not in known_ids]
+    columns = list(df.columns) + [c for c in changed.columns if c not in df.columns]
+    df, changed = _align_categories(df, changed)
+    merged = pd.concat([df[~df[id_col_jp].isin(changed[id_col_jp])], changed], ignore_index=True)
+    return merged.set_index(id_col_jp).reindex(order).reset_index()[columns]
+
+def _align_categories(df, other):
+    """
+    category型の列のカテゴリを揃える（結合時にobject型へ戻らないようにする）
+    """
+    df, other = df.copy(), other.copy()
+    for col in df.columns:
+        if col in other.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = other[col].cat.categories if isinstance(other[col].dtype, pd.CategoricalDtype) else other[col].dropna().unique()
+            dtype = pd.CategoricalDtype(df[col].cat.categories.union(pd.Index(values)))
+            df[col] = df[col].astype(dtype)
+            other[col] = other[col].astype(dtype)
+    return df, other
+
+class MasterOptions:
+    """
+    マスタデータ（選択肢）をカテゴリごとに整理したもの
+    names: カテゴリ -> 順序どおりの名称リスト、ids / orders: カテゴリ -> {名称: ID / 順序}
+    """
+    def __init__(self, df_master):
+        self.names, self.ids, self.orders = {}, {}, {}
+        if df_master.empty: return
+        # 順序は取得時にInt64へ変換済み（未設定は末尾）
+        df_master = df_master.sort_values(['カテゴリ', '順序'], kind='stable', na_position='last')
+        for category, name, option_id, order in zip(df_master['カテゴリ'], df_master['名称'], df_master['id'], df_master['順序']):
+            if pd.isna(category) or pd.isna(option_id): continue
+            self.names.setdefault(category, []).append(name)
+            self.ids.setdefault(category, {})[name] = int(option_id)
+            self.orders.setdefault(category, {})[name] = None if pd.isna(order) else int(order)
+
+def _build_master_options():
+    df_master = fetch_table("master_options", MAP_MASTER)
+    master = MasterOptions(df_master)
+    if is_degraded(df_master):
+        # 取得エラー時の空の選択肢・古い選択肢は保持しない（接続が回復したら次の表示で作り直す）
+        raise DoNotCache(master)
+    return master
+
+def get_master_options():
+    """
+    マスタデータを返す（master_optionsのキャッシュのバージョンが変わった時だけ作り直す）
+    """
+    return get_table_cache().derive("master_options", ['master_options'], _build_master_options)
+
+def _count_values(category, table_name, column_en):
+    """
+    テーブルの1カラムの値ごとの件数を数える
+    キャッシュ済みのテーブルがあればそれを使い、なければデータベース側の関数（sql/master_usage.sql）で集計する
+    関数が未設定の場合は、そのカラムだけをページ取得して数える
+    """
+    mapping_dict = TABLE_MAPS[table_name]
+    col_jp = next(jp for jp, en in mapping_dict.items() if en == column_en)
+    cached = get_table_cache().get(table_name)
+    if cached is not None:
+        return {k: int(v) for k, v in cached[col_jp].value_counts(dropna=True).items()}
+    try:
+        res = _call_rpc('master_usage_counts', {'p_category': category})
+        return {r['name']: int(r['usage_count']) for r in res.data or []}
+    except Exception as e:
+        if is_transient(e): raise
+    counts = {}
+    id_col_en = mapping_dict[TABLE_ID_COLUMNS[table_name]]
+    for rows, _ in iter_pages(init_supabase(), table_name, order_col=id_col_en, columns=column_en):
+        for r in rows:
+            val = r.get(column_en)
+            if val is not None: counts[val] = counts.get(val, 0) + 1
+    return counts
+
+def get_usage_counts(category):
+    """
+    マスタデータの各選択肢が使用されている件数を {名称: 件数} で返す（取得エラー時はNone）
+    参照先テーブルのキャッシュのバージョンが変わるまで集計結果を使い回す
+    """
+    if category not in MASTER_USAGE: return {}
+    table_name, column_en = MASTER_USAGE[category]
+    try:
+        with trace(table_name, 'usage_counts', category) as span:
+            span.source = 'cache'
+            def build():
+                span.source = 'network'
+                return _count_values(category, table_name, column_en)
+            counts = get_table_cache().derive(f"usage_counts_{category}", [table_name], build)
+            span.rows = sum(counts.values())
+        return counts
+    except Exception as e:
+        st.error(f"使用件数の取得エラー ({table_name}): {e}")
+        return None
+
+# --- 小口現金出納帳 ---
+# 集計はデータベース側の関数（sql/petty_cash.sql）で行う
+# 関数が未設定・接続できない場合と、送信待ちの書き込みがある場合は、取得済みの利用者の活動から計算する
+
+# 関数が未設定と分かった後、再び呼び出しを試すまでの間隔（秒）
+RPC_RETRY_INTERVAL = 3600
+# 未設定と分かった関数 -> その時刻（プロセス内で共有）
+_RPC_UNAVAILABLE = {}
+
+def _date_param(val):
+    return None if val is None else pd.Timestamp(val).strftime('%Y-%m-%d')
+
+def _call_rpc(name, params):
+    """
+    データベース側の関数を呼び出す（未設定と分かっている間は呼び出さずにRuntimeErrorを送出する）
+    """
+    marked_at = _RPC_UNAVAILABLE.get(name)
+    if marked_at is not None and time.monotonic() - marked_at < RPC_RETRY_INTERVAL:
+        raise RuntimeError(f"{name} は未設定です")
+    try:
+        return call_with_retry(init_supabase().rpc(name, params).execute, breaker=READ_BREAKER)
+    except Exception as e:
+        if not is_transient(e):
+            # 関数が未作成・権限なし等。毎回失敗させないよう、しばらく呼び出さない
+            _RPC_UNAVAILABLE[name] = time.monotonic()
+            logger.warning("%s を利用できないため、画面側で集計します: %s", name, e)
+        else:
+            logger.info("%s の呼び出しに失敗しました: %s", name, e)
+        raise
+
+def _has_pending_writes(table_name):
+    """
+    テーブルに未送信（書き込みキュー・未送信の保存）の書き込みがあるか
+    """
+    queue = get_write_queue()
+    if queue is not None and queue.has_pending(table_name): return True
+    return get_journal().count_pending(table_name) > 0
+
+def _has_unsent_writes(table_name):
+    """
+    テーブルに未送信、または送信に失敗して再送・破棄を待っている書き込みがあるか
+    """
+    if _has_pending_writes(table_name): return True
+    queue = get_write_queue()
+    if queue is not None and queue.has_failed(table_name): return True
+    return any(e['table_name'] == table_name for e in get_journal().failed())
+
+def _person_activities(person_id):
+    """
+    利用者の活動を返す（利用者ごとのキャッシュがなく、全件のキャッシュがあればそこから絞り込む）
+    接続できない間は、取得済みのデータ（送信待ちの書き込みを反映済み）を使う
+    """
+    cache = get_table_cache()
+    person_key = normalize_filters({'person_id': person_id}, MAP_ACTIVITIES)
+    if cache.entry('activities', person_key) is None and cache.entry('activities') is not None:
+        df = fetch_table("activities", MAP_ACTIVITIES)
+        return df[df['person_id'] == person_id]
+    return fetch_table("activities", MAP_ACTIVITIES, filters={'person_id': person_id})
+
+def get_petty_cash_balance(person_id):
+    """
+    利用者の小口現金の現在残高を返す
+    """
+    pid = to_int_id(person_id)
+    with trace('activities', 'petty_cash_balance', pid) as span:
+        replica = get_replica()
+        if replica is not None and replica.is_ready('activities'):
+            span.source = 'replica'
+            return int(replica.petty_cash_balance(pid))
+        if not _has_pending_writes('activities'):
+            span.source = 'cache'
+            def build():
+                span.source = 'network'
+                return int(_call_rpc('petty_cash_balance', {'p_person_id': pid}).data or 0)
+            try:
+                return get_table_cache().derive(f"petty_cash_balance_{pid}", ['activities'], build)
+            except Exception:
+                pass
+        span.source = 'local'
+        ledger = _local_petty_cash_ledger(pid)
+        return int(ledger['残高'].iloc[-1]) if not ledger.empty else 0
+
+def get_petty_cash_ledger(person_id, date_from=None, date_to=None):
+    """
+    利用者の小口現金出納帳を返す（期間内の行と、期間より前を含めた各行時点の残高）
+    """
+    pid = to_int_id(person_id)
+    date_from, date_to = _date_param(date_from), _date_param(date_to)
+    with trace('activities', 'petty_cash_ledger', (pid, date_from, date_to)) as span:
+        df = None
+        replica = get_replica()
+        if replica is not None and replica.is_ready('activities'):
+            span.source = 'replica'
+            df = _to_frame(replica.petty_cash_ledger(pid, date_from, date_to), MAP_CASH_LEDGER, TYPES_CASH_LEDGER)
+        elif not _has_pending_writes('activities'):
+            span.source = 'cache'
+            def build():
+                span.source = 'network'
+                res = _call_rpc('petty_cash_ledger', {'p_person_id': pid, 'p_from': date_from, 'p_to': date_to})
+                return _to_frame(res.data, MAP_CASH_LEDGER, TYPES_CASH_LEDGER)
+            try:
+                df = get_table_cache().derive(f"petty_cash_ledger_{pid}_{date_from}_{date_to}", ['activities'], build).copy()
+            except Exception:
+                df = None
+        if df is None:
+            span.source = 'local'
+            df = _local_petty_cash_ledger(pid, date_from, date_to)
+        span.rows = len(df)
+        return df
+
+def _local_petty_cash_ledger(person_id, date_from=None, date_to=None):
+    """
+    利用者の活動のうち入金・出金から出納帳を計算する（データベース側の関数と同じ計算）
+    """
+    df = _person_activities(person_id)
+    df = df[df['活動'].isin(PETTY_CASH_TYPES)]
+    if date_to is not None:
+        df = df[df['記録日'] <= pd.Timestamp(date_to)]
+    df = df.sort_values(['記録日', '作成日時', 'activity_id'], kind='stable', na_position='last')
+    amount = df['交通費・立替金'].fillna(0)
+    df['残高'] = amount.where(df['活動'] == '入金', -amount).cumsum().astype('Int64')
+    if date_from is not None:
+        df = df[df['記録日'] >= pd.Timestamp(date_from)]
+    return df[list(MAP_CASH_LEDGER)].reset_index(drop=True)
 
-def check_usage_count(category, option_name):
+def rename_master_option(category, option_id, old_name, new_name):
     """
-    マスタデータの選択肢が使用されている数をチェックする
+    マスタの選択肢の名称を変更し、その選択肢を使用している行もまとめて新しい名称に置き換える
+    参照先テーブルは1回の一括更新で書き換え、キャッシュはそのテーブルとマスタのみ破棄する
     """
+    new_name = (new_name or "").strip()
+    if not new_name or new_name == old_name:
+        st.warning("新しい名称を入力してください。")
+        return False
+    if new_name in get_master_options().names.get(category, []):
+        st.error(f"「{new_name}」は既に登録されています。")
+        return False
     client = init_supabase()
-    count = 0
     try:
-        if category == 'activity':
-            res = client.table('activities').select('activity_id', count='exact').eq('activity_type', option_name).execute()
-            count = res.count
-        elif category == 'asset':
-            res = client.table('assets').select('asset_id', count='exact').eq('asset_type', option_name).execute()
-            count = res.count
-        elif category == 'relationship':
-            res = client.table('related_parties').select('related_id', count='exact').eq('relationship', option_name).execute()
-            count = res.count
-        elif category == 'guardian_type':
-            res = client.table('persons').select('person_id', count='exact').eq('guardianship_type', option_name).execute()
-            count = res.count
-    except Exception:
-        pass
-    return count
+        # 先に参照先を置き換える（途中で失敗してもマスタに残る旧名称で再実行できるように）
+        if category in MASTER_USAGE:
+            table_name, column_en = MASTER_USAGE[category]
+            client.table(table_name).update({column_en: new_name}, returning=ReturnMethod.minimal).eq(column_en, old_name).execute()
+            # 更新日時が変わらない行もあるため、差分同期に任せずレプリカにも直接反映する
+            replica = get_replica()
+            if replica is not None:
+                replica.replace_value(table_name, column_en, old_name, new_name)
+            _invalidate(table_name)
+        res = client.table("master_options").update({'name': new_name}, returning=ReturnMethod.representation).eq('id', _to_db_value(option_id)).execute()
+        _reflect_write("master_options", MAP_MASTER, res.data)
+        st.toast(f"「{old_name}」を「{new_name}」に変更しました", icon="✅")
+        return True
+    except Exception as e:
+        st.error(f"名称変更エラー: {e}")
+        return False
+
+def update_master_orders(category, new_orders):
+    """
+    マスタの選択肢の順序をまとめて更新する（new_orders: {名称: 新しい順序}）
+    変更があった行のみを1回のupsertで書き込み、更新した件数を返す（エラー時はNone）
+    """
+    master = get_master_options()
+    current = master.orders.get(category, {})
+    # NOT NULL制約のあるカラムも含めた完全な行として送る（既存行はidで競合して更新される）
+    rows = [{'id': master.ids[category][name], 'category': category, 'name': name, 'sort_order': int(order)}
+            for name, order in new_orders.items()
+            if name in current and order is not None and not pd.isna(order) and current[name] != int(order)]
+    if not rows: return 0
+    try:
+        res = init_supabase().table("master_options").upsert(rows, on_conflict='id', returning=ReturnMethod.representation).execute()
+        _reflect_write("master_options", MAP_MASTER, res.data)
+        return len(rows)
+    except Exception as e:
+        st.error(f"順序の更新エラー: {e}")
+        return None
+
+def _to_db_value(val):
+    """
+    画面・DataFrame由来の値をJSONで送信できる値に変換する
+    空文字・欠損はNone、numpyの数値はPythonの数値、日付はISO形式の文字列にする
+    """
+    if val is None: return None
+    if isinstance(val, str): return val if val != "" else None
+    if not isinstance(val, (list, tuple, dict)) and pd.isna(val): return None
+    if isinstance(val, pd.Timestamp):
+        return val.strftime('%Y-%m-%d') if val == val.normalize() and val.tz is None else val.isoformat()
+    if hasattr(val, 'isoformat'): return val.isoformat()
+    if hasattr(val, 'item'): return val.item()
+    return val
+
+# --- CSVエクスポート ---
+# 一度に文字列化する行数（大きなテーブルでも一時的なメモリ使用量を抑える）
+EXPORT_CHUNK_ROWS = 5000
+
+def _encode_csv(df, encoding='cp932'):
+    """
+    DataFrameを行の塊ごとにCSV化してエンコードする
+    指定の文字コードで表せない文字（機種依存文字・絵文字等）は「?」に置き換える
+    """
+    parts = []
+    for start in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+        parts.append(chunk.to_csv(index=False, header=(start == 0)).encode(encoding, errors='replace'))
+    return b"".join(parts)
+
+def export_csv(table_name, mapping_dict, filters=None):
+    """
+    テーブルをCSV（cp932）のバイト列で返す（最新のデータを取得できなかった場合はNone）
+    作成したバイト列はキャッシュに保持しない（全件分のデータがプロセスに残り続けないように）
+    """
+    df = fetch_table(table_name, mapping_dict, filters)
+    if is_degraded(df):
+        # 取得エラー時の空データ・接続できない間の古いデータは出力しない
+        return None
+    return _encode_csv(df)
+
+def _payload_size(data):
+    """
+    送信するデータのJSONとしてのバイト数（計測用）
+    """
+    return len(json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'))
 
 def insert_data(table_name, data_dict, mapping_dict):
     """
     データの新規登録を行う
     """
     client = init_supabase()
-    db_data = {}
-    for jp_key, val in data_dict.items():
-        if jp_key in mapping_dict:
-            if val == "": val = None
-            db_data[mapping_dict[jp_key]] = val
+    db_data = {mapping_dict[jp_key]: _to_db_value(val) for jp_key, val in data_dict.items() if jp_key in mapping_dict}
+    journal_ok = TABLE_ID_COLUMNS.get(table_name) is not None
+    if journal_ok and _should_journal():
+        return _journal_write(table_name, 'insert', mapping_dict, TABLE_ID_COLUMNS[table_name], db_data=db_data)
+    queue = get_write_queue()
+    if queue is not None and journal_ok:
+        _enqueue_write(queue, table_name, 'insert', mapping_dict, TABLE_ID_COLUMNS[table_name], db_data=db_data)
+        st.toast("登録しました（送信待ち）", icon="⏳")
+        return True
     try:
         # print(f"DEBUG: DB Insert -> {table_name}, Data={db_data}")
-        client.table(table_name).insert(db_data).execute()
+        with trace(table_name, 'insert') as span:
+            span.bytes = _payload_size(db_data)
+            res = client.table(table_name).insert(db_data, returning=ReturnMethod.representation).execute()
+            span.rows = len(res.data or [])
         st.toast("登録しました", icon="✅")
-        time.sleep(1) # DB反映待ち
-        st.cache_data.clear()
+        _reflect_write(table_name, mapping_dict, res.data)
         return True
     except Exception as e:
+        if journal_ok and is_transient(e):
+            return _journal_write(table_name, 'insert', mapping_dict, TABLE_ID_COLUMNS[table_name], db_data=db_data,
+                                  attempted=not is_unreachable(e))
         st.error(f"登録エラー: {e}")
         return False
 
@@ -119,19 +1117,31 @@ def update_data(table_name, id_col_jp, target_id, data_dict, mapping_dict):
     データの更新を行う
     """
     client = init_supabase()
-    db_data = {}
-    for jp_key, val in data_dict.items():
-        if jp_key in mapping_dict:
-            if val == "": val = None
-            db_data[mapping_dict[jp_key]] = val
+    db_data = {mapping_dict[jp_key]: _to_db_value(val) for jp_key, val in data_dict.items() if jp_key in mapping_dict}
     id_col_en = mapping_dict[id_col_jp]
+    target = to_int_id(target_id)
+    queue = get_write_queue()
+    if queue is not None:
+        target = queue.resolve_id(target)
+        # キューで送信待ちの登録への書き込みは、未送信の記録があっても登録と同じキューで順に送る
+        if _is_queue_temp_id(target) or ((target or 0) >= 0 and not _should_journal()):
+            _enqueue_write(queue, table_name, 'update', mapping_dict, id_col_jp, target, db_data)
+            st.toast("更新しました（送信待ち）", icon="⏳")
+            return True
+    if _should_journal() or (target or 0) < 0:
+        return _journal_write(table_name, 'update', mapping_dict, id_col_jp, target, db_data)
     try:
-        client.table(table_name).update(db_data).eq(id_col_en, target_id).execute()
+        with trace(table_name, 'update', ((id_col_en, 'eq', target_id),)) as span:
+            span.bytes = _payload_size(db_data)
+            res = client.table(table_name).update(db_data, returning=ReturnMethod.representation).eq(id_col_en, _to_db_value(target_id)).execute()
+            span.rows = len(res.data or [])
         st.toast("更新しました", icon="✅")
-        time.sleep(1) # DB反映待ち
-        st.cache_data.clear()
+        _reflect_write(table_name, mapping_dict, res.data, id_col_jp)
         return True
     except Exception as e:
+        if is_transient(e):
+            # 更新は同じ内容で再送しても結果が変わらない
+            return _journal_write(table_name, 'update', mapping_dict, id_col_jp, to_int_id(target_id), db_data)
         st.error(f"更新エラー: {e}")
         return False
 
@@ -141,56 +1151,229 @@ def delete_data(table_name, id_col_jp, target_id, mapping_dict):
     """
     client = init_supabase()
     id_col_en = mapping_dict[id_col_jp]
+    target = to_int_id(target_id)
+    queue = get_write_queue()
+    if queue is not None:
+        target = queue.resolve_id(target)
+        # キューで送信待ちの登録への書き込みは、未送信の記録があっても登録と同じキューで順に送る
+        if _is_queue_temp_id(target) or ((target or 0) >= 0 and not _should_journal()):
+            _enqueue_write(queue, table_name, 'delete', mapping_dict, id_col_jp, target)
+            st.toast("削除しました（送信待ち）", icon="⏳")
+            return True
+    if _should_journal() or (target or 0) < 0:
+        return _journal_write(table_name, 'delete', mapping_dict, id_col_jp, target)
     try:
-        client.table(table_name).delete().eq(id_col_en, target_id).execute()
+        with trace(table_name, 'delete', ((id_col_en, 'eq', target_id),)) as span:
+            client.table(table_name).delete(returning=ReturnMethod.minimal).eq(id_col_en, _to_db_value(target_id)).execute()
+            span.rows = 1
         st.toast("削除しました", icon="🗑️")
-        time.sleep(1) # DB反映待ち
-        st.cache_data.clear()
+        _write_through(table_name, mapping_dict, id_col_jp, deleted_ids=[target_id])
         return True
     except Exception as e:
+        if is_transient(e):
+            return _journal_write(table_name, 'delete', mapping_dict, id_col_jp, to_int_id(target_id))
         st.error(f"削除エラー: {e}")
         return False
 
+# 主キー指定の一括削除で1リクエストに含めるID数（URL長の上限対策）
+DELETE_CHUNK_SIZE = 500
+
+def delete_many(table_name, id_col_jp, mapping_dict, ids=None, filters=None):
+    """
+    複数行をまとめて削除する（主キーのリスト、またはfetch_tableと同じ形式の条件で指定）
+    キャッシュへの反映は最後に1回だけ行う。削除した件数を返す（エラー時はNone）
+    """
+    client = init_supabase()
+    id_col_en = mapping_dict[id_col_jp]
+    if ids is None and not filters:
+        # 条件なしの削除（全件削除）は受け付けない
+        raise ValueError("削除対象のIDまたは条件を指定してください")
+    if _has_unsent_writes(table_name):
+        # 送信待ち・再送待ちの登録は削除の対象にならず、削除後に送信されて残ってしまうため
+        st.warning("送信待ち・送信に失敗した書き込みがあるため、一括削除できません。送信が終わるか、破棄してから実行してください。")
+        return None
+    if READ_BREAKER.state == 'open':
+        st.warning("サーバーに接続できないため、一括削除できません。接続が回復してから実行してください。")
+        return None
+    deleted_ids = []
+    try:
+        with trace(table_name, 'delete_many', filters) as span:
+            if ids is not None:
+                ids = [i for i in (to_int_id(v) for v in ids) if i is not None]
+                for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+                    res = client.table(table_name).delete(returning=ReturnMethod.representation).in_(id_col_en, ids[start:start + DELETE_CHUNK_SIZE]).execute()
+                    deleted_ids.extend(r[id_col_en] for r in res.data or [])
+            else:
+                query = client.table(table_name).delete(returning=ReturnMethod.representation)
+                res = _apply_filters(query, normalize_filters(filters, mapping_dict)).execute()
+                deleted_ids.extend(r[id_col_en] for r in res.data or [])
+            span.rows = len(deleted_ids)
+        return len(deleted_ids)
+    except Exception as e:
+        st.error(f"削除エラー: {e}")
+        return None
+    finally:
+        # 途中で失敗しても、削除済みの分はキャッシュに反映する
+        if deleted_ids:
+            _write_through(table_name, mapping_dict, id_col_jp, deleted_ids=deleted_ids)
+
+# 一括インポートの設定
+IMPORT_CHUNK_SIZE = 500
+IMPORT_RETRIES = 3
+IMPORT_RETRY_WAIT = 1.0
+
+def _make_chunks(records, id_col_en=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    レコードを送信単位に分割する
+    IDを持つレコードはupsert、持たないレコード（自動採番）はinsertとして別のチャンクにまとめる
+    """
+    with_id = [r for r in records if id_col_en and id_col_en in r]
+    without_id = [r for r in records if not (id_col_en and id_col_en in r)]
+    chunks = [('upsert', with_id[i:i + chunk_size]) for i in range(0, len(with_id), chunk_size)]
+    chunks += [('insert', without_id[i:i + chunk_size]) for i in range(0, len(without_id), chunk_size)]
+    return chunks
+
+def bulk_upsert(client, table_name, chunks, id_col_en=None, start_chunk=0, on_progress=None):
+    """
+    チャンク単位で一括登録する（1チャンク1リクエスト）
+    chunksはリスト・ジェネレータのどちらでもよく、送信が終わってから次のチャンクを取り出す
+    一時的な障害で失敗したチャンクは待ち時間を倍にしながらリトライし、それでも失敗した場合はそこで中断する
+    insertのチャンクは、サーバーに届いていないことが確実な場合のみリトライする（二重登録の防止）
+    戻り値の next_chunk を start_chunk に渡すと、最後に完了したチャンクの続きから再開できる
+    """
+    count = 0
+    next_chunk = 0
+    for i, (method, chunk) in enumerate(chunks):
+        next_chunk = i + 1
+        if i < start_chunk: continue
+        for attempt in range(IMPORT_RETRIES):
+            try:
+                query = client.table(table_name)
+                if method == 'upsert':
+                    query = query.upsert(chunk, on_conflict=id_col_en, returning=ReturnMethod.minimal)
+                else:
+                    query = query.insert(chunk, returning=ReturnMethod.minimal)
+                query.execute()
+                break
+            except Exception as e:
+                retryable = is_unreachable(e) if method == 'insert' else is_transient(e)
+                if not retryable or attempt == IMPORT_RETRIES - 1:
+                    return {'count': count, 'next_chunk': i, 'error': e}
+                time.sleep(IMPORT_RETRY_WAIT * (2 ** attempt))
+        count += len(chunk)
+        if on_progress: on_progress(i + 1, count)
+    return {'count': count, 'next_chunk': next_chunk, 'error': None}
+
+def _detect_encoding(file_obj, block_size=1 << 20):
+    """
+    ファイル全体を読み込まずにブロック単位でUTF-8として検証し、失敗した場合はcp932とみなす
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            block = file_obj.read(block_size)
+            if not block:
+                decoder.decode(b'', final=True)
+                return 'utf-8'
+            decoder.decode(block)
+    except UnicodeDecodeError:
+        return 'cp932'
+    finally:
+        file_obj.seek(0)
+
+def _to_import_records(df, mapping_dict, column_types, id_column=None, failures=None):
+    """
+    インポートしたDataFrameを型定義に従って列単位で整形し、DBカラム名のレコード（dictのリスト）に変換する
+    """
+    df = df[[c for c in df.columns if c in mapping_dict]]
+    cleaned = clean_columns(df, column_types, failures).astype(object)
+    cleaned = cleaned.where(cleaned.notna(), None).rename(columns=mapping_dict)
+    if id_column and mapping_dict[id_column] in cleaned.columns:
+        # IDカラムの値がない行は、キー自体を含めない（自動採番させるため）
+        id_col_en = mapping_dict[id_column]
+        has_id = cleaned[id_col_en].notna()
+        return cleaned[has_id].to_dict('records') + cleaned[~has_id].drop(columns=id_col_en).to_dict('records')
+    return cleaned.to_dict('records')
+
+def iter_import_chunks(file_obj, mapping_dict, column_types, id_column=None, failures=None):
+    """
+    CSVをIMPORT_CHUNK_SIZE行ずつ読み込み、送信チャンク (method, records) を順に返すジェネレータ
+    読み込み済みの行は送信後に破棄されるため、ファイルサイズによらずメモリ使用量は一定
+    変換できずに空欄になる値がID列にあれば ValueError で中断し、その他の列は failures（リスト）に記録する
+    """
+    encoding = _detect_encoding(file_obj)
+    id_col_en = mapping_dict[id_column] if id_column else None
+    # 電話番号・〒などの先頭の0が落ちないよう文字列として読み込み、型定義に従って変換する
+    for df in pd.read_csv(file_obj, encoding=encoding, chunksize=IMPORT_CHUNK_SIZE, dtype=str):
+        chunk_failures = {}
+        records = _to_import_records(df, mapping_dict, column_types, id_column, chunk_failures)
+        for col, rows in chunk_failures.items():
+            # CSVの行番号（1行目は見出し）
+            lines = [i + 2 for i in rows]
+            if column_types.get(col) == 'id':
+                # IDが空欄になると別の行として登録・紐付けが外れるため、送信せずに中断する
+                raise ValueError(f"「{col}」に数値として読めない値があります（{_format_lines(lines)}行目）")
+            if failures is not None:
+                failures.append({'列': col, '件数': len(lines), '行': _format_lines(lines)})
+        yield from _make_chunks(records, id_col_en)
+
+def _format_lines(lines, limit=10):
+    """
+    行番号の一覧を表示用の文字列にする（多い場合は先頭のみ）
+    """
+    text = ", ".join(str(n) for n in lines[:limit])
+    return text + (f" ほか{len(lines) - limit}行" if len(lines) > limit else "")
+
 def process_import(file_obj, table_name, mapping_dict, id_column=None):
     """
     CSV/Excelファイルからのインポート処理
+    ファイルは分割して読み込み、読み込んだ分から順にデータベースへ送信する
+    途中で失敗した場合は、同じファイルで再実行すると完了済みのチャンクの続きから再開する
     """
+    failures = []
     try:
-        try:
-            df = pd.read_csv(file_obj)
-        except UnicodeDecodeError:
-            file_obj.seek(0)
-            df = pd.read_csv(file_obj, encoding='cp932')
-        count = 0
         client = init_supabase()
-        records = []
-        for _, row in df.iterrows():
-            db_data = {}
-            for jp_k, val in row.items():
-                if jp_k in mapping_dict:
-                    # IDカラムの場合は、値がないならキー自体を含めない（自動採番させるため）
-                    if id_column and jp_k == id_column:
-                        if pd.notna(val) and str(val).strip() != "":
-                            db_data[mapping_dict[jp_k]] = val
-                    else:
-                        if pd.isna(val): val = None
-                        # 数値型カラムのカンマ除去処理
-                        if isinstance(val, str) and "," in val:
-                            # カンマを除去して数値変換を試みる
-                            temp_val = val.replace(",", "").strip()
-                            if temp_val.replace("-", "").replace(".", "").isdigit():
-                                val = temp_val
-                        db_data[mapping_dict[jp_k]] = val
-            records.append(db_data)
-        for rec in records:
-            # IDキーが存在するかチェック
-            id_key = mapping_dict[id_column] if id_column else None
-            if id_key and id_key in rec:
-                client.table(table_name).upsert(rec).execute()
-            else:
-                client.table(table_name).insert(rec).execute()
-            count += 1
-        st.success(f"{count}件 インポート完了")
-        st.cache_data.clear()
+        id_col_en = mapping_dict[id_column] if id_column else None
+        # 再開位置はテーブル・ファイル名・サイズごとにセッションへ保存
+        file_size = getattr(file_obj, 'size', 0)
+        resume_key = f"import_resume_{table_name}_{getattr(file_obj, 'name', '')}_{file_size}"
+        start_chunk = st.session_state.get(resume_key, 0)
+        if start_chunk:
+            st.info(f"前回の続き（{start_chunk + 1} チャンク目）から再開します")
+
+        progress = st.progress(0.0, text="インポート中...")
+        def on_progress(done, count):
+            st.session_state[resume_key] = done
+            ratio = min(file_obj.tell() / file_size, 1.0) if file_size else 0.0
+            progress.progress(ratio, text=f"インポート中... {done} チャンク（{count}件）")
+
+        # 更新日時はサーバー側（sql/updated_at.sql のトリガー）で設定するため送らない
+        # （エクスポートしたCSVをそのまま取り込めるように。未実行のデータベースには列自体がない）
+        import_map = {jp: en for jp, en in mapping_dict.items() if jp != SYNC_COLUMNS.get(table_name)}
+        chunks = iter_import_chunks(file_obj, import_map, TABLE_TYPES.get(table_name, {}), id_column, failures)
+        with trace(table_name, 'import') as span:
+            result = bulk_upsert(client, table_name, chunks, id_col_en, start_chunk, on_progress)
+            span.rows, span.bytes = result['count'], file_size
+            if result['error'] is not None: span.error = repr(result['error'])
+        _invalidate(table_name)
+        _report_import_failures(failures)
+        if result['error'] is not None:
+            st.error(f"インポートエラー（{result['next_chunk'] + 1} チャンク目）: {result['error']}")
+            st.warning(f"{result['count']}件は登録済みです。同じファイルで再実行すると続きから再開します。")
+            return
+        st.session_state.pop(resume_key, None)
+        progress.empty()
+        st.success(f"{result['count']}件 インポート完了")
     except Exception as e:
+        # 読み込み途中のエラーでも、それまでに送信した分は反映されているためキャッシュを破棄
+        _invalidate(table_name)
+        _report_import_failures(failures)
         st.error(f"インポートエラー: {e}")
+
+def _report_import_failures(failures):
+    """
+    変換できずに空欄で登録した値を、列・行番号の一覧で表示する
+    """
+    if not failures: return
+    st.warning("読み取れない値があったため、次の項目は空欄として登録しました。")
+    st.dataframe(pd.DataFrame(failures), hide_index=True, use_container_width=True)
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# 送信できなかった書き込みを保存するファイル
+JOURNAL_PATH = "write_journal.sqlite3"
+# 保存中の新規行に付ける仮IDの基準（書き込みキューの仮IDと重ならないよう大きく離す）
+JOURNAL_TEMP_ID_BASE = -1_000_000_000
+
+JOURNAL_DDL = """CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entry_key TEXT UNIQUE NOT NULL,
+    table_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    id_col TEXT NOT NULL,
+    target_id INTEGER,
+    data TEXT NOT NULL,
+    attempted INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    result_id INTEGER,
+    owner TEXT,
+    created_at REAL NOT NULL
+)"""
+
+class WriteJournal:
+    """
+    Supabaseに送信できなかった書き込みをサーバー上のファイル（SQLite）に追記保存するジャーナル
+    接続が回復したら受け付け順に再送する。送信済みの記録は status='done' として残す
+    attempted: 送信を試みてサーバーに届いた可能性がある書き込み（登録は自動では再送しない）
+    owner: 書き込んだセッション（失敗した書き込みの表示・破棄はそのセッションに限る）
+    """
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(JOURNAL_DDL)
+            # owner列がない古いファイルには追加する
+            columns = {c[1] for c in self._conn.execute("PRAGMA table_info(journal)")}
+            if 'owner' not in columns:
+                self._conn.execute("ALTER TABLE journal ADD COLUMN owner TEXT")
+
+    def append(self, table_name, kind, id_col, target_id=None, data=None, attempted=False, owner=None):
+        """
+        書き込みを追記し、(連番, 仮ID) を返す（仮IDは登録の場合のみ）
+        """
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO journal (entry_key, table_name, kind, id_col, target_id, data, attempted, owner, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (uuid.uuid4().hex, table_name, kind, id_col, target_id, json.dumps(data or {}, ensure_ascii=False), int(attempted), owner, time.time()),
+            )
+        seq = cur.lastrowid
+        return seq, (self.temp_id(seq) if kind == 'insert' else None)
+
+    @staticmethod
+    def temp_id(seq):
+        return JOURNAL_TEMP_ID_BASE - seq
+
+    def _rows(self, where, params=()):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM journal WHERE {where} ORDER BY seq", params).fetchall()
+        return [dict(r, data=json.loads(r['data'])) for r in rows]
+
+    def pending(self):
+        """
+        未送信の書き込みを受け付け順に返す
+        """
+        return self._rows("status = 'pending'")
+
+    def failed(self, owner=None):
+        """
+        再送に失敗した書き込みを返す（ownerを指定した場合はそのセッションの分）
+        """
+        if owner is None: return self._rows("status = 'failed'")
+        return self._rows("status = 'failed' AND owner = ?", (owner,))
+
+    def count_pending(self, table_name=None, owner=None):
+        """
+        未送信の書き込みの件数（table_name・ownerを指定した場合はその分）
+        """
+        sql, params = "SELECT COUNT(*) FROM journal WHERE status = 'pending'", []
+        if table_name is not None:
+            sql += " AND table_name = ?"
+            params.append(table_name)
+        if owner is not None:
+            sql += " AND owner = ?"
+            params.append(owner)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def insert_status(self, temp_id):
+        """
+        仮IDを発行した登録の状態を返す（pending / done / failed / discarded、不明な場合はNone）
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM journal WHERE seq = ?", (JOURNAL_TEMP_ID_BASE - temp_id,)).fetchone()
+        return row[0] if row else None
+
+    def resolve(self, target_id):
+        """
+        仮IDを登録後のIDに置き換える（未登録の場合はNone、仮IDでなければそのまま）
+        """
+        if target_id is None or target_id > JOURNAL_TEMP_ID_BASE:
+            return target_id
+        with self._lock:
+            row = self._conn.execute("SELECT result_id FROM journal WHERE seq = ? AND status = 'done'",
+                                     (JOURNAL_TEMP_ID_BASE - target_id,)).fetchone()
+        return row[0] if row else None
+
+    def mark_done(self, seq, result_id=None):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET status = 'done', error = NULL, result_id = ? WHERE seq = ?", (result_id, seq))
+
+    def mark_attempted(self, seq, attempted=True):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET attempted = ? WHERE seq = ?", (int(attempted), seq))
+
+    def mark_failed(self, seq, error):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET status = 'failed', error = ? WHERE seq = ?", (str(error), seq))
+
+    def requeue(self, seq, owner=None):
+        """
+        失敗した書き込みを未送信に戻す（受け付け順は元のまま。送信を試みた登録もそのまま再送する）
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET status = 'pending', attempted = 0, error = NULL WHERE seq = ? AND status = 'failed'"
+                               + (" AND owner = ?" if owner is not None else ""), (seq, owner) if owner is not None else (seq,))
+
+    def discard(self, seq, owner=None):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE journal SET status = 'discarded' WHERE seq = ?"
+                               + (" AND owner = ?" if owner is not None else ""), (seq, owner) if owner is not None else (seq,))
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+import streamlit as st
+
+# 所要時間のヒストグラムの区切り（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 保持する呼び出し記録の件数（古いものから破棄）
+MAX_RECORDS = 2000
+
+class Histogram:
+    """
+    所要時間の累積ヒストグラム（Prometheusのhistogramと同じ形式）
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class MetricsRegistry:
+    """
+    データベース呼び出しの記録と、(操作, テーブル, 取得元) ごとの集計
+    """
+    def __init__(self, max_records=MAX_RECORDS):
+        self._lock = threading.Lock()
+        self.records = deque(maxlen=max_records)
+        self.latency = {}  # (操作, テーブル, 取得元) -> Histogram
+        self.rows = {}     # (操作, テーブル, 取得元) -> 行数の合計
+        self.bytes = {}    # (操作, テーブル, 取得元) -> バイト数の合計
+        self.errors = {}   # (操作, テーブル) -> エラー件数
+
+    def record(self, rec):
+        key = (rec['operation'], rec['table'], rec['source'])
+        with self._lock:
+            self.records.append(rec)
+            self.latency.setdefault(key, Histogram()).observe(rec['latency'])
+            self.rows[key] = self.rows.get(key, 0) + (rec['rows'] or 0)
+            self.bytes[key] = self.bytes.get(key, 0) + (rec['bytes'] or 0)
+            if rec['error']:
+                err_key = (rec['operation'], rec['table'])
+                self.errors[err_key] = self.errors.get(err_key, 0) + 1
+
+    def summary(self):
+        """
+        集計結果を行のリストで返す（画面表示用）
+        """
+        with self._lock:
+            return [{
+                'operation': op, 'table': table, 'source': source, 'calls': hist.count,
+                'total_sec': round(hist.sum, 3), 'avg_ms': round(hist.sum / hist.count * 1000, 1) if hist.count else 0,
+                'rows': self.rows.get((op, table, source), 0), 'bytes': self.bytes.get((op, table, source), 0),
+            } for (op, table, source), hist in sorted(self.latency.items())]
+
+    def to_jsonl(self):
+        """
+        呼び出し記録をJSON Lines形式で返す
+        """
+        with self._lock:
+            return "".join(json.dumps(rec, ensure_ascii=False, default=str) + "\n" for rec in self.records)
+
+    def to_prometheus(self, prefix="guardian_db"):
+        """
+        集計結果をPrometheusのテキスト形式で返す（node_exporterのtextfile collector向け）
+        """
+        lines = [f"# HELP {prefix}_call_seconds Supabase呼び出しの所要時間",
+                 f"# TYPE {prefix}_call_seconds histogram"]
+        with self._lock:
+            for (op, table, source), hist in sorted(self.latency.items()):
+                labels = f'operation="{op}",table="{table}",source="{source}"'
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{prefix}_call_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{prefix}_call_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f'{prefix}_call_seconds_sum{{{labels}}} {hist.sum:.6f}')
+                lines.append(f'{prefix}_call_seconds_count{{{labels}}} {hist.count}')
+            lines += [f"# HELP {prefix}_rows_total 取得・書き込みした行数", f"# TYPE {prefix}_rows_total counter"]
+            for (op, table, source), val in sorted(self.rows.items()):
+                lines.append(f'{prefix}_rows_total{{operation="{op}",table="{table}",source="{source}"}} {val}')
+            lines += [f"# HELP {prefix}_bytes_total 取得・書き込みしたデータ量（バイト）", f"# TYPE {prefix}_bytes_total counter"]
+            for (op, table, source), val in sorted(self.bytes.items()):
+                lines.append(f'{prefix}_bytes_total{{operation="{op}",table="{table}",source="{source}"}} {val}')
+            lines += [f"# HELP {prefix}_errors_total エラーになった呼び出しの数", f"# TYPE {prefix}_errors_total counter"]
+            for (op, table), val in sorted(self.errors.items()):
+                lines.append(f'{prefix}_errors_total{{operation="{op}",table="{table}"}} {val}')
+        return "\n".join(lines) + "\n"
+
+class Span:
+    """
+    1回のデータベース呼び出しを計測するコンテキストマネージャ
+    呼び出し側で rows（行数）, bytes（データ量）, source（network / cache / replica / stale）を設定する
+    """
+    def __init__(self, registries, table_name, operation, filters=None):
+        self.registries = registries
+        self.table_name = table_name
+        self.operation = operation
+        self.filters = filters
+        self.rows = None
+        self.bytes = None
+        self.source = 'network'
+        self.error = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None: self.error = repr(exc)
+        rec = {
+            'ts': time.time(), 'table': self.table_name, 'operation': self.operation,
+            'filters': str(self.filters) if self.filters else None, 'latency': time.perf_counter() - self._start,
+            'rows': self.rows, 'bytes': self.bytes, 'source': self.source, 'error': self.error,
+        }
+        for registry in self.registries:
+            registry.record(rec)
+        return False
+
+@st.cache_resource
+def get_process_metrics():
+    """
+    プロセス全体（全セッション共通）の計測結果を返す
+    """
+    return MetricsRegistry()
+
+def get_session_metrics():
+    """
+    現在のセッションの計測結果を返す
+    """
+    if 'db_metrics' not in st.session_state:
+        st.session_state.db_metrics = MetricsRegistry()
+    return st.session_state.db_metrics
+
+def trace(table_name, operation, filters=None):
+    """
+    セッション・プロセスの両方に記録するSpanを返す
+    """
+    return Span([get_session_metrics(), get_process_metrics()], table_name, operation, filters)
+
+def export_textfile():
+    """
+    secrets.toml の [metrics] textfile にプロセス全体の集計をPrometheus形式で書き出す（未設定時は何もしない）
+    """
+    try:
+        path = st.secrets.get("metrics", {}).get("textfile")
+    except Exception:
+        return
+    if not path: return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(get_process_metrics().to_prometheus())
+    # 収集側が書きかけのファイルを読まないよう置き換えで反映
+    os.replace(tmp_path, path)
@@ -0,0 +1,56 @@
+from .cache import get_table_cache, DoNotCache
+from .database import fetch_table, is_degraded
+from .utils import to_int_id
+from .constants import MAP_PERSONS, MAP_ACTIVITIES, MAP_ASSETS, MAP_RELATED
+
+# 利用者ごとに取得するテーブル
+PERSON_TABLES = {'activities': MAP_ACTIVITIES, 'assets': MAP_ASSETS, 'related_parties': MAP_RELATED}
+
+class PersonIndex:
+    """
+    利用者の氏名とIDの対応表と、テーブルごとの利用者ID -> 行位置の索引
+    利用者の切り替えごとに一覧の作り直しや全行の走査をせず、作成済みの対応表・索引から引く
+    """
+    def __init__(self, df_persons):
+        ids = [int(i) for i in df_persons['person_id'].dropna()] if not df_persons.empty else []
+        names = df_persons.loc[df_persons['person_id'].notna(), '氏名'].tolist() if ids else []
+        self.name_to_id = {f"{name}": pid for name, pid in zip(names, ids)}
+        self.id_to_name = {pid: f"{name}" for name, pid in zip(names, ids)}
+        self._order = {pid: i for i, pid in enumerate(self.name_to_id.values())}
+        self._positions = {}  # テーブル名 -> (索引を作った全件のDataFrame, {利用者ID: 行位置の配列})
+
+    def rows(self, table_name, person_id):
+        """
+        指定した利用者の行を返す
+        全件がキャッシュ済みの場合は、groupbyで作った行位置の索引から切り出す（全件のデータが変わった時だけ作り直す）
+        全件がない場合は、全件を取得せずSupabase側で利用者ごとに絞り込んで取得・キャッシュする
+        """
+        df = get_table_cache().get(table_name)
+        if df is None:
+            return fetch_table(table_name, PERSON_TABLES[table_name], filters={'person_id': person_id})
+        indexed = self._positions.get(table_name)
+        if indexed is None or indexed[0] is not df:
+            indexed = (df, df.groupby('person_id', sort=False).indices)
+            self._positions[table_name] = indexed
+        positions = indexed[1].get(to_int_id(person_id), [])
+        return df.iloc[positions].reset_index(drop=True)
+
+    def position_of(self, person_id):
+        """
+        選択肢（氏名の一覧）の中での位置を返す（見つからない場合は0）
+        """
+        return self._order.get(person_id, 0)
+
+def _build_person_index():
+    df_persons = fetch_table("persons", MAP_PERSONS)
+    index = PersonIndex(df_persons)
+    if is_degraded(df_persons):
+        # 取得エラー・古いデータから作った索引は保持しない（接続が回復したら次の表示で作り直す）
+        raise DoNotCache(index)
+    return index
+
+def get_person_index():
+    """
+    利用者索引を返す（利用者テーブルのキャッシュのバージョンが変わった時だけ作り直す）
+    """
+    return get_table_cache().derive("person_index", ['persons'], _build_person_index)
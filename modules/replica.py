@@ -0,0 +1,222 @@
+import sqlite3
+import threading
+import time
+
+# ローカル読み取りレプリカ（Supabaseのテーブルを複製したSQLiteファイル）
+REPLICA_PATH = "replica.sqlite3"
+
+# スキーマは システム仕様書.md「3. データベース設計」に準拠（日付はSupabaseの返却形式のままTEXTで保持）
+REPLICA_DDL = [
+    """CREATE TABLE IF NOT EXISTS persons (
+        person_id INTEGER PRIMARY KEY, case_number TEXT, basic_case_number TEXT, name TEXT, kana TEXT,
+        dob TEXT, address TEXT, residence TEXT, guardianship_type TEXT, disability_type TEXT,
+        petitioner TEXT, judgment_date TEXT, court TEXT, report_month TEXT, status TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS activities (
+        activity_id INTEGER PRIMARY KEY, person_id INTEGER, activity_date TEXT, activity_type TEXT,
+        location TEXT, duration INTEGER, expense INTEGER, is_important BOOLEAN, note TEXT, created_at TEXT,
+        updated_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS related_parties (
+        related_id INTEGER PRIMARY KEY, person_id INTEGER, relationship TEXT, name TEXT, organization TEXT,
+        phone TEXT, email TEXT, postal_code TEXT, address TEXT, is_keyperson BOOLEAN, note TEXT, updated_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS assets (
+        asset_id INTEGER PRIMARY KEY, person_id INTEGER, asset_type TEXT, name TEXT, detail TEXT,
+        account_number TEXT, value INTEGER, storage_location TEXT, note TEXT, updated_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS app_system_user (
+        id INTEGER PRIMARY KEY, name TEXT, kana TEXT, dob TEXT, postal_code TEXT, address TEXT, phone TEXT, email TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS master_options (
+        id INTEGER PRIMARY KEY, category TEXT, name TEXT, sort_order INTEGER
+    )""",
+]
+
+# 作成済みのレプリカに後から追加したカラム（起動時に不足分を追加する）
+REPLICA_ADDED_COLUMNS = {
+    'activities': {'updated_at': 'TEXT'},
+}
+
+REPLICA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_activities_person_date ON activities(person_id, activity_date)",
+    "CREATE INDEX IF NOT EXISTS idx_activities_type ON activities(activity_type)",
+    "CREATE INDEX IF NOT EXISTS idx_activities_person_type_date ON activities(person_id, activity_type, activity_date)",
+    "CREATE INDEX IF NOT EXISTS idx_activities_created ON activities(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_activities_updated ON activities(updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_related_person ON related_parties(person_id)",
+    "CREATE INDEX IF NOT EXISTS idx_related_updated ON related_parties(updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_assets_person ON assets(person_id)",
+    "CREATE INDEX IF NOT EXISTS idx_assets_updated ON assets(updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_master_category ON master_options(category, sort_order)",
+]
+
+# 小口現金出納帳の集計（sql/petty_cash.sql の petty_cash_balance / petty_cash_ledger と同じ計算）
+PETTY_CASH_SIGNED = "CASE WHEN activity_type = '入金' THEN COALESCE(expense, 0) ELSE -COALESCE(expense, 0) END"
+PETTY_CASH_BALANCE_SQL = f"""
+    SELECT COALESCE(SUM({PETTY_CASH_SIGNED}), 0) FROM activities
+    WHERE person_id = :pid AND activity_type IN ('入金', '出金') AND (:until IS NULL OR activity_date <= :until)
+"""
+PETTY_CASH_LEDGER_SQL = f"""
+    SELECT * FROM (
+        SELECT activity_id, person_id, activity_date, activity_type, location, expense, note, created_at,
+               SUM({PETTY_CASH_SIGNED}) OVER (
+                   ORDER BY activity_date IS NULL, activity_date, created_at IS NULL, created_at, activity_id
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS balance
+        FROM activities
+        WHERE person_id = :pid AND activity_type IN ('入金', '出金') AND (:date_to IS NULL OR activity_date <= :date_to)
+    ) WHERE :date_from IS NULL OR activity_date >= :date_from
+    ORDER BY activity_date IS NULL, activity_date, created_at IS NULL, created_at, activity_id
+"""
+
+SQL_OPS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+class ReadReplica:
+    """
+    SupabaseのテーブルをミラーするSQLiteの読み取りレプリカ
+    複数スレッド（画面描画・同期スレッド）から使うため、接続は1本をロックで保護する
+    """
+    def __init__(self, path=REPLICA_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._sync_requested = threading.Event()
+        # 同期の状態（同期スレッドのみが更新する）
+        self._synced_at = {}      # テーブル名 -> 最終同期時刻
+        self._watermarks = {}     # テーブル名 -> Supabaseから取得した行の最終更新日時
+        self._reconciled_at = {}  # テーブル名 -> 最後に全件を取得し直した時刻
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for ddl in REPLICA_DDL:
+                self._conn.execute(ddl)
+            for table_name, columns in REPLICA_ADDED_COLUMNS.items():
+                existing = {c[1] for c in self._conn.execute(f"PRAGMA table_info({table_name})")}
+                for col, col_type in columns.items():
+                    if col not in existing:
+                        self._conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {col} {col_type}")
+            for ddl in REPLICA_INDEXES:
+                self._conn.execute(ddl)
+        self._columns = {}
+        self._bool_columns = {}
+        for table_name in ['persons', 'activities', 'related_parties', 'assets', 'app_system_user', 'master_options']:
+            info = self._conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            self._columns[table_name] = [c[1] for c in info]
+            self._bool_columns[table_name] = {c[1] for c in info if c[2] == 'BOOLEAN'}
+
+    def is_ready(self, table_name):
+        """
+        一度でも同期が完了したテーブルか（未同期のテーブルはSupabaseから読む）
+        """
+        return table_name in self._synced_at
+
+    def mark_synced(self, table_name, watermark=None, full=False):
+        """
+        同期の完了を記録する（watermark: 次回の差分取得の基準、full: 全件を取得し直した場合）
+        画面からの書き込みの反映では呼ばない（未同期の行より新しい日時で基準が進まないように）
+        """
+        now = time.time()
+        self._synced_at[table_name] = now
+        if watermark is not None:
+            self._watermarks[table_name] = watermark
+        if full:
+            self._reconciled_at[table_name] = now
+
+    def watermark(self, table_name):
+        return self._watermarks.get(table_name)
+
+    def reconciled_at(self, table_name):
+        return self._reconciled_at.get(table_name, 0)
+
+    def request_sync(self):
+        """
+        同期スレッドに即時の再同期を依頼する（一括インポート後など）
+        """
+        self._sync_requested.set()
+
+    def wait_for_sync_request(self, timeout):
+        self._sync_requested.wait(timeout)
+        self._sync_requested.clear()
+
+    def _check_column(self, table_name, col):
+        if col not in self._columns[table_name]:
+            raise ValueError(f"不明なカラムです: {table_name}.{col}")
+        return col
+
+    def query(self, table_name, filter_key=(), order_col=None):
+        """
+        正規化済みフィルタ（database.normalize_filters の形式）で検索し、カラムごとのリストを返す
+        """
+        where, params = [], []
+        for col, op, val in filter_key:
+            col = self._check_column(table_name, col)
+            if op == 'in':
+                where.append(f"{col} IN ({','.join('?' * len(val))})" if val else "0")
+                params.extend(val)
+            else:
+                where.append(f"{col} {SQL_OPS[op]} ?")
+                params.append(val)
+        sql = f"SELECT * FROM {table_name}"
+        if where: sql += " WHERE " + " AND ".join(where)
+        if order_col: sql += f" ORDER BY {self._check_column(table_name, order_col)}"
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            names = [d[0] for d in cur.description]
+            rows = cur.fetchall()
+        if not rows: return {}
+        columns = {name: list(values) for name, values in zip(names, zip(*rows))}
+        for col in self._bool_columns[table_name]:
+            columns[col] = [None if v is None else bool(v) for v in columns[col]]
+        return columns
+
+    def petty_cash_balance(self, person_id, until=None):
+        """
+        小口現金の残高（untilを指定した場合はその日まで）
+        """
+        with self._lock:
+            return self._conn.execute(PETTY_CASH_BALANCE_SQL, {'pid': person_id, 'until': until}).fetchone()[0]
+
+    def petty_cash_ledger(self, person_id, date_from=None, date_to=None):
+        """
+        小口現金出納帳（期間内の行と各行時点の残高）をdictのリストで返す
+        """
+        params = {'pid': person_id, 'date_from': date_from, 'date_to': date_to}
+        with self._lock:
+            cur = self._conn.execute(PETTY_CASH_LEDGER_SQL, params)
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def _insert_sql(self, table_name):
+        cols = self._columns[table_name]
+        return f"INSERT OR REPLACE INTO {table_name} ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})", cols
+
+    def upsert_rows(self, table_name, rows):
+        """
+        行（DBカラム名のdict）を主キーで追加・置換する
+        """
+        sql, cols = self._insert_sql(table_name)
+        with self._lock, self._conn:
+            self._conn.executemany(sql, ([r.get(c) for c in cols] for r in rows))
+
+    def replace_all(self, table_name, pages):
+        """
+        テーブルの内容をページ列で丸ごと置き換える（1トランザクション）
+        """
+        sql, cols = self._insert_sql(table_name)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {table_name}")
+            for rows in pages:
+                self._conn.executemany(sql, ([r.get(c) for c in cols] for r in rows))
+
+    def delete_ids(self, table_name, id_col, ids):
+        id_col = self._check_column(table_name, id_col)
+        with self._lock, self._conn:
+            self._conn.executemany(f"DELETE FROM {table_name} WHERE {id_col} = ?", ([i] for i in ids))
+
+    def replace_value(self, table_name, col, old_value, new_value):
+        """
+        カラムの値を一括で置き換える（マスタの名称変更の反映）
+        """
+        col = self._check_column(table_name, col)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {table_name} SET {col} = ? WHERE {col} = ?", (new_value, old_value))
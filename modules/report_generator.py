@@ -150,6 +150,9 @@ def create_periodic_report(person_data, guardian_data, asset_list, activity_list
             
             # 最終確認日
             u_date = bank.get('更新日')
+            if hasattr(u_date, 'date'):
+                # Excelはタイムゾーン付きの日時を扱えないため日付のみにする（NaTは空欄扱い）
+                u_date = u_date.date() if u_date == u_date else None
             safe_cell_write(ws_ast, row_idx, COL_BANK_DATE, u_date if u_date else today)
 
             # 残高
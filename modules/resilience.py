@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+
+# 再試行の設定（指数バックオフ＋ジッター）
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# サーキットブレーカーの設定
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0
+
+# 一時的な障害とみなすPostgRESTのエラーコード（HTTPステータス・接続エラー）
+TRANSIENT_CODES = {'408', '429', '500', '502', '503', '504', 'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003'}
+
+class CircuitOpenError(Exception):
+    """
+    サーキットブレーカーが開いている（接続先が停止中とみなしている）ため呼び出さなかった
+    """
+
+class CircuitBreaker:
+    """
+    接続先の障害が続いた場合に一定時間呼び出しを止め、再実行での負荷集中を防ぐ
+    closed: 通常 / open: 呼び出さずに失敗 / half_open: 試行を1件だけ通して回復を確認
+    """
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None: return 'closed'
+        if self._clock() - self._opened_at >= self.reset_timeout: return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """
+        呼び出してよいか（half_openの間は同時に1件だけ許可する）
+        """
+        with self._lock:
+            state = self._state()
+            if state == 'closed': return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+def is_transient(exc):
+    """
+    再試行で回復する見込みのあるエラーか（接続・タイムアウト・5xx等）
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError, CircuitOpenError)):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    return str(getattr(exc, 'code', '')) in TRANSIENT_CODES
+
+def is_unreachable(exc):
+    """
+    リクエストがサーバーに届いていないことが確実なエラーか（接続できなかった・ブレーカーで止めた）
+    """
+    if isinstance(exc, (CircuitOpenError, ConnectionRefusedError)):
+        return True
+    try:
+        import httpx
+        return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+    except ImportError:
+        return False
+
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    """
+    attempt回目（0始まり）の再試行までの待ち時間（フルジッター）
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def call_with_retry(func, breaker=None, attempts=RETRY_ATTEMPTS, sleep=time.sleep):
+    """
+    冪等な読み取り処理を、一時的な障害の場合のみ指数バックオフで再試行して実行する
+    breakerを指定した場合、開いている間は呼び出さずにCircuitOpenErrorを送出する
+    """
+    for attempt in range(attempts):
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError("接続先が応答しないため、しばらく取得を停止しています")
+        try:
+            result = func()
+        except Exception as e:
+            if not is_transient(e):
+                # 権限・構文エラー等は接続先の障害ではないので、ブレーカーの判定には含めない
+                if breaker is not None: breaker.record_success()
+                raise
+            if breaker is not None: breaker.record_failure()
+            if attempt == attempts - 1: raise
+            sleep(backoff_delay(attempt))
+            continue
+        if breaker is not None: breaker.record_success()
+        return result
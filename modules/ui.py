@@ -4,16 +4,21 @@ import datetime
 import io
 import openpyxl
 import re
-import time
 from .constants import (
-    MAP_PERSONS, MAP_ACTIVITIES, MAP_ASSETS, MAP_RELATED, MAP_SYSTEM, MAP_MASTER
+    MAP_PERSONS, MAP_ACTIVITIES, MAP_ASSETS, MAP_RELATED, MAP_SYSTEM, MAP_MASTER, PETTY_CASH_TYPES
 )
-from .utils import calculate_age, to_safe_id
+from .utils import calculate_age, format_date
 from .database import (
-    fetch_table, insert_data, update_data, delete_data, process_import, check_usage_count
+    fetch_table, insert_data, update_data, delete_data, delete_many, process_import,
+    get_master_options, get_usage_counts, rename_master_option, update_master_orders,
+    get_petty_cash_balance, get_petty_cash_ledger, get_write_status, retry_write, discard_write,
+    get_journal_status, replay_journal, retry_journal_entry, discard_journal_entry, export_csv
 )
 from .ai import summarize_text
 from .report_generator import create_periodic_report
+from .person_index import get_person_index
+from .metrics import get_session_metrics, get_process_metrics
+from .backup import create_backup, restore_backup
 
 # --- CSSロード ---
 def load_css():
@@ -111,7 +116,7 @@ def fill_excel_template(template_file, data_dict):
                         new_text = text
                         for key in matches:
                             if key in data_dict:
-                                val = str(data_dict[key]) if data_dict[key] is not None else ""
+                                val = format_date(data_dict[key])
                                 new_text = new_text.replace(f'{{{{{key}}}}}', val)
                         cell.value = new_text
     output = io.BytesIO()
@@ -160,16 +165,54 @@ def render_sidebar():
                 st.session_state.current_menu = key_val
                 st.session_state['close_sidebar_flag'] = True
                 st.rerun()
+        render_write_status()
     return st.session_state.current_menu
 
+def render_write_status():
+    """
+    このセッションの送信待ち・送信に失敗した書き込み（一時保存した書き込み・書き込みキュー）を表示する
+    """
+    pending_count, failed_entries = get_journal_status()
+    if pending_count:
+        st.caption(f"📥 未送信 {pending_count}件（一時保存済み）")
+        if st.button("今すぐ送信", key="replay_journal", use_container_width=True):
+            replay_journal(force=True)
+            st.rerun()
+    for entry in failed_entries:
+        st.error(f"保存していた書き込みを送信できませんでした ({entry['table_name']}): {entry['error']}")
+        c_retry, c_discard = st.columns(2)
+        if c_retry.button("再送", key=f"retry_journal_{entry['seq']}"):
+            retry_journal_entry(entry['seq'])
+            st.rerun()
+        if c_discard.button("破棄", key=f"discard_journal_{entry['seq']}"):
+            discard_journal_entry(entry['seq'], entry['table_name'])
+            st.rerun()
+
+    ops = get_write_status()
+    if not ops: return
+    waiting = [op for op in ops if op['status'] != 'failed']
+    if waiting:
+        st.caption(f"⏳ 送信待ち {len(waiting)}件")
+        if st.button("状態を更新", key="refresh_write_status", use_container_width=True):
+            st.rerun()
+    kind_labels = {'insert': '登録', 'update': '更新', 'delete': '削除'}
+    for op in ops:
+        if op['status'] != 'failed': continue
+        st.error(f"{kind_labels.get(op['kind'], op['kind'])}に失敗しました ({op['table']}): {op['error']}")
+        c_retry, c_discard = st.columns(2)
+        if c_retry.button("再送", key=f"retry_write_{op['op_id']}"):
+            retry_write(op['op_id'])
+            st.rerun()
+        if c_discard.button("破棄", key=f"discard_write_{op['op_id']}"):
+            discard_write(op['op_id'])
+            st.rerun()
+
 def render_activity_log(df_persons, act_opts):
-    df_activities = fetch_table("activities", MAP_ACTIVITIES)
-    df_related = fetch_table("related_parties", MAP_RELATED)
-    
     custom_header("受任中利用者一覧", help_text="一覧から対象者をクリックすると詳細が表示されます。")
     
     if not df_persons.empty and '現在の状態' in df_persons.columns:
-        mask = df_persons['現在の状態'].fillna('').astype(str).isin(['受任中', '', 'nan'])
+        status = df_persons['現在の状態']
+        mask = status.isna() | status.astype(object).isin(['受任中', '', 'nan'])
         df_active = df_persons[mask].copy()
         if df_active.empty: df_active = df_persons.copy()
     else:
@@ -182,6 +225,7 @@ def render_activity_log(df_persons, act_opts):
         df_display,
         column_config={
             "ケース番号": st.column_config.TextColumn("No."),
+            "生年月日": st.column_config.DateColumn("生年月日", format="YYYY-MM-DD"),
             "年齢": st.column_config.NumberColumn("年齢", format="%d歳"),
             "類型": st.column_config.TextColumn("後見類型"),
         },
@@ -191,7 +235,7 @@ def render_activity_log(df_persons, act_opts):
     if selection.selection.rows:
         idx = selection.selection.rows[0]
         selected_row = df_active.iloc[idx]
-        current_pid = selected_row['person_id']
+        current_pid = int(selected_row['person_id'])
         st.session_state.selected_person_id = current_pid
         
         st.markdown("---")
@@ -199,15 +243,14 @@ def render_activity_log(df_persons, act_opts):
         age_str = f" ({int(age_val)}歳)" if pd.notnull(age_val) else ""
         custom_header(f"{selected_row.get('氏名')}{age_str} さんの詳細・活動記録")
 
+        # 選択中の利用者のデータのみSupabase側で絞り込んで取得（利用者ごとにキャッシュ）
+        person_index = get_person_index()
+        df_activities = person_index.rows("activities", current_pid)
+        df_related = person_index.rows("related_parties", current_pid)
+
         kp_html = ""
         if not df_related.empty:
-            df_related['safe_pid'] = df_related['person_id'].apply(to_safe_id)
-            current_pid_safe = to_safe_id(current_pid)
-            
-            kp_df = df_related[
-                (df_related['safe_pid'] == current_pid_safe) & 
-                (df_related['キーパーソン'] == True)
-            ]
+            kp_df = df_related[df_related['キーパーソン'] == True]
             if not kp_df.empty:
                 kp_html = "<div style='margin-top:8px; padding-top:8px; border-top:1px dashed #ccc; width:100%; grid-column: 1 / -1;'>"
                 kp_html += "<div><b>★ キーパーソン:</b></div>"
@@ -225,12 +268,12 @@ def render_activity_log(df_persons, act_opts):
                 <div><span style="font-weight:bold; color:#555;">類型:</span> {selected_row.get('類型')}</div>
                 <div><span style="font-weight:bold; color:#555;">氏名:</span> {selected_row.get('氏名')}</div>
                 <div><span style="font-weight:bold; color:#555;">ｼﾒｲ:</span> {selected_row.get('ｼﾒｲ')}</div>
-                <div><span style="font-weight:bold; color:#555;">生年月日:</span> {selected_row.get('生年月日')}</div>
+                <div><span style="font-weight:bold; color:#555;">生年月日:</span> {format_date(selected_row.get('生年月日'))}</div>
                 <div style="grid-column: 1 / -1;"><span style="font-weight:bold; color:#555;">住所:</span> {selected_row.get('住所') or '-'}</div>
                 <div style="grid-column: 1 / -1;"><span style="font-weight:bold; color:#555;">居所:</span> {selected_row.get('居所') or '-'}</div>
                 <div><span style="font-weight:bold; color:#555;">障害類型:</span> {selected_row.get('障害類型')}</div>
                 <div><span style="font-weight:bold; color:#555;">申立人:</span> {selected_row.get('申立人')}</div>
-                <div><span style="font-weight:bold; color:#555;">審判日:</span> {selected_row.get('審判確定日')}</div>
+                <div><span style="font-weight:bold; color:#555;">審判日:</span> {format_date(selected_row.get('審判確定日'))}</div>
                 <div><span style="font-weight:bold; color:#555;">家裁:</span> {selected_row.get('管轄家裁')}</div>
                 <div><span style="font-weight:bold; color:#555;">報告月:</span> {selected_row.get('家裁報告月')}</div>
                 <div><span style="font-weight:bold; color:#555;">状態:</span> {selected_row.get('現在の状態')}</div>
@@ -306,14 +349,10 @@ def render_activity_log(df_persons, act_opts):
 
         custom_header("過去の活動履歴", help_text="履歴の「詳細・操作」を開くと編集・削除ができます。")
         if not df_activities.empty:
-            df_activities['safe_pid'] = df_activities['person_id'].apply(to_safe_id)
-            current_pid_safe = to_safe_id(current_pid)
-            
-            my_acts = df_activities[(df_activities['safe_pid'] == current_pid_safe) & (df_activities['場所'] != '現金出納')].copy()
+            my_acts = df_activities[df_activities['場所'] != '現金出納'].copy()
             
             if not my_acts.empty:
                 if '作成日時' in my_acts.columns:
-                    my_acts['作成日時'] = pd.to_datetime(my_acts['作成日時'], errors='coerce')
                     my_acts = my_acts.sort_values(by=['記録日', '作成日時'], ascending=[False, False])
                 else:
                     my_acts = my_acts.sort_values('記録日', ascending=False)
@@ -382,22 +421,22 @@ def render_activity_log(df_persons, act_opts):
                         else:
                             # 閲覧モード
                             summary = row.get('要点', '') or ''
-                            label_text = f"{star} {row['記録日']} | {summary}"
+                            label_text = f"{star} {format_date(row['記録日'])} | {summary}"
                             
                             with st.expander(label_text, expanded=False):
                                 st.markdown(f"**活動種別:** {row['活動']}")
                                 st.markdown(f"""
                                 - **摘要:** {row.get('場所') or '-'}
-                                - **時間:** {row.get('所要時間') or '0'} 分
-                                - **費用:** {row.get('交通費・立替金') or '0'} 円
+                                - **時間:** {0 if pd.isna(row.get('所要時間')) else row.get('所要時間')} 分
+                                - **費用:** {0 if pd.isna(row.get('交通費・立替金')) else row.get('交通費・立替金')} 円
                                 """)
                                 st.markdown("---")
                                 c_ed, c_dl = st.columns(2)
                                 if c_ed.button("編集", key=f"ed_act_{row['activity_id']}"):
-                                    st.session_state.edit_activity_id = row['activity_id']
+                                    st.session_state.edit_activity_id = int(row['activity_id'])
                                     st.rerun()
                                 if c_dl.button("削除", key=f"dl_act_{row['activity_id']}"):
-                                    st.session_state.delete_confirm_id = row['activity_id']
+                                    st.session_state.delete_confirm_id = int(row['activity_id'])
                                     st.rerun()
                                 
                                 if st.session_state.delete_confirm_id == row['activity_id']:
@@ -412,16 +451,11 @@ def render_activity_log(df_persons, act_opts):
 
 def render_related_parties(df_persons, rel_opts):
     custom_header("関係者・連絡先")
-    person_opts = {f"{r['氏名']}": r['person_id'] for _, r in df_persons.iterrows()}
+    person_index = get_person_index()
+    person_opts = person_index.name_to_id
     
     # 選択状態の維持ロジック
-    default_idx = 0
-    if st.session_state.selected_person_id:
-        # 名前（キー）を探す
-        for i, (name, pid) in enumerate(person_opts.items()):
-            if pid == st.session_state.selected_person_id:
-                default_idx = i
-                break
+    default_idx = person_index.position_of(st.session_state.selected_person_id)
     
     target_name = st.selectbox("対象者", list(person_opts.keys()), index=default_idx)
     
@@ -434,11 +468,7 @@ def render_related_parties(df_persons, rel_opts):
         
         # 編集フォーム
         if st.session_state.edit_related_id:
-            df_rel_all = fetch_table("related_parties", MAP_RELATED)
-            df_rel_all['related_id'] = df_rel_all['related_id'].apply(to_safe_id)
-            target_rid_safe = to_safe_id(st.session_state.edit_related_id)
-            
-            edit_rows = df_rel_all[df_rel_all['related_id'] == target_rid_safe]
+            edit_rows = fetch_table("related_parties", MAP_RELATED, filters={'related_id': st.session_state.edit_related_id})
             if not edit_rows.empty:
                 edit_row = edit_rows.iloc[0]
                 st.markdown(f"#### ✏️ 編集: {edit_row['氏名']}")
@@ -493,12 +523,8 @@ def render_related_parties(df_persons, rel_opts):
                         st.rerun()
         
         st.markdown("---")
-        df_rel = fetch_table("related_parties", MAP_RELATED)
-        if not df_rel.empty:
-            df_rel['safe_pid'] = df_rel['person_id'].apply(to_safe_id)
-            current_pid_safe = to_safe_id(pid)
-            my_rel = df_rel[df_rel['safe_pid'] == current_pid_safe]
-            
+        my_rel = person_index.rows("related_parties", pid)
+        if not my_rel.empty:
             for _, row in my_rel.iterrows():
                 kp_mark = "★" if str(row.get('キーパーソン', '')).upper() == 'TRUE' else ""
                 label_text = f"{kp_mark}【{row['関係種別']}】 {row['氏名']} ({row['所属・名称']})"
@@ -513,7 +539,7 @@ def render_related_parties(df_persons, rel_opts):
                     
                     c_ed, c_dl = st.columns(2)
                     if c_ed.button("編集", key=f"rel_edit_{row['related_id']}"):
-                        st.session_state.edit_related_id = row['related_id']
+                        st.session_state.edit_related_id = int(row['related_id'])
                         st.rerun()
                     if c_dl.button("削除", key=f"del_rel_{row['related_id']}"):
                         if delete_data("related_parties", "related_id", row['related_id'], MAP_RELATED):
@@ -523,15 +549,11 @@ def render_related_parties(df_persons, rel_opts):
 
 def render_assets_management(df_persons, ast_opts):
     custom_header("財産管理")
-    person_opts = {f"{r['氏名']}": r['person_id'] for _, r in df_persons.iterrows()}
+    person_index = get_person_index()
+    person_opts = person_index.name_to_id
     
     # 選択状態の維持ロジック
-    default_idx = 0
-    if st.session_state.selected_person_id:
-        for i, (name, pid) in enumerate(person_opts.items()):
-            if pid == st.session_state.selected_person_id:
-                default_idx = i
-                break
+    default_idx = person_index.position_of(st.session_state.selected_person_id)
 
     target_name = st.selectbox("対象者", list(person_opts.keys()), index=default_idx)
     
@@ -565,14 +587,11 @@ def render_assets_management(df_persons, ast_opts):
                             st.rerun()
             
             st.markdown("### 財産目録") # ヘッダー追加
-            df_assets = fetch_table("assets", MAP_ASSETS)
-            if not df_assets.empty:
-                df_assets['safe_pid'] = df_assets['person_id'].apply(to_safe_id)
-                current_pid_safe = to_safe_id(pid)
-                my_assets = df_assets[df_assets['safe_pid'] == current_pid_safe]
-                
+            my_assets = person_index.rows("assets", pid)
+            if not my_assets.empty:
                 for _, row in my_assets.iterrows():
-                    label_text = f"【{row['財産種別']}】 {row['名称・機関名']} ({row['評価額・残高']})"
+                    val_str = "" if pd.isna(row['評価額・残高']) else f"{row['評価額・残高']:,}"
+                    label_text = f"【{row['財産種別']}】 {row['名称・機関名']} ({val_str})"
                     with st.expander(label_text, expanded=False):
                         st.markdown(f"""
                         - **詳細:** {row['支店・詳細']}
@@ -582,7 +601,7 @@ def render_assets_management(df_persons, ast_opts):
                         """)
                         c_ed, c_dl = st.columns(2)
                         if c_ed.button("編集", key=f"ast_edit_{row['asset_id']}"):
-                            st.session_state.edit_asset_id = row['asset_id']
+                            st.session_state.edit_asset_id = int(row['asset_id'])
                             st.rerun()
                         if c_dl.button("削除", key=f"del_ast_{row['asset_id']}"):
                             if delete_data("assets", "asset_id", row['asset_id'], MAP_ASSETS):
@@ -600,7 +619,7 @@ def render_assets_management(df_persons, ast_opts):
                             c3, c4 = st.columns(2)
                             ea_det = c3.text_input("詳細", value=row['支店・詳細'])
                             ea_num = c4.text_input("口座番号等", value=row['口座番号・記号'])
-                            ea_val = c1.text_input("評価額", value=row['評価額・残高'])
+                            ea_val = c1.text_input("評価額", value="" if pd.isna(row['評価額・残高']) else str(row['評価額・残高']))
                             ea_loc = c2.text_input("保管場所", value=row['保管場所'])
                             ea_rem = st.text_area("備考", value=row['備考'])
                             
@@ -620,31 +639,8 @@ def render_assets_management(df_persons, ast_opts):
             st.markdown("### 💰 小口現金出納帳")
             st.caption("日々の現金管理（入金・出金）を記録します。")
             
-            # データ取得と計算
-            df_act = fetch_table("activities", MAP_ACTIVITIES)
-            balance = 0
-            my_cash_logs = pd.DataFrame()
-
-            if not df_act.empty:
-                df_act['safe_pid'] = df_act['person_id'].apply(to_safe_id)
-                current_pid_safe = to_safe_id(pid)
-                # 入金・出金のみ抽出
-                mask = (df_act['safe_pid'] == current_pid_safe) & (df_act['活動'].isin(['入金', '出金']))
-                my_cash_logs = df_act[mask].copy()
-                
-                if not my_cash_logs.empty:
-                    # 日付順でソート
-                    my_cash_logs['記録日'] = pd.to_datetime(my_cash_logs['記録日'])
-                    if '作成日時' in my_cash_logs.columns:
-                        my_cash_logs['作成日時'] = pd.to_datetime(my_cash_logs['作成日時'], errors='coerce')
-                        my_cash_logs = my_cash_logs.sort_values(by=['記録日', '作成日時'], ascending=[True, True])
-                    else:
-                        my_cash_logs = my_cash_logs.sort_values(by='記録日', ascending=True)
-
-                    # 残高計算
-                    ttl_in = my_cash_logs[my_cash_logs['活動'] == '入金']['交通費・立替金'].sum()
-                    ttl_out = my_cash_logs[my_cash_logs['活動'] == '出金']['交通費・立替金'].sum()
-                    balance = ttl_in - ttl_out
+            # 残高はデータベース側で集計（履歴の件数によらず1回の小さな問い合わせ）
+            balance = get_petty_cash_balance(pid)
             
             # 残高表示
             st.metric("現在残高 (現金)", f"¥{int(balance):,}")
@@ -681,23 +677,22 @@ def render_assets_management(df_persons, ast_opts):
                             if insert_data("activities", new_cash_data, MAP_ACTIVITIES):
                                 st.rerun()
 
-            # 履歴表示
+            # 履歴表示（期間を指定した場合も、残高は期間より前の記録を含めて計算される）
+            c_from, c_to = st.columns(2)
+            ledger_from = c_from.date_input("表示期間（開始）", value=None, key="cash_from", format="YYYY/MM/DD")
+            ledger_to = c_to.date_input("表示期間（終了）", value=None, key="cash_to", format="YYYY/MM/DD")
+            my_cash_logs = get_petty_cash_ledger(pid, ledger_from, ledger_to)
             if not my_cash_logs.empty:
                 st.markdown("#### 履歴")
                 
                 # 表示用データフレーム作成
                 disp_logs = my_cash_logs.copy()
-                
-                # 残高計算
-                disp_logs['signed_amount'] = disp_logs.apply(
-                    lambda x: x['交通費・立替金'] if x['活動'] == '入金' else -x['交通費・立替金'], axis=1
-                )
-                disp_logs['balance'] = disp_logs['signed_amount'].cumsum()
-
+                is_in = disp_logs['活動'] == '入金'
+                amount_str = disp_logs['交通費・立替金'].fillna(0).map(lambda x: f"¥{int(x):,}")
                 disp_logs['日付'] = disp_logs['記録日'].dt.strftime('%Y/%m/%d')
-                disp_logs['入金'] = disp_logs.apply(lambda x: f"¥{int(x['交通費・立替金']):,}" if x['活動'] == '入金' else "-", axis=1)
-                disp_logs['出金'] = disp_logs.apply(lambda x: f"¥{int(x['交通費・立替金']):,}" if x['活動'] == '出金' else "-", axis=1)
-                disp_logs['残高'] = disp_logs['balance'].apply(lambda x: f"¥{int(x):,}")
+                disp_logs['入金'] = amount_str.where(is_in, "-")
+                disp_logs['出金'] = amount_str.where(~is_in, "-")
+                disp_logs['残高'] = disp_logs['残高'].fillna(0).map(lambda x: f"¥{int(x):,}")
                 disp_logs['摘要'] = disp_logs['要点']
                 
                 # テーブル表示
@@ -713,7 +708,7 @@ def render_assets_management(df_persons, ast_opts):
 
                 with st.expander("修正・削除"):
                     # 編集対象の選択
-                    act_opts_edit = {f"{row['日付']} {row['活動']} {row['摘要']} (¥{row['交通費・立替金']:,})": row['activity_id'] for _, row in disp_logs.sort_values('記録日', ascending=False).iterrows()}
+                    act_opts_edit = {f"{row['日付']} {row['活動']} {row['摘要']} (¥{row['交通費・立替金']:,})": int(row['activity_id']) for _, row in disp_logs.sort_values('記録日', ascending=False).iterrows()}
                     
                     # セレクトボックスで対象を選択（デフォルトは選択なし）
                     selected_edit_label = st.selectbox("修正・削除する項目を選択", ["(選択してください)"] + list(act_opts_edit.keys()), key="sel_cash_edit")
@@ -766,14 +761,11 @@ def render_assets_management(df_persons, ast_opts):
                     st.caption("重複データなどが発生した場合に、この利用者の**小口現金記録を全て削除**します。")
                     if st.checkbox("全ての小口現金記録を削除する（取り消せません）", key="chk_del_all"):
                         if st.button("一括削除を実行", type="primary", key="btn_del_all"):
-                            del_count = 0
-                            # my_cash_logs は既にこのユーザーの小口現金データのみ
-                            for _, row in my_cash_logs.iterrows():
-                                delete_data("activities", "activity_id", row['activity_id'], MAP_ACTIVITIES)
-                                del_count += 1
-                            st.success(f"{del_count}件のデータを削除しました。")
-                            time.sleep(1)
-                            st.rerun()
+                            # この利用者の入金・出金を条件指定で1回のリクエストで削除
+                            del_count = delete_many("activities", "activity_id", MAP_ACTIVITIES, filters={'person_id': pid, '活動': ('in', PETTY_CASH_TYPES)})
+                            if del_count is not None:
+                                st.toast(f"{del_count}件のデータを削除しました。", icon="🗑️")
+                                st.rerun()
             else:
                 st.info("まだ記録がありません。")
 
@@ -820,6 +812,7 @@ def render_person_registration(df_persons, guard_opts):
             df_display,
             column_config={
                 "ケース番号": st.column_config.TextColumn("No."),
+                "生年月日": st.column_config.DateColumn("生年月日", format="YYYY-MM-DD"),
                 "年齢": st.column_config.NumberColumn("年齢", format="%d歳"),
             },
             use_container_width=True, on_select="rerun", selection_mode="single-row", hide_index=True
@@ -903,7 +896,7 @@ def render_reports(df_persons):
         # ここで選択を変えた場合もセッションに反映するかは任意だが、統一感を出すなら反映する
         selected_row = df_persons[df_persons['氏名'] == target]
         if not selected_row.empty:
-            pid = selected_row.iloc[0]['person_id']
+            pid = int(selected_row.iloc[0]['person_id'])
             if pid != st.session_state.selected_person_id:
                 st.session_state.selected_person_id = pid
         if st.button("作成") and uploaded:
@@ -927,10 +920,8 @@ def render_reports(df_persons):
             person_data = p_rows.iloc[0].to_dict()
             
             # 2. 財産情報
-            df_assets = fetch_table("assets", MAP_ASSETS)
-            df_assets['safe_pid'] = df_assets['person_id'].apply(to_safe_id)
-            current_pid_safe = to_safe_id(st.session_state.selected_person_id)
-            asset_rows = df_assets[df_assets['safe_pid'] == current_pid_safe].to_dict('records')
+            df_assets = get_person_index().rows("assets", st.session_state.selected_person_id)
+            asset_rows = df_assets.to_dict('records')
             
             # 3. 後見人情報 (システムユーザー)
             df_sys = fetch_table("app_system_user", MAP_SYSTEM)
@@ -948,6 +939,59 @@ def render_reports(df_persons):
                 st.success("作成しました！")
                 st.download_button("📥 定期報告書をダウンロード", excel_out, f"定期報告書_{person_data['氏名']}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
+def _clear_session_key(key):
+    st.session_state.pop(key, None)
+
+def render_csv_export(table_name, mapping_dict, file_name, filters=None, label="CSVエクスポート"):
+    """
+    CSVエクスポート（ボタンを押した時点の内容で作成し、ダウンロードしたら破棄する）
+    """
+    key = f"csv_export_{file_name}"
+    if st.button(label, key=f"btn_{key}"):
+        csv_exp = export_csv(table_name, mapping_dict, filters)
+        if csv_exp is None:
+            st.session_state.pop(key, None)
+            st.error("最新のデータを取得できないため、エクスポートできませんでした。時間をおいて再度お試しください。")
+        else:
+            st.session_state[key] = csv_exp
+    if st.session_state.get(key) is not None:
+        st.download_button(f"{label}（ダウンロード）", st.session_state[key], file_name, "text/csv", key=f"dl_{key}",
+                           on_click=_clear_session_key, args=(key,))
+
+def render_backup():
+    """
+    全テーブルの一括バックアップ（ZIP）と、バックアップからの復元
+    """
+    st.subheader("一括バックアップ・復元")
+    if st.button("一括バックアップを作成", key="btn_backup"):
+        try:
+            with st.spinner("全テーブルを取得しています..."):
+                st.session_state.backup_zip = create_backup()
+                st.session_state.backup_name = f"backup_{datetime.datetime.now():%Y%m%d_%H%M%S}.zip"
+        except Exception as e:
+            st.error(f"バックアップの作成に失敗しました: {e}")
+    if st.session_state.get('backup_zip'):
+        # ダウンロード後はZIPをセッションに残さない（全データのコピーのため）
+        st.download_button("バックアップをダウンロード (ZIP)", st.session_state.backup_zip, st.session_state.backup_name,
+                           "application/zip", key="dl_backup", on_click=_clear_session_key, args=('backup_zip',))
+
+    with st.expander("バックアップから復元", expanded=False):
+        st.caption("IDが同じ行はバックアップの内容で上書きされます。バックアップにない行は削除されません。")
+        up = st.file_uploader("バックアップファイル (ZIP)", type=["zip"], key="restore_zip")
+        confirmed = st.checkbox("現在のデータに上書きすることを確認しました", key="restore_confirm")
+        if up and st.button("復元を実行", key="btn_restore", disabled=not confirmed):
+            try:
+                with st.spinner("復元しています..."):
+                    report = restore_backup(up)
+            except Exception as e:
+                st.error(f"復元できませんでした: {e}")
+            else:
+                st.dataframe(report, hide_index=True, use_container_width=True)
+                if (report['検証'] == 'OK').all():
+                    st.success("復元が完了しました")
+                else:
+                    st.warning("件数またはIDが一致しないテーブルがあります（バックアップにない行が残っている場合も件数は一致しません）。上の表を確認してください。")
+
 def render_data_management():
     custom_header("データ管理")
     st.info("Supabaseへのデータ移行用です。")
@@ -955,55 +999,61 @@ def render_data_management():
     tab1, tab2, tab_cash, tab3, tab4, tab5 = st.tabs(["利用者", "活動", "小口現金", "財産", "関係者", "システム"])
     
     with tab1:
-        csv_exp = fetch_table("persons", MAP_PERSONS).to_csv(index=False).encode('cp932')
-        st.download_button("CSVエクスポート", csv_exp, "Persons.csv", "text/csv")
+        render_csv_export("persons", MAP_PERSONS, "Persons.csv")
         up = st.file_uploader("インポート (Persons)")
         if up and st.button("実行", key="imp_p"):
             process_import(up, "persons", MAP_PERSONS, "person_id")
 
     with tab2:
-        csv_exp = fetch_table("activities", MAP_ACTIVITIES).to_csv(index=False).encode('cp932')
-        st.download_button("CSVエクスポート", csv_exp, "Activities.csv", "text/csv")
+        render_csv_export("activities", MAP_ACTIVITIES, "Activities.csv")
         up = st.file_uploader("インポート (Activities)")
         if up and st.button("実行", key="imp_a"):
             process_import(up, "activities", MAP_ACTIVITIES, "activity_id")
 
     with tab_cash:
         # 小口現金（入金・出金）のみ抽出してエクスポート
-        df_act = fetch_table("activities", MAP_ACTIVITIES)
-        if not df_act.empty and '活動' in df_act.columns:
-            df_cash = df_act[df_act['活動'].isin(['入金', '出金'])]
-        else:
-            df_cash = pd.DataFrame(columns=MAP_ACTIVITIES.keys())
-        
-        csv_exp = df_cash.to_csv(index=False).encode('cp932')
-        st.download_button("CSVエクスポート (小口現金)", csv_exp, "PettyCash.csv", "text/csv")
+        render_csv_export("activities", MAP_ACTIVITIES, "PettyCash.csv", filters={'活動': ('in', PETTY_CASH_TYPES)},
+                          label="CSVエクスポート (小口現金)")
         st.caption("※インポートは通常の活動データとして取り込まれます。")
         up = st.file_uploader("インポート (小口現金)")
         if up and st.button("実行", key="imp_cash"):
             process_import(up, "activities", MAP_ACTIVITIES, "activity_id")
     
     with tab3:
-        csv_exp = fetch_table("assets", MAP_ASSETS).to_csv(index=False).encode('cp932')
-        st.download_button("CSVエクスポート", csv_exp, "Assets.csv", "text/csv")
+        render_csv_export("assets", MAP_ASSETS, "Assets.csv")
         up = st.file_uploader("インポート (Assets)")
         if up and st.button("実行", key="imp_ast"):
             process_import(up, "assets", MAP_ASSETS, "asset_id")
     
     with tab4:
-        csv_exp = fetch_table("related_parties", MAP_RELATED).to_csv(index=False).encode('cp932')
-        st.download_button("CSVエクスポート", csv_exp, "RelatedParties.csv", "text/csv")
+        render_csv_export("related_parties", MAP_RELATED, "RelatedParties.csv")
         up = st.file_uploader("インポート (Related)")
         if up and st.button("実行", key="imp_rel"):
             process_import(up, "related_parties", MAP_RELATED, "related_id")
 
     with tab5:
-        csv_exp = fetch_table("app_system_user", MAP_SYSTEM).to_csv(index=False).encode('cp932')
-        st.download_button("CSVエクスポート", csv_exp, "SystemUser.csv", "text/csv")
+        render_csv_export("app_system_user", MAP_SYSTEM, "SystemUser.csv")
         up = st.file_uploader("インポート (SystemUser)")
         if up and st.button("実行", key="imp_sys"):
             process_import(up, "app_system_user", MAP_SYSTEM, "id")
 
+    st.markdown("---")
+    render_backup()
+
+    st.markdown("---")
+    with st.expander("📊 データベース呼び出しの計測", expanded=False):
+        st.caption("Supabaseへの取得・書き込みの回数と所要時間です（取得元 cache / replica はサーバーへの通信なし）。")
+        scope = st.radio("集計範囲", ["このセッション", "サーバー全体"], horizontal=True, key="metrics_scope")
+        registry = get_session_metrics() if scope == "このセッション" else get_process_metrics()
+        summary = registry.summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary).sort_values('total_sec', ascending=False), hide_index=True, use_container_width=True)
+        else:
+            st.write("まだ記録がありません。")
+        c1, c2 = st.columns(2)
+        c1.download_button("記録をダウンロード (JSON Lines)", registry.to_jsonl(), "db_calls.jsonl", "application/json")
+        c2.download_button("集計をダウンロード (Prometheus)", registry.to_prometheus(), "db_metrics.prom", "text/plain")
+
 def render_settings():
     custom_header("初期設定")
     
@@ -1017,21 +1067,53 @@ def render_settings():
         "後見類型": "guardian_type"
     }
     
-    df_master = fetch_table("master_options", MAP_MASTER)
+    master = get_master_options()
     
     for i, (label, cat_key) in enumerate(master_cats.items()):
         with tabs_m[i]:
-            if not df_master.empty:
-                current_opts = df_master[df_master['カテゴリ'] == cat_key].sort_values('順序')
-                for _, row in current_opts.iterrows():
-                    c1, c2 = st.columns([8, 2])
-                    c1.write(f"{row['名称']} (順序:{row['順序']})")
-                    if c2.button("削除", key=f"del_mst_{row['id']}"):
-                        usage = check_usage_count(cat_key, row['名称'])
-                        if usage > 0:
-                            st.error(f"「{row['名称']}」は現在 {usage} 件のデータで使用されているため削除できません。")
-                        else:
-                            if delete_data("master_options", "id", row['id'], MAP_MASTER):
+            usage_counts = get_usage_counts(cat_key) if master.names.get(cat_key) else {}
+            for name in master.names.get(cat_key, []):
+                option_id = master.ids[cat_key][name]
+                order = master.orders[cat_key][name]
+                usage = usage_counts.get(name, 0) if usage_counts is not None else None
+                usage_str = "使用件数:不明" if usage is None else f"使用:{usage}件"
+                c1, c2 = st.columns([8, 2])
+                c1.write(f"{name} (順序:{'' if order is None else order} / {usage_str})")
+                if c2.button("削除", key=f"del_mst_{option_id}"):
+                    if usage is None:
+                        st.error(f"「{name}」の使用件数を確認できないため削除できません。")
+                    elif usage > 0:
+                        st.error(f"「{name}」は現在 {usage} 件のデータで使用されているため削除できません。")
+                    else:
+                        if delete_data("master_options", "id", option_id, MAP_MASTER):
+                            st.rerun()
+
+            if master.names.get(cat_key):
+                with st.expander("↕️ 並び順の変更", expanded=False):
+                    df_order = pd.DataFrame({
+                        '名称': master.names[cat_key],
+                        '順序': pd.array([master.orders[cat_key][n] for n in master.names[cat_key]], dtype='Int64'),
+                    })
+                    edited = st.data_editor(
+                        df_order, key=f"order_mst_{cat_key}", hide_index=True, use_container_width=True,
+                        disabled=['名称'], num_rows="fixed",
+                        column_config={"順序": st.column_config.NumberColumn("順序", min_value=0, step=1)}
+                    )
+                    if st.button("並び順を保存", key=f"save_order_{cat_key}"):
+                        updated = update_master_orders(cat_key, dict(zip(edited['名称'], edited['順序'])))
+                        if updated:
+                            st.toast(f"{updated}件の順序を更新しました", icon="✅")
+                            st.rerun()
+                        elif updated == 0:
+                            st.info("変更はありません。")
+
+                with st.expander("✏️ 名称の変更", expanded=False):
+                    with st.form(f"rename_mst_{cat_key}"):
+                        r_old = st.selectbox("変更する項目", master.names[cat_key])
+                        r_new = st.text_input("新しい名称")
+                        st.caption("この項目を使用している既存のデータもすべて新しい名称に変更されます。")
+                        if st.form_submit_button("変更"):
+                            if rename_master_option(cat_key, master.ids[cat_key][r_old], r_old, r_new):
                                 st.rerun()
 
             with st.form(f"add_mst_{cat_key}"):
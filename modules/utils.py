@@ -2,6 +2,26 @@ import pandas as pd
 import datetime
 import re
 
+# 和暦の元号と元年の西暦
+ERAS = {'明治': 1868, '大正': 1912, '昭和': 1926, '平成': 1989, '令和': 2019,
+        'M': 1868, 'T': 1912, 'S': 1926, 'H': 1989, 'R': 2019}
+ERA_PATTERN = r'(明治|大正|昭和|平成|令和|[MTSHR])\s*(\d+|元)\D+(\d+)\D+(\d+)'
+FULLWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+
+# 真偽値として扱う文字列（インポート用）
+TRUE_STRINGS = {'true', 't', '1', 'yes', 'y', 'on', '○', '〇', '★', 'はい', '有'}
+FALSE_STRINGS = {'false', 'f', '0', 'no', 'n', 'off', '×', 'いいえ', '無'}
+
+# pandas 2.0以降は書式の混在した日付列の一括変換に format='mixed' が必要
+PANDAS_2 = int(pd.__version__.split('.')[0]) >= 2
+
+# 文字列カラムの型（pyarrowがあればメモリ効率のよいArrow形式を使う）
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype('pyarrow')
+except ImportError:
+    STRING_DTYPE = pd.StringDtype()
+
 def normalize_date_str(date_val):
     """
     日付文字列を正規化して 'YYYY-MM-DD' 形式で返す関数
@@ -12,21 +32,14 @@ def normalize_date_str(date_val):
     if not text or text.lower() == "nan": return ""
     
     # 全角数字を半角に
-    text = text.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
+    text = text.translate(FULLWIDTH_DIGITS)
     
     # 和暦対応
-    eras = {'明治': 1868, '大正': 1912, '昭和': 1926, '平成': 1989, '令和': 2019,
-            'M': 1868, 'T': 1912, 'S': 1926, 'H': 1989, 'R': 2019}
-    match = re.match(r'([明治大正昭和平成令和MTSHR])\s*(\d+)\D+(\d+)\D+(\d+)', text, re.IGNORECASE)
+    match = re.match(ERA_PATTERN, text, re.IGNORECASE)
     if match:
         era_str, year_str, month_str, day_str = match.groups()
-        era_str = era_str.upper()
-        base_year = 1900
-        for k, v in eras.items():
-            if k == era_str:
-                base_year = v
-                break
-        year = int(year_str)
+        base_year = ERAS.get(era_str.upper(), 1900)
+        year = 1 if year_str == '元' else int(year_str)
         west_year = base_year + year - 1 if year > 0 else base_year
         return f"{west_year}-{int(month_str):02d}-{int(day_str):02d}"
     
@@ -53,13 +66,128 @@ def calculate_age(born):
     except (ValueError, TypeError):
         return None
 
-def to_safe_id(val):
+def to_int_id(val):
     """
-    IDを安全な文字列形式に変換する関数
+    IDを整数に変換する関数（変換できない場合はNone）
     """
-    if pd.isna(val) or val == "":
-        return ""
+    if val is None or (not isinstance(val, str) and pd.isna(val)):
+        return None
     try:
-        return str(int(float(val)))
+        return int(float(val))
     except (ValueError, TypeError, OverflowError):
-        return str(val)
+        return None
+
+def normalize_date_series(series):
+    """
+    日付の列をまとめて 'YYYY-MM-DD' 形式に正規化する（normalize_date_str の列版）
+    和暦にも対応し、解釈できない値は元の文字列のまま、空欄はNoneを返す
+    """
+    text = series.astype('string').str.strip().str.translate(FULLWIDTH_DIGITS)
+    text = text.mask(text.eq('') | text.str.lower().eq('nan'))
+    parts = text.str.upper().str.extract('^' + ERA_PATTERN)
+    era_year = pd.to_numeric(parts[1].replace('元', '1'), errors='coerce')
+    west_year = (parts[0].map(ERAS).astype('Int64') + era_year.astype('Int64') - 1).astype('string')
+    wareki = pd.to_datetime(west_year + '-' + parts[2] + '-' + parts[3], errors='coerce', format='%Y-%m-%d')
+    seireki_text = text.where(parts[0].isna()).astype(object)
+    if PANDAS_2:
+        seireki = pd.to_datetime(seireki_text, errors='coerce', format='mixed')
+    else:
+        seireki = pd.to_datetime(seireki_text, errors='coerce')
+    dates = wareki.fillna(seireki)
+    result = dates.dt.strftime('%Y-%m-%d').astype(object)
+    result = result.where(dates.notna(), text.astype(object))
+    return result.where(text.notna(), None)
+
+def parse_int_series(series):
+    """
+    金額などの整数の列をまとめて数値化する（カンマ・円記号・全角数字に対応、変換できない値は欠損）
+    """
+    text = series.astype('string').str.translate(FULLWIDTH_DIGITS).str.replace(r'[,，円¥￥\s]', '', regex=True)
+    numbers = pd.to_numeric(text, errors='coerce')
+    return numbers.round().astype('Int64')
+
+def parse_bool_series(series):
+    """
+    真偽値の列をまとめて変換する（TRUE/FALSE、1/0、○/× など）
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype('boolean')
+    text = series.astype('string').str.strip().str.lower()
+    result = pd.Series(pd.NA, index=series.index, dtype='boolean')
+    result[text.isin(TRUE_STRINGS).fillna(False)] = True
+    result[text.isin(FALSE_STRINGS).fillna(False)] = False
+    return result
+
+def clean_columns(df, column_types, failures=None):
+    """
+    型定義（constants.TYPES_*）に従って列単位で値を整形する
+    failuresにdictを渡すと、値があるのに変換できず欠損になった行のindexを列ごとに格納する
+    """
+    cleaned = {}
+    for col in df.columns:
+        kind = column_types.get(col, 'text')
+        if kind in ('id', 'int'):
+            cleaned[col] = parse_int_series(df[col])
+        elif kind == 'date':
+            cleaned[col] = normalize_date_series(df[col])
+        elif kind == 'bool':
+            cleaned[col] = parse_bool_series(df[col])
+        else:
+            cleaned[col] = df[col]
+        if failures is not None and kind in ('id', 'int', 'bool'):
+            text = df[col].astype('string').str.strip()
+            failed = text.notna() & text.ne('') & cleaned[col].isna()
+            if failed.any():
+                failures[col] = list(df.index[failed.to_numpy(dtype=bool)])
+    return pd.DataFrame(cleaned, index=df.index)
+
+def _to_datetime(series, utc=False):
+    """
+    ISO形式の日付・日時の列をdatetime64に変換する（変換できない値はNaT）
+    """
+    if PANDAS_2:
+        return pd.to_datetime(series, errors='coerce', utc=utc, format='ISO8601')
+    return pd.to_datetime(series, errors='coerce', utc=utc)
+
+def apply_schema(df, column_types):
+    """
+    取得したDataFrameに型定義（constants.TYPES_*）を適用する（キャッシュ格納時に一度だけ実行）
+    IDと整数はInt64、日付はdatetime64、真偽値はboolean、選択肢はcategory、文字列はString型にする
+    文字列の欠損は空文字、真偽値の欠損はFalseとして扱う
+    """
+    for col in df.columns:
+        kind = column_types.get(col, 'text')
+        if kind == 'id':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        elif kind == 'int':
+            if pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+            else:
+                df[col] = parse_int_series(df[col])
+        elif kind == 'date':
+            df[col] = _to_datetime(df[col])
+        elif kind == 'datetime':
+            df[col] = _to_datetime(df[col], utc=True)
+        elif kind == 'bool':
+            df[col] = parse_bool_series(df[col]).fillna(False)
+        elif kind == 'category':
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = df[col].astype(STRING_DTYPE).fillna('')
+    return df
+
+def calculate_age_series(born):
+    """
+    生年月日（datetime64）の列から年齢の列をまとめて計算する
+    """
+    today = pd.Timestamp.today()
+    before_birthday = (born.dt.month > today.month) | ((born.dt.month == today.month) & (born.dt.day > today.day))
+    return (today.year - born.dt.year - before_birthday.astype(int)).astype('Int64')
+
+def format_date(val, fmt='%Y-%m-%d'):
+    """
+    日付を表示用の文字列に変換する（欠損は空文字）
+    """
+    if val is None or pd.isna(val): return ""
+    if hasattr(val, 'strftime'): return val.strftime(fmt)
+    return str(val)
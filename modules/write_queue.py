@@ -0,0 +1,237 @@
+import itertools
+import threading
+import time
+from collections import deque
+from postgrest.types import ReturnMethod
+from .resilience import call_with_retry, is_transient, is_unreachable
+from .metrics import Span
+
+# 送信前に待つ時間（秒）。この間に届いた書き込みをまとめて送る
+WRITE_BATCH_DELAY = 0.5
+# 1リクエストにまとめる最大件数
+WRITE_BATCH_SIZE = 200
+
+class WriteQueue:
+    """
+    書き込みを受け付け順にバックグラウンドで送信するキュー（write-behind）
+    同じ行への未送信の書き込みはまとめ、連続する同じテーブルへの登録・削除は1リクエストで送る
+    送信結果は drain_results() で受け取り、画面側のスレッドでキャッシュへ反映する
+    送信に失敗した行への後続の書き込みは、失敗した書き込みが再送または破棄されるまで送らない
+    """
+    def __init__(self, client, batch_delay=WRITE_BATCH_DELAY, batch_size=WRITE_BATCH_SIZE, registry=None):
+        self._client = client
+        # 送信の計測の記録先（送信スレッドにはセッションがないため、プロセス全体の計測を渡す）
+        self._registries = [registry] if registry is not None else []
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        self._queue = deque()   # 未送信の書き込み（受け付け順）
+        self._ops = {}          # 書き込みID -> 書き込み内容と状態
+        self._results = deque() # 送信が終わり、キャッシュへの反映待ちの書き込み
+        self._id_map = {}       # 仮ID（登録前の負の数） -> 登録後のID
+        self._blocked = set()   # 送信に失敗した書き込みの (テーブル, 対象ID)。後続の書き込みを止める
+        self._op_ids = itertools.count(1)
+        self._temp_ids = itertools.count(-1, -1)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def new_temp_id(self):
+        """
+        送信前の新規行に付ける仮ID（負の数）を返す
+        """
+        with self._cond:
+            return next(self._temp_ids)
+
+    def submit(self, table_name, kind, id_col_en, target_id=None, data=None, owner=None):
+        """
+        書き込みを受け付けて書き込みIDを返す（kind: insert / update / delete）
+        insertの場合、target_idには仮IDを指定する。ownerは書き込んだセッションの識別子
+        """
+        with self._cond:
+            pending = [op for op in self._queue if op['table'] == table_name and op['target_id'] == target_id]
+            if kind == 'update' and pending and pending[-1]['kind'] in ('insert', 'update'):
+                # 未送信の登録・更新に内容をまとめる
+                pending[-1]['data'].update(data)
+                return pending[-1]['op_id']
+            if kind == 'delete':
+                # 未送信の登録・更新は送る必要がなくなる
+                for op in pending:
+                    self._queue.remove(op)
+                    self._ops.pop(op['op_id'], None)
+                if any(op['kind'] == 'insert' for op in pending):
+                    return pending[0]['op_id']
+            op = {
+                'op_id': next(self._op_ids), 'table': table_name, 'kind': kind, 'id_col': id_col_en,
+                'target_id': target_id, 'data': dict(data or {}), 'status': 'pending', 'error': None,
+                'row': None, 'owner': owner, 'transient': False, 'attempted': False, 'submitted_at': time.time(),
+            }
+            self._ops[op['op_id']] = op
+            self._queue.append(op)
+            self._cond.notify()
+            return op['op_id']
+
+    def status(self, op_ids):
+        """
+        指定した書き込みの状態（pending / sending / done / failed）を返す（完了を反映済み・取り消し済みのものは返らない）
+        """
+        with self._cond:
+            return [dict(self._ops[i]) for i in op_ids if i in self._ops]
+
+    def has_pending(self, table_name):
+        """
+        テーブルに未送信（送信中を含む）の書き込みがあるか
+        """
+        with self._cond:
+            return any(op['table'] == table_name and op['status'] in ('pending', 'sending') for op in self._ops.values())
+
+    def has_failed(self, table_name):
+        """
+        テーブルに送信に失敗した（再送・破棄されていない）書き込みがあるか
+        """
+        with self._cond:
+            return any(op['table'] == table_name and op['status'] == 'failed' for op in self._ops.values())
+
+    def retry(self, op_id):
+        """
+        失敗した書き込みを再度キューに入れる（同じ行への後続の書き込みより先に送る）
+        """
+        with self._cond:
+            op = self._ops.get(op_id)
+            if op is None or op['status'] != 'failed': return
+            op.update(status='pending', error=None, transient=False, attempted=False)
+            key = self._key(op)
+            position = next((i for i, queued in enumerate(self._queue) if self._key(queued) == key), len(self._queue))
+            self._queue.insert(position, op)
+            self._blocked.discard(key)
+            self._cond.notify()
+
+    def forget(self, op_id):
+        """
+        失敗した書き込みを破棄する（登録を破棄した場合、その行への後続の書き込みも破棄する）
+        """
+        with self._cond:
+            op = self._ops.pop(op_id, None)
+            if op is None: return
+            key = self._key(op)
+            self._blocked.discard(key)
+            if op['kind'] == 'insert':
+                for held in self._take_queued(key):
+                    self._ops.pop(held['op_id'], None)
+            self._cond.notify()
+
+    def take_held(self, op_id):
+        """
+        失敗した書き込みと、その行への送信待ちの書き込みをキューから取り出す（ジャーナルへ移す用、受け付け順）
+        """
+        with self._cond:
+            op = self._ops.get(op_id)
+            if op is None or op['status'] != 'failed': return []
+            del self._ops[op_id]
+            key = self._key(op)
+            held = self._take_queued(key)
+            for queued in held:
+                self._ops.pop(queued['op_id'], None)
+            self._blocked.discard(key)
+            return [op] + held
+
+    def resolve_id(self, target_id):
+        """
+        仮IDを登録後のIDに置き換える（未登録の場合は仮IDのまま）
+        """
+        with self._cond:
+            return self._id_map.get(target_id, target_id)
+
+    def drain_results(self):
+        """
+        送信が終わった書き込みを取り出す（キャッシュへの反映用、各書き込みは1回だけ返る）
+        """
+        with self._cond:
+            results = list(self._results)
+            self._results.clear()
+            # 完了した書き込みは状態の記録から外す（失敗したものは再送・破棄されるまで残す）
+            for op in results:
+                if op['status'] == 'done':
+                    self._ops.pop(op['op_id'], None)
+            return results
+
+    @staticmethod
+    def _key(op):
+        return (op['table'], op['target_id'])
+
+    def _take_queued(self, key):
+        ops = [op for op in self._queue if self._key(op) == key]
+        for op in ops:
+            self._queue.remove(op)
+        return ops
+
+    def _eligible(self):
+        return [op for op in self._queue if self._key(op) not in self._blocked]
+
+    def _resolve(self, target_id):
+        if target_id is not None and target_id < 0:
+            if target_id not in self._id_map:
+                raise RuntimeError("先行する登録が完了していないため送信できません")
+            return self._id_map[target_id]
+        return target_id
+
+    def _take_batch(self):
+        # 送信を止めている行以外の先頭から、同じテーブル・同じ種類の登録（同じカラム構成）または削除をまとめて取り出す
+        eligible = self._eligible()
+        if not eligible: return []
+        first = eligible[0]
+        batch = [first]
+        if first['kind'] in ('insert', 'delete'):
+            for op in eligible[1:]:
+                if len(batch) >= self.batch_size: break
+                if op['table'] != first['table'] or op['kind'] != first['kind']: break
+                if op['kind'] == 'insert' and set(op['data']) != set(first['data']): break
+                batch.append(op)
+        for op in batch:
+            self._queue.remove(op)
+            op['status'] = 'sending'
+        return batch
+
+    def _send(self, batch):
+        with Span(self._registries, batch[0]['table'], f"queue_{batch[0]['kind']}") as span:
+            self._send_batch(batch)
+            span.rows = len(batch)
+
+    def _send_batch(self, batch):
+        first = batch[0]
+        table = self._client.table(first['table'])
+        if first['kind'] == 'insert':
+            # 登録は冪等でないため再試行しない
+            res = table.insert([op['data'] for op in batch], returning=ReturnMethod.representation).execute()
+            for op, row in zip(batch, res.data or []):
+                op['row'] = row
+                self._id_map[op['target_id']] = row.get(op['id_col'])
+        elif first['kind'] == 'delete':
+            ids = [self._resolve(op['target_id']) for op in batch]
+            call_with_retry(table.delete(returning=ReturnMethod.minimal).in_(first['id_col'], ids).execute)
+        else:
+            target = self._resolve(first['target_id'])
+            res = call_with_retry(table.update(first['data'], returning=ReturnMethod.representation).eq(first['id_col'], target).execute)
+            first['row'] = (res.data or [None])[0]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._eligible():
+                    self._cond.wait()
+            # 続けて届く書き込みをまとめるため少し待つ
+            time.sleep(self.batch_delay)
+            with self._cond:
+                batch = self._take_batch()
+            if not batch: continue
+            try:
+                self._send(batch)
+                status, error, transient, attempted = 'done', None, False, False
+            except Exception as e:
+                # transient: 接続の問題（ジャーナルへ移して後で再送する）
+                # attempted: サーバーに届いた可能性がある（登録は自動では再送しない）
+                status, error, transient, attempted = 'failed', str(e), is_transient(e), not is_unreachable(e)
+            with self._cond:
+                for op in batch:
+                    op.update(status=status, error=error, transient=transient, attempted=attempted)
+                    if status == 'failed':
+                        self._blocked.add(self._key(op))
+                    self._results.append(dict(op))
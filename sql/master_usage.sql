@@ -0,0 +1,22 @@
+-- マスタデータ（選択肢）の使用件数の集計関数
+-- 区分ごとに1回の呼び出しで、全選択肢の件数を GROUP BY で返す（初期設定画面の件数表示・削除前の確認用）
+-- Supabase の SQL Editor で実行してください（何度実行しても同じ結果になります）
+
+create or replace function master_usage_counts(p_category text)
+returns table (name text, usage_count bigint)
+language sql stable
+as $$
+    select activity_type, count(*) from activities
+        where p_category = 'activity' and activity_type is not null group by activity_type
+    union all
+    select asset_type, count(*) from assets
+        where p_category = 'asset' and asset_type is not null group by asset_type
+    union all
+    select relationship, count(*) from related_parties
+        where p_category = 'relationship' and relationship is not null group by relationship
+    union all
+    select guardianship_type, count(*) from persons
+        where p_category = 'guardian_type' and guardianship_type is not null group by guardianship_type
+$$;
+
+grant execute on function master_usage_counts(text) to anon, authenticated;
@@ -0,0 +1,46 @@
+-- 小口現金出納帳（activities の 入金・出金）の集計関数
+-- Supabase の SQL Editor で実行してください（何度実行しても同じ結果になります）
+-- ローカル読み取りレプリカ（modules/replica.py）にも同じ計算を実装しています
+
+-- 利用者・活動種別・日付での絞り込み用
+create index if not exists idx_activities_person_type_date
+    on activities (person_id, activity_type, activity_date);
+
+-- 現在残高（p_until を指定した場合はその日までの残高）
+create or replace function petty_cash_balance(p_person_id bigint, p_until date default null)
+returns bigint
+language sql stable
+as $$
+    select coalesce(sum(case when activity_type = '入金' then coalesce(expense, 0) else -coalesce(expense, 0) end), 0)::bigint
+    from activities
+    where person_id = p_person_id
+      and activity_type in ('入金', '出金')
+      and (p_until is null or activity_date <= p_until)
+$$;
+
+-- 出納帳（期間内の行と、期間より前を含めた各行時点の残高）
+-- 並び順は 記録日 → 作成日時 → ID（画面の表示順と同じ）
+create or replace function petty_cash_ledger(p_person_id bigint, p_from date default null, p_to date default null)
+returns table (
+    activity_id bigint, person_id bigint, activity_date date, activity_type text,
+    location text, expense int, note text, created_at timestamptz, balance bigint
+)
+language sql stable
+as $$
+    select * from (
+        select a.activity_id, a.person_id, a.activity_date, a.activity_type,
+               a.location, a.expense, a.note, a.created_at,
+               (sum(case when a.activity_type = '入金' then coalesce(a.expense, 0) else -coalesce(a.expense, 0) end)
+                   over (order by a.activity_date, a.created_at, a.activity_id
+                         rows between unbounded preceding and current row))::bigint as balance
+        from activities a
+        where a.person_id = p_person_id
+          and a.activity_type in ('入金', '出金')
+          and (p_to is null or a.activity_date <= p_to)
+    ) ledger
+    where p_from is null or ledger.activity_date >= p_from
+    order by ledger.activity_date, ledger.created_at, ledger.activity_id
+$$;
+
+grant execute on function petty_cash_balance(bigint, date) to anon, authenticated;
+grant execute on function petty_cash_ledger(bigint, date, date) to anon, authenticated;
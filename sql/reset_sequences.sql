@@ -0,0 +1,30 @@
+-- バックアップからの復元後に、各テーブルの自動採番を「最大ID + 1」から再開させる関数
+-- 復元はIDを指定して登録するため、採番が進まず次回の登録でIDが重複するのを防ぐ
+-- Supabase の SQL Editor で実行してください（何度実行しても同じ結果になります）
+
+create or replace function reset_id_sequences()
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    r record;
+begin
+    for r in
+        select * from (values
+            ('persons', 'person_id'), ('activities', 'activity_id'), ('assets', 'asset_id'),
+            ('related_parties', 'related_id'), ('app_system_user', 'id'), ('master_options', 'id')
+        ) as t(tbl, col)
+    loop
+        execute format(
+            'select setval(pg_get_serial_sequence(%L, %L), coalesce((select max(%I) from %I), 0) + 1, false)',
+            r.tbl, r.col, r.col, r.tbl
+        );
+    end loop;
+end
+$$;
+
+-- security definer で全テーブルの採番を変更するため、未ログイン（anon）からは呼び出せないようにする
+revoke execute on function reset_id_sequences() from public, anon;
+grant execute on function reset_id_sequences() to authenticated, service_role;
@@ -0,0 +1,39 @@
+-- 差分同期（キャッシュ・ローカル読み取りレプリカ）用の更新日時
+-- 登録・更新のたびにサーバー側で updated_at を現在時刻にする（アプリからの値は使わない）
+-- Supabase の SQL Editor で実行してください（何度実行しても同じ結果になります）
+
+alter table activities add column if not exists updated_at timestamptz;
+alter table assets add column if not exists updated_at timestamptz;
+alter table related_parties add column if not exists updated_at timestamptz;
+
+-- 既存の行は作成日時（ない場合は現在時刻）で埋める
+update activities set updated_at = coalesce(created_at, now()) where updated_at is null;
+update assets set updated_at = now() where updated_at is null;
+update related_parties set updated_at = now() where updated_at is null;
+
+create or replace function set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end
+$$;
+
+drop trigger if exists trg_activities_updated_at on activities;
+create trigger trg_activities_updated_at before insert or update on activities
+    for each row execute function set_updated_at();
+
+drop trigger if exists trg_assets_updated_at on assets;
+create trigger trg_assets_updated_at before insert or update on assets
+    for each row execute function set_updated_at();
+
+drop trigger if exists trg_related_parties_updated_at on related_parties;
+create trigger trg_related_parties_updated_at before insert or update on related_parties
+    for each row execute function set_updated_at();
+
+-- 差分取得（updated_at >= 前回の最終更新日時）用
+create index if not exists idx_activities_updated on activities (updated_at);
+create index if not exists idx_assets_updated on assets (updated_at);
+create index if not exists idx_related_parties_updated on related_parties (updated_at);
@@ -0,0 +1,208 @@
+import functools
+import time
+import pytest
+from modules import database
+from modules.cache import TableCache
+from modules.journal import WriteJournal
+from modules.metrics import MetricsRegistry, Span
+from modules.resilience import CircuitBreaker, call_with_retry
+
+class TransientError(Exception):
+    """
+    一時的な障害（503）を表す例外
+    """
+    code = '503'
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeQuery:
+    """
+    PostgRESTのクエリビルダーの代わり（select / 絞り込み / order / range のみ対応）
+    """
+    def __init__(self, backend, table_name):
+        self.backend = backend
+        self.table_name = table_name
+        self.filters = []
+        self.count = None
+        self.order_col = None
+        self.bounds = None
+        self.action = None
+
+    def insert(self, data, returning=None):
+        self.action = ('insert', data if isinstance(data, list) else [data])
+        return self
+
+    def upsert(self, data, on_conflict=None, returning=None):
+        self.action = ('upsert', (data if isinstance(data, list) else [data], on_conflict))
+        return self
+
+    def update(self, data, returning=None):
+        self.action = ('update', data)
+        return self
+
+    def delete(self, returning=None):
+        self.action = ('delete', None)
+        return self
+
+    def select(self, columns="*", count=None):
+        self.count = count
+        return self
+
+    def eq(self, col, val):
+        self.filters.append(lambda r: r.get(col) == val)
+        return self
+
+    def gte(self, col, val):
+        self.filters.append(lambda r: r.get(col) is not None and r.get(col) >= val)
+        return self
+
+    def in_(self, col, values):
+        self.filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def order(self, col):
+        self.order_col = col
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def limit(self, n):
+        self.bounds = (0, n - 1)
+        return self
+
+    def execute(self):
+        self.backend.calls += 1
+        if self.backend.failures:
+            raise self.backend.failures.pop(0)
+        if self.action:
+            return FakeResponse(self.backend.write(self.table_name, self.action, self.filters))
+        rows = [r for r in self.backend.tables.get(self.table_name, []) if all(f(r) for f in self.filters)]
+        if self.order_col: rows.sort(key=lambda r: r[self.order_col])
+        total = len(rows)
+        if self.bounds:
+            start, end = self.bounds
+            # PostgRESTの max-rows と同様に、要求より少ない行数で打ち切る
+            rows = rows[start:min(end + 1, start + self.backend.max_rows)]
+        return FakeResponse([dict(r) for r in rows], total if self.count else None)
+
+class FakeApiError(Exception):
+    """
+    PostgRESTのエラー（codeで種類を表す）
+    """
+    def __init__(self, code, message=""):
+        super().__init__(message or code)
+        self.code = code
+
+class FakeRpc:
+    def __init__(self, backend, name, params):
+        self.backend = backend
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.backend.rpc_calls.append(self.name)
+        if self.backend.failures:
+            raise self.backend.failures.pop(0)
+        if self.name not in self.backend.functions:
+            # 関数が作成されていない場合のエラー
+            raise FakeApiError('PGRST202', f"Could not find the function {self.name}")
+        return FakeResponse(self.backend.functions[self.name](self.backend, **self.params))
+
+class FakeBackend:
+    """
+    Supabaseクライアントの代わりに使うローカルの疑似バックエンド
+    failuresに例外を積むと、その数だけ execute() が失敗する
+    """
+    def __init__(self, tables=None, max_rows=1000):
+        self.tables = tables or {}
+        self.max_rows = max_rows
+        self.failures = []
+        self.calls = 0
+        self.functions = {}  # データベース側の関数名 -> (backend, **params) を受け取る関数
+        self.rpc_calls = []
+        self.next_id = 1000
+        self.id_columns = {'persons': 'person_id', 'activities': 'activity_id', 'assets': 'asset_id',
+                           'related_parties': 'related_id'}
+
+    def table(self, table_name):
+        return FakeQuery(self, table_name)
+
+    def write(self, table_name, action, filters):
+        """
+        登録・更新・削除を行い、対象の行を返す（IDは登録順の連番）
+        """
+        table = self.tables.setdefault(table_name, [])
+        kind, data = action
+        id_col = self.id_columns.get(table_name, 'id')
+        if kind == 'insert':
+            rows = [dict(r) for r in data]
+            for r in rows:
+                self.next_id += 1
+                r.setdefault(id_col, self.next_id)
+            table.extend(rows)
+            return [dict(r) for r in rows]
+        if kind == 'upsert':
+            rows, on_conflict = data
+            for r in rows:
+                match = [t for t in table if t.get(on_conflict) == r.get(on_conflict)]
+                if match: match[0].update(r)
+                else: table.append(dict(r))
+            return [dict(r) for r in rows]
+        targets = [r for r in table if all(f(r) for f in filters)]
+        if kind == 'update':
+            for r in targets: r.update(data)
+        else:
+            self.tables[table_name] = [r for r in table if r not in targets]
+        return [dict(r) for r in targets]
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+def wait_results(queue, count, timeout=5):
+    """
+    書き込みキューの送信結果がcount件揃うまで待って返す
+    """
+    results = []
+    deadline = time.monotonic() + timeout
+    while len(results) < count:
+        assert time.monotonic() < deadline, "送信が終わりませんでした"
+        results += queue.drain_results()
+        time.sleep(0.01)
+    return results
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    """
+    databaseモジュールの接続先・キャッシュ・計測を疑似バックエンドに差し替える
+    """
+    fake = FakeBackend()
+    cache = TableCache()
+    sleeps = []
+    monkeypatch.setattr(database, 'init_supabase', lambda: fake)
+    monkeypatch.setattr(database, 'get_table_cache', lambda: cache)
+    monkeypatch.setattr(database, 'get_replica', lambda: None)
+    monkeypatch.setattr(database, 'get_write_queue', lambda: None)
+    journal = WriteJournal(str(tmp_path / "journal.sqlite3"))
+    monkeypatch.setattr(database, 'get_journal', lambda: journal)
+    monkeypatch.setattr(database, 'READ_BREAKER', CircuitBreaker())
+    monkeypatch.setattr(database, 'call_with_retry', functools.partial(call_with_retry, sleep=sleeps.append))
+    monkeypatch.setattr(database, 'trace', lambda *args: Span([MetricsRegistry()], *args))
+    fake.cache = cache
+    fake.journal = journal
+    fake.sleeps = sleeps
+    return fake
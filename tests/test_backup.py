@@ -0,0 +1,52 @@
+import io
+import pytest
+from modules import backup, database
+from modules.backup import create_backup, restore_backup
+
+@pytest.fixture
+def backup_backend(backend, monkeypatch):
+    monkeypatch.setattr(backup, 'init_supabase', lambda: backend)
+    monkeypatch.setattr(backup, 'bulk_upsert', database.bulk_upsert)
+    backend.tables.update({
+        'persons': [{'person_id': 1, 'name': '山田 太郎'}, {'person_id': 2, 'name': '鈴木 花子'}],
+        'activities': [{'activity_id': 10, 'person_id': 1, 'note': '面会'}],
+    })
+    backend.functions['reset_id_sequences'] = lambda b: None
+    return backend
+
+def _report(backend):
+    report = restore_backup(io.BytesIO(create_backup()))
+    return report.set_index('テーブル')
+
+def test_restore_is_verified_by_ids(backup_backend):
+    report = _report(backup_backend)
+    assert (report['検証'] == 'OK').all()
+    assert report.loc['persons', '復元後の件数'] == 2
+
+def test_restore_reports_rows_not_in_backup(backup_backend, monkeypatch):
+    original = backup._restore_table
+    def restore_with_extra(client, table_name, df):
+        result = original(client, table_name, df)
+        if table_name == 'persons':
+            # 復元前から残っていた行（バックアップにない行は削除されない）
+            client.tables['persons'].append({'person_id': 99, 'name': '別人'})
+        return result
+    monkeypatch.setattr(backup, '_restore_table', restore_with_extra)
+    report = _report(backup_backend)
+    assert report.loc['persons', '検証'] == 'NG'
+    assert report.loc['persons', '不足ID数'] == 0
+
+def test_restore_reports_missing_ids(backup_backend, monkeypatch):
+    original = backup._restore_table
+    def restore_and_lose_row(client, table_name, df):
+        result = original(client, table_name, df)
+        if table_name == 'persons':
+            client.tables['persons'] = [r for r in client.tables['persons'] if r['person_id'] != 2]
+            client.tables['persons'].append({'person_id': 99, 'name': '別人'})
+        return result
+    monkeypatch.setattr(backup, '_restore_table', restore_and_lose_row)
+    report = _report(backup_backend)
+    # 件数は一致しても、バックアップのIDが欠けていればNG
+    assert report.loc['persons', '復元後の件数'] == 2
+    assert report.loc['persons', '不足ID数'] == 1
+    assert report.loc['persons', '検証'] == 'NG'
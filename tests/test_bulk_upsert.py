@@ -0,0 +1,36 @@
+import pytest
+from modules import database
+from conftest import FakeApiError, TransientError
+
+@pytest.fixture(autouse=True)
+def _no_wait(monkeypatch):
+    monkeypatch.setattr(database, 'IMPORT_RETRY_WAIT', 0)
+
+def _chunks(method, n):
+    return [(method, [{'asset_id': i, 'name': f"財産{i}"} for i in range(n)])]
+
+def test_upsert_chunk_is_retried_on_transient_error(backend):
+    backend.failures = [TransientError()]
+    result = database.bulk_upsert(backend, 'assets', _chunks('upsert', 3), 'asset_id')
+    assert result['error'] is None
+    assert result['count'] == 3
+
+def test_permanent_error_is_not_retried(backend):
+    backend.failures = [FakeApiError("23505", "duplicate key")]
+    result = database.bulk_upsert(backend, 'assets', _chunks('upsert', 3), 'asset_id')
+    assert result['error'] is not None
+    assert backend.calls == 1
+
+def test_insert_chunk_is_not_resent_after_ambiguous_failure(backend):
+    # 送信後にタイムアウトした場合（サーバーでは登録済みかもしれない）
+    backend.failures = [TransientError()]
+    result = database.bulk_upsert(backend, 'assets', _chunks('insert', 3))
+    assert result['error'] is not None
+    assert result['next_chunk'] == 0
+    assert backend.calls == 1
+
+def test_insert_chunk_is_retried_when_never_sent(backend):
+    backend.failures = [ConnectionRefusedError()]
+    result = database.bulk_upsert(backend, 'assets', _chunks('insert', 3))
+    assert result['error'] is None
+    assert backend.calls == 2
@@ -0,0 +1,28 @@
+from modules.cache import TableCache
+from conftest import FakeClock
+
+def test_derive_drops_superseded_entries():
+    cache = TableCache()
+    cache.derive("ledger_1_2025", ['activities'], lambda: 'old')
+    cache.invalidate('activities')
+    cache.derive("ledger_2_2025", ['activities'], lambda: 'new')
+    assert set(cache._derived) == {"ledger_2_2025"}
+
+def test_derive_drops_expired_entries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('modules.cache.time.monotonic', clock)
+    cache = TableCache(ttl=10)
+    cache.derive("ledger_1_2024", ['activities'], lambda: 'a')
+    clock.advance(11)
+    cache.derive("ledger_1_2025", ['activities'], lambda: 'b')
+    assert set(cache._derived) == {"ledger_1_2025"}
+
+def test_derive_keeps_at_most_max_entries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('modules.cache.time.monotonic', clock)
+    cache = TableCache(max_derived=3)
+    for i in range(5):
+        clock.advance(1)
+        cache.derive(f"ledger_{i}", ['activities'], lambda: i)
+    assert sorted(cache._derived) == ["ledger_2", "ledger_3", "ledger_4"]
+    assert cache.derive("ledger_4", ['activities'], lambda: 'rebuilt') == 4
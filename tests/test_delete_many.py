@@ -0,0 +1,35 @@
+from modules import database
+from modules.constants import MAP_ACTIVITIES, PETTY_CASH_TYPES
+from conftest import TransientError
+
+CASH_FILTER = {'person_id': 1, '活動': ('in', PETTY_CASH_TYPES)}
+
+def _rows():
+    return [{'activity_id': 1, 'person_id': 1, 'activity_type': '入金', 'expense': 1000},
+            {'activity_id': 2, 'person_id': 1, 'activity_type': '出金', 'expense': 300},
+            {'activity_id': 3, 'person_id': 1, 'activity_type': '面会', 'expense': 0}]
+
+def _withdrawal():
+    return {'person_id': 1, '記録日': '2025-01-03', '活動': '出金', '交通費・立替金': 500}
+
+def test_delete_many_by_filter(backend):
+    backend.tables['activities'] = _rows()
+    assert database.delete_many("activities", "activity_id", MAP_ACTIVITIES, filters=CASH_FILTER) == 2
+    assert [r['activity_id'] for r in backend.tables['activities']] == [3]
+
+def test_delete_many_refuses_while_writes_are_journaled(backend, monkeypatch):
+    monkeypatch.setattr(database, '_session_owner', lambda: 'session-a')
+    backend.tables['activities'] = _rows()
+    backend.failures = [ConnectionRefusedError()]
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    assert database.delete_many("activities", "activity_id", MAP_ACTIVITIES, filters=CASH_FILTER) is None
+    assert len(backend.tables['activities']) == 3
+
+def test_delete_many_refuses_while_journal_entry_failed(backend, monkeypatch):
+    monkeypatch.setattr(database, '_session_owner', lambda: 'session-a')
+    backend.tables['activities'] = _rows()
+    backend.failures = [TransientError()]
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    database.replay_journal(force=True)
+    assert backend.journal.failed()
+    assert database.delete_many("activities", "activity_id", MAP_ACTIVITIES, filters=CASH_FILTER) is None
@@ -0,0 +1,46 @@
+from modules import database
+from modules.constants import MAP_ASSETS
+
+def _asset(asset_id, value, updated_at):
+    return {'asset_id': asset_id, 'person_id': 1, 'asset_type': '預貯金', 'name': f"銀行{asset_id}", 'value': value,
+            'updated_at': updated_at}
+
+def _values(df):
+    return dict(zip(df['asset_id'], df['評価額・残高']))
+
+def test_expired_cache_picks_up_updated_rows(backend):
+    backend.tables['assets'] = [_asset(1, 100, '2025-01-01T00:00:00+00:00'), _asset(2, 200, '2025-01-01T00:00:00+00:00')]
+    database.fetch_table("assets", MAP_ASSETS)
+    backend.tables['assets'][0] = _asset(1, 150, '2025-01-02T00:00:00+00:00')
+    backend.tables['assets'].append(_asset(3, 300, '2025-01-02T00:00:00+00:00'))
+    backend.cache.ttl = 0
+    df = database.fetch_table("assets", MAP_ASSETS)
+    assert _values(df) == {1: 150, 2: 200, 3: 300}
+
+def test_delta_includes_rows_committed_slightly_out_of_order(backend):
+    backend.tables['assets'] = [_asset(1, 100, '2025-01-01T00:10:00+00:00')]
+    database.fetch_table("assets", MAP_ASSETS)
+    # 先に開始したトランザクションが後からコミットされた行（更新日時が最終更新日時より少し前）
+    backend.tables['assets'].append(_asset(2, 200, '2025-01-01T00:09:30+00:00'))
+    backend.cache.ttl = 0
+    df = database.fetch_table("assets", MAP_ASSETS)
+    assert _values(df) == {1: 100, 2: 200}
+
+def test_reconcile_reloads_whole_table(backend, monkeypatch):
+    backend.tables['assets'] = [_asset(1, 100, '2025-01-01T00:00:00+00:00'), _asset(2, 200, '2025-01-01T00:00:00+00:00')]
+    database.fetch_table("assets", MAP_ASSETS)
+    del backend.tables['assets'][1]
+    # 更新日時が変わらないまま書き換えられた行（トリガー未設定の環境など）
+    backend.tables['assets'][0] = _asset(1, 999, '2025-01-01T00:00:00+00:00')
+    backend.cache.ttl = 0
+    monkeypatch.setattr(database, 'RECONCILE_INTERVAL', -1)
+    df = database.fetch_table("assets", MAP_ASSETS)
+    assert _values(df) == {1: 999}
+
+def test_table_without_updated_at_reloads_in_full(backend):
+    backend.tables['assets'] = [_asset(1, 100, None)]
+    database.fetch_table("assets", MAP_ASSETS)
+    backend.tables['assets'][0] = _asset(1, 150, None)
+    backend.cache.ttl = 0
+    df = database.fetch_table("assets", MAP_ASSETS)
+    assert _values(df) == {1: 150}
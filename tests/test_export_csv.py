@@ -0,0 +1,27 @@
+from modules import database
+from modules.constants import MAP_MASTER
+from conftest import TransientError
+
+MASTER_ROWS = [{'id': 1, 'category': 'activity', 'name': '面会', 'sort_order': 1}]
+
+def test_export_is_not_built_from_stale_frame(backend):
+    backend.tables['master_options'] = MASTER_ROWS
+    database.fetch_table("master_options", MAP_MASTER)
+    backend.cache.ttl = 0
+    backend.failures = [TransientError()] * 3
+    assert database.export_csv("master_options", MAP_MASTER) is None
+    # 接続が回復したら最新のデータで作成する
+    backend.tables['master_options'] = MASTER_ROWS + [{'id': 2, 'category': 'activity', 'name': '電話', 'sort_order': 2}]
+    csv = database.export_csv("master_options", MAP_MASTER).decode('cp932')
+    assert '電話' in csv
+
+def test_export_is_not_built_from_error_frame(backend):
+    backend.failures = [TransientError()] * 3
+    assert database.export_csv("master_options", MAP_MASTER) is None
+    backend.tables['master_options'] = MASTER_ROWS
+    assert '面会' in database.export_csv("master_options", MAP_MASTER).decode('cp932')
+
+def test_export_bytes_are_not_kept_in_cache(backend):
+    backend.tables['master_options'] = MASTER_ROWS
+    assert database.export_csv("master_options", MAP_MASTER)
+    assert not backend.cache._derived
@@ -0,0 +1,41 @@
+import io
+import pytest
+from modules import database
+from modules.constants import MAP_ACTIVITIES, TYPES_ACTIVITIES
+
+def _csv(text):
+    return io.BytesIO(text.encode('utf-8-sig'))
+
+def _records(text, failures=None):
+    chunks = database.iter_import_chunks(_csv(text), MAP_ACTIVITIES, TYPES_ACTIVITIES, 'activity_id', failures)
+    return [r for _, chunk in chunks for r in chunk]
+
+def test_unreadable_values_are_reported_with_line_numbers():
+    failures = []
+    records = _records("activity_id,person_id,記録日,交通費・立替金,重要\n"
+                       "1,1,2025-01-03,\"1,200円\",○\n"
+                       "2,1,2025-01-04,千円,はい\n"
+                       "3,1,2025-01-05,,たぶん\n", failures)
+    assert [r['expense'] for r in records] == [1200, None, None]
+    assert failures == [{'列': '交通費・立替金', '件数': 1, '行': '3'}, {'列': '重要', '件数': 1, '行': '4'}]
+
+def test_unreadable_id_aborts_before_sending():
+    with pytest.raises(ValueError, match="person_id.*3行目"):
+        _records("activity_id,person_id,記録日\n"
+                 "1,1,2025-01-03\n"
+                 "2,山田,2025-01-04\n")
+
+def test_blank_values_are_not_reported():
+    failures = []
+    _records("activity_id,person_id,交通費・立替金,重要\n,1,,\n", failures)
+    assert failures == []
+
+def test_exported_updated_at_is_not_imported(backend):
+    backend.tables['activities'] = [{'activity_id': 1, 'person_id': 1, 'activity_type': '面会', 'note': '元',
+                                     'updated_at': '2025-01-03T10:00:00+00:00'}]
+    csv = database.export_csv("activities", MAP_ACTIVITIES)
+    backend.tables['activities'] = []
+    database.process_import(io.BytesIO(csv), "activities", MAP_ACTIVITIES, "activity_id")
+    [row] = backend.tables['activities']
+    assert row['note'] == '元'
+    assert 'updated_at' not in row
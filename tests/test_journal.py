@@ -0,0 +1,76 @@
+import pytest
+from modules import database
+from modules.constants import MAP_ACTIVITIES
+from conftest import TransientError
+
+@pytest.fixture
+def owner(monkeypatch):
+    current = {'id': 'session-a'}
+    monkeypatch.setattr(database, '_session_owner', lambda: current['id'])
+    return current
+
+def _withdrawal(expense=500):
+    return {'person_id': 1, '記録日': '2025-01-03', '活動': '出金', '交通費・立替金': expense, '要点': '日用品'}
+
+def _cash_rows(backend):
+    return [r for r in backend.tables.get('activities', []) if r.get('activity_type') == '出金']
+
+def test_identical_entries_are_both_replayed(backend, owner):
+    backend.failures = [ConnectionRefusedError()]
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    assert backend.journal.count_pending() == 2
+    assert database.replay_journal(force=True) == 2
+    assert len(_cash_rows(backend)) == 2
+
+def test_attempted_insert_waits_for_user_confirmation(backend, owner):
+    # 送信後に応答が失われた登録（サーバーに届いたかどうか分からない）
+    backend.failures = [TransientError()]
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    entry = backend.journal.pending()[0]
+    database.update_data("activities", "activity_id", database.get_journal().temp_id(entry['seq']),
+                         {'要点': '日用品（訂正）'}, MAP_ACTIVITIES)
+    database.replay_journal(force=True)
+    assert _cash_rows(backend) == []
+    assert [e['seq'] for e in backend.journal.failed(owner='session-a')] == [entry['seq']]
+    # 後続の更新は破棄されずに保留される
+    assert backend.journal.count_pending() == 1
+
+    database.retry_journal_entry(entry['seq'])
+    rows = _cash_rows(backend)
+    assert len(rows) == 1
+    assert rows[0]['note'] == '日用品（訂正）'
+    assert backend.journal.count_pending() == 0
+
+def test_failed_entries_are_scoped_to_the_session(backend, owner):
+    backend.failures = [TransientError()]
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    database.replay_journal(force=True)
+    seq = backend.journal.failed()[0]['seq']
+    owner['id'] = 'session-b'
+    assert database.get_journal_status() == (0, [])
+    database.discard_journal_entry(seq, 'activities')
+    assert len(backend.journal.failed()) == 1
+    owner['id'] = 'session-a'
+    database.discard_journal_entry(seq, 'activities')
+    assert backend.journal.failed() == []
+
+def test_replay_during_outage_is_resent_after_recovery(backend, owner):
+    backend.failures = [ConnectionRefusedError()]
+    database.insert_data("activities", _withdrawal(), MAP_ACTIVITIES)
+    # 接続できない間の再送（サーバーには届いていない）
+    backend.failures = [ConnectionRefusedError()]
+    assert database.replay_journal(force=True) == 0
+    assert not backend.journal.pending()[0]['attempted']
+    assert database.replay_journal(force=True) == 1
+    assert len(_cash_rows(backend)) == 1
+    assert backend.journal.failed() == []
+
+def test_journaled_update_is_shown_in_per_person_view(backend, owner):
+    backend.tables['activities'] = [{'activity_id': 1, 'person_id': 1, 'activity_type': '面会', 'note': '元'}]
+    database.fetch_table("activities", MAP_ACTIVITIES, filters={'person_id': 1})
+    backend.failures = [ConnectionRefusedError()] * 3
+    database.update_data("activities", "activity_id", 1, {'要点': '訂正'}, MAP_ACTIVITIES)
+    assert backend.journal.count_pending() == 1
+    df = database.fetch_table("activities", MAP_ACTIVITIES, filters={'person_id': 1})
+    assert df['要点'].tolist() == ['訂正']
@@ -0,0 +1,8 @@
+from modules import database
+from conftest import TransientError
+
+def test_master_options_are_not_cached_after_fetch_error(backend):
+    backend.tables['master_options'] = [{'id': 1, 'category': 'activity', 'name': '面会', 'sort_order': 1}]
+    backend.failures = [TransientError()] * 3
+    assert database.get_master_options().names == {}
+    assert database.get_master_options().names == {'activity': ['面会']}
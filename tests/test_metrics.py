@@ -0,0 +1,41 @@
+from modules import database
+from modules.metrics import MetricsRegistry, Span
+from modules.write_queue import WriteQueue
+from conftest import FakeApiError, wait_results
+
+def test_warm_up_records_each_table(backend, monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(database, 'trace', lambda *args: Span([registry], *args))
+    backend.tables['persons'] = [{'person_id': 1, 'name': '山田 太郎'}]
+    backend.tables['master_options'] = [{'id': 1, 'category': 'activity', 'name': '面会', 'sort_order': 1}]
+    database.warm_up(['persons', 'master_options'])
+    rows = {(r['operation'], r['table']): r['rows'] for r in registry.summary()}
+    assert rows == {('warm_up', 'master_options'): 1, ('warm_up', 'persons'): 1}
+
+def test_write_queue_records_sends(backend):
+    registry = MetricsRegistry()
+    backend.tables['activities'] = [{'activity_id': 1, 'note': '初回'}]
+    queue = WriteQueue(backend, batch_delay=0, registry=registry)
+    backend.failures = [FakeApiError('23514')]
+    queue.submit('activities', 'update', 'activity_id', 1, {'note': '更新'})
+    wait_results(queue, 1)
+    queue.submit('activities', 'delete', 'activity_id', 2)
+    wait_results(queue, 1)
+    assert registry.errors == {('queue_update', 'activities'): 1}
+    assert {r['operation'] for r in registry.summary()} == {'queue_update', 'queue_delete'}
+
+def test_replica_sync_is_recorded(backend, tmp_path, monkeypatch):
+    from modules.replica import ReadReplica
+    registry = MetricsRegistry()
+    replica = ReadReplica(str(tmp_path / "replica.sqlite3"))
+    backend.tables['persons'] = [{'person_id': 1, 'name': '山田 太郎'}]
+    # 1周目の同期が終わったところでループを抜ける
+    def stop(timeout): raise StopIteration
+    monkeypatch.setattr(replica, 'wait_for_sync_request', stop)
+    try:
+        database._replica_sync_loop(replica, backend, 0, registry)
+    except StopIteration:
+        pass
+    rows = {r['table']: r['rows'] for r in registry.summary() if r['operation'] == 'replica_sync'}
+    assert rows['persons'] == 1
+    assert set(rows) == set(database.TABLE_MAPS)
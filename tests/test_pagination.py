@@ -0,0 +1,31 @@
+from modules import database
+from modules.constants import MAP_MASTER
+
+def _rows(n):
+    return [{'id': i, 'category': 'activity', 'name': f"選択肢{i}", 'sort_order': i} for i in range(1, n + 1)]
+
+def test_iter_pages_follows_server_row_cap(backend):
+    backend.tables['master_options'] = _rows(2500)
+    backend.max_rows = 300
+    pages = list(database.iter_pages(backend, 'master_options', order_col='id', page_size=1000))
+    ids = [r['id'] for rows, _ in pages for r in rows]
+    assert ids == list(range(1, 2501))
+
+def test_iter_pages_without_count(backend, monkeypatch):
+    backend.tables['master_options'] = _rows(750)
+    backend.max_rows = 200
+    execute = database.call_with_retry
+    def no_count(func, **kwargs):
+        res = execute(func, **kwargs)
+        res.count = None
+        return res
+    monkeypatch.setattr(database, 'call_with_retry', no_count)
+    ids = [r['id'] for rows, _ in database.iter_pages(backend, 'master_options', order_col='id') for r in rows]
+    assert ids == list(range(1, 751))
+
+def test_fetch_table_keeps_rows_past_cap(backend):
+    backend.tables['master_options'] = _rows(1234)
+    backend.max_rows = 500
+    df = database.fetch_table("master_options", MAP_MASTER)
+    assert len(df) == 1234
+    assert df['id'].is_unique
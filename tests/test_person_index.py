@@ -0,0 +1,42 @@
+from modules import database, person_index
+from modules.constants import MAP_ACTIVITIES, MAP_PERSONS
+from modules.person_index import get_person_index
+from conftest import TransientError
+
+PERSONS = [{'person_id': 1, 'name': '山田太郎'}, {'person_id': 2, 'name': '鈴木花子'}]
+
+def test_person_index_is_not_cached_after_fetch_error(backend, monkeypatch):
+    monkeypatch.setattr(person_index, 'get_table_cache', lambda: backend.cache)
+    backend.tables['persons'] = PERSONS
+    backend.failures = [TransientError()] * 3
+    assert get_person_index().name_to_id == {}
+    # 接続が回復したら、キャッシュの期限を待たずに作り直す
+    assert get_person_index().name_to_id == {'山田太郎': 1, '鈴木花子': 2}
+    assert get_person_index().position_of(2) == 1
+
+def test_person_rows_are_fetched_per_person(backend, monkeypatch):
+    monkeypatch.setattr(person_index, 'get_table_cache', lambda: backend.cache)
+    backend.tables['activities'] = [
+        {'activity_id': 1, 'person_id': 1, 'activity_type': '面会'},
+        {'activity_id': 2, 'person_id': 2, 'activity_type': '電話'},
+    ]
+    df = person_index.PersonIndex(database.fetch_table("persons", MAP_PERSONS)).rows('activities', 2)
+    assert df['activity_id'].tolist() == [2]
+    assert backend.cache.get('activities') is None
+
+def test_person_rows_are_sliced_from_cached_full_table(backend, monkeypatch):
+    monkeypatch.setattr(person_index, 'get_table_cache', lambda: backend.cache)
+    backend.tables['activities'] = [
+        {'activity_id': 1, 'person_id': 1, 'activity_type': '面会'},
+        {'activity_id': 2, 'person_id': 2, 'activity_type': '電話'},
+        {'activity_id': 3, 'person_id': 1, 'activity_type': '電話'},
+    ]
+    database.fetch_table("activities", MAP_ACTIVITIES)
+    index = person_index.PersonIndex(database.fetch_table("persons", MAP_PERSONS))
+    calls = backend.calls
+    assert index.rows('activities', 1)['activity_id'].tolist() == [1, 3]
+    assert index.rows('activities', 3).empty
+    assert backend.calls == calls
+    # 書き込みでキャッシュが更新されたら索引を作り直す
+    database._write_through('activities', MAP_ACTIVITIES, 'activity_id', deleted_ids=[1])
+    assert index.rows('activities', 1)['activity_id'].tolist() == [3]
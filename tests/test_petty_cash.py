@@ -0,0 +1,52 @@
+import pytest
+from modules import database
+from modules.constants import MAP_ACTIVITIES
+from conftest import TransientError
+
+def _cash(activity_id, activity_type, expense, date):
+    return {'activity_id': activity_id, 'person_id': 1, 'activity_date': date, 'activity_type': activity_type,
+            'expense': expense, 'created_at': f"{date}T00:00:00+00:00", 'updated_at': f"{date}T00:00:00+00:00"}
+
+def _server_balance(backend, p_person_id, p_until=None):
+    rows = [r for r in backend.tables['activities'] if r['person_id'] == p_person_id]
+    return sum(r['expense'] if r['activity_type'] == '入金' else -r['expense'] for r in rows)
+
+@pytest.fixture(autouse=True)
+def _clear_rpc_state(monkeypatch):
+    monkeypatch.setattr(database, '_RPC_UNAVAILABLE', {})
+
+@pytest.fixture
+def cash(backend):
+    backend.tables['activities'] = [_cash(1, '入金', 10000, '2025-01-01'), _cash(2, '出金', 3000, '2025-01-02')]
+    return backend
+
+def test_balance_uses_rpc(cash):
+    cash.functions['petty_cash_balance'] = _server_balance
+    assert database.get_petty_cash_balance(1) == 7000
+    assert cash.rpc_calls == ['petty_cash_balance']
+
+def test_missing_rpc_is_not_retried_on_every_change(cash):
+    assert database.get_petty_cash_balance(1) == 7000
+    database._invalidate('activities')
+    assert database.get_petty_cash_balance(1) == 7000
+    assert cash.rpc_calls == ['petty_cash_balance']
+
+def test_balance_falls_back_to_cached_rows_when_backend_down(cash):
+    cash.functions['petty_cash_balance'] = _server_balance
+    database.fetch_table("activities", MAP_ACTIVITIES, filters={'person_id': 1})
+    cash.cache.ttl = 0
+    cash.failures = [TransientError()] * 20
+    assert database.get_petty_cash_balance(1) == 7000
+
+def test_pending_journal_entries_are_included(cash):
+    cash.functions['petty_cash_balance'] = _server_balance
+    database.fetch_table("activities", MAP_ACTIVITIES, filters={'person_id': 1})
+    cash.failures = [TransientError()]
+    row = _cash(None, '出金', 500, '2025-01-03')
+    del row['activity_id']
+    database.insert_data("activities", {jp: row.get(en) for jp, en in MAP_ACTIVITIES.items() if en in row}, MAP_ACTIVITIES)
+    assert cash.journal.count_pending('activities') == 1
+    assert database.get_petty_cash_balance(1) == 6500
+    ledger = database.get_petty_cash_ledger(1)
+    assert ledger['残高'].tolist() == [10000, 7000, 6500]
+    assert cash.rpc_calls == []
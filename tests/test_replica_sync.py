@@ -0,0 +1,39 @@
+from modules import database
+from modules.replica import ReadReplica
+
+def _activity(activity_id, expense, updated_at):
+    return {'activity_id': activity_id, 'person_id': 1, 'activity_date': '2025-01-01', 'activity_type': '出金',
+            'expense': expense, 'created_at': '2025-01-01T00:00:00+00:00', 'updated_at': updated_at}
+
+def _expenses(replica):
+    cols = replica.query('activities', order_col='activity_id')
+    return dict(zip(cols['activity_id'], cols['expense']))
+
+def test_replica_resyncs_updated_rows(backend, tmp_path):
+    replica = ReadReplica(str(tmp_path / "replica.sqlite3"))
+    backend.tables['activities'] = [_activity(1, 100, '2025-01-01T00:00:00+00:00')]
+    database.sync_replica_table(replica, backend, 'activities')
+    backend.tables['activities'][0] = _activity(1, 500, '2025-01-03T00:00:00+00:00')
+    database.sync_replica_table(replica, backend, 'activities')
+    assert _expenses(replica) == {1: 500}
+
+def test_local_writes_do_not_advance_replica_watermark(backend, tmp_path):
+    replica = ReadReplica(str(tmp_path / "replica.sqlite3"))
+    backend.tables['activities'] = [_activity(1, 100, '2025-01-01T00:00:00+00:00')]
+    database.sync_replica_table(replica, backend, 'activities')
+    # 画面からの書き込み（新しい日時）がレプリカに反映された後で、それより前の日時の行が同期される
+    replica.upsert_rows('activities', [_activity(3, 300, '2025-01-05T00:00:00+00:00')])
+    backend.tables['activities'] += [_activity(2, 200, '2025-01-02T00:00:00+00:00'),
+                                     _activity(3, 300, '2025-01-05T00:00:00+00:00')]
+    database.sync_replica_table(replica, backend, 'activities')
+    assert _expenses(replica) == {1: 100, 2: 200, 3: 300}
+    assert replica.watermark('activities') == '2025-01-05T00:00:00+00:00'
+
+def test_replica_reconcile_removes_deleted_rows(backend, tmp_path, monkeypatch):
+    replica = ReadReplica(str(tmp_path / "replica.sqlite3"))
+    backend.tables['activities'] = [_activity(1, 100, '2025-01-01T00:00:00+00:00'), _activity(2, 200, '2025-01-01T00:00:00+00:00')]
+    database.sync_replica_table(replica, backend, 'activities')
+    del backend.tables['activities'][0]
+    monkeypatch.setattr(database, 'RECONCILE_INTERVAL', -1)
+    database.sync_replica_table(replica, backend, 'activities')
+    assert _expenses(replica) == {2: 200}
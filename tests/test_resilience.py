@@ -0,0 +1,136 @@
+import random
+import pytest
+from modules import database
+from modules.constants import MAP_MASTER
+from modules.resilience import CircuitBreaker, CircuitOpenError, backoff_delay, call_with_retry, is_transient
+from conftest import FakeClock, TransientError
+
+class PermanentError(Exception):
+    code = '42501'
+
+def _failing(times, exc=TransientError):
+    """
+    times回失敗してから "ok" を返す関数と、呼び出し回数の記録を返す
+    """
+    calls = []
+    def func():
+        calls.append(1)
+        if len(calls) <= times: raise exc()
+        return "ok"
+    return func, calls
+
+# --- サーキットブレーカー ---
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=FakeClock())
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+def test_breaker_half_open_allows_single_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+def test_breaker_closes_after_successful_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+def test_breaker_reopens_after_failed_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.advance(9)
+    assert breaker.state == 'open'
+
+# --- 再試行 ---
+
+def test_backoff_delay_is_bounded():
+    random.seed(0)
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base_delay=0.5, max_delay=8.0) <= min(8.0, 0.5 * 2 ** attempt)
+
+def test_retry_recovers_from_transient_errors():
+    func, calls = _failing(2)
+    sleeps = []
+    assert call_with_retry(func, attempts=3, sleep=sleeps.append) == "ok"
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+def test_retry_gives_up_after_attempts():
+    func, calls = _failing(5)
+    with pytest.raises(TransientError):
+        call_with_retry(func, attempts=3, sleep=lambda s: None)
+    assert len(calls) == 3
+
+def test_retry_does_not_repeat_permanent_errors():
+    func, calls = _failing(1, PermanentError)
+    breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+    with pytest.raises(PermanentError):
+        call_with_retry(func, breaker=breaker, attempts=3, sleep=lambda s: None)
+    assert len(calls) == 1
+    assert breaker.state == 'closed'
+
+def test_retry_skips_call_while_breaker_open():
+    func, calls = _failing(0)
+    breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(func, breaker=breaker, sleep=lambda s: None)
+    assert not calls
+    assert is_transient(CircuitOpenError())
+
+# --- 取得できない場合の古いデータの表示 ---
+
+MASTER_ROWS = [{'id': 1, 'category': 'activity', 'name': '面会', 'sort_order': 1}]
+
+def test_fetch_table_retries_transient_errors(backend):
+    backend.tables['master_options'] = MASTER_ROWS
+    backend.failures = [TransientError(), TransientError()]
+    df = database.fetch_table("master_options", MAP_MASTER)
+    assert df['名称'].tolist() == ['面会']
+    assert len(backend.sleeps) == 2
+
+def test_fetch_table_serves_stale_frame_when_backend_down(backend):
+    backend.tables['master_options'] = MASTER_ROWS
+    database.fetch_table("master_options", MAP_MASTER)
+    backend.cache.ttl = 0
+    backend.failures = [TransientError()] * 3
+    df = database.fetch_table("master_options", MAP_MASTER)
+    assert df.attrs.get('stale')
+    assert df['名称'].tolist() == ['面会']
+
+def test_fetch_table_stops_calling_backend_while_breaker_open(backend):
+    backend.tables['master_options'] = MASTER_ROWS
+    database.fetch_table("master_options", MAP_MASTER)
+    backend.cache.ttl = 0
+    backend.failures = [TransientError()] * 10
+    for _ in range(3):
+        database.fetch_table("master_options", MAP_MASTER)
+    calls = backend.calls
+    assert database.READ_BREAKER.state == 'open'
+    df = database.fetch_table("master_options", MAP_MASTER)
+    assert backend.calls == calls
+    assert df.attrs.get('stale')
+
+def test_fetch_table_returns_error_frame_without_cache(backend):
+    backend.failures = [TransientError()] * 3
+    df = database.fetch_table("master_options", MAP_MASTER)
+    assert df.empty
+    assert df.attrs.get('error')
@@ -0,0 +1,30 @@
+import pytest
+from modules import database
+
+ACTIVITIES = [{'activity_id': 1, 'activity_type': '面会'}, {'activity_id': 2, 'activity_type': '面会'},
+              {'activity_id': 3, 'activity_type': '電話'}, {'activity_id': 4, 'activity_type': None}]
+
+@pytest.fixture(autouse=True)
+def _reset_rpc_state():
+    database._RPC_UNAVAILABLE.clear()
+    yield
+    database._RPC_UNAVAILABLE.clear()
+
+def _master_usage_counts(backend, p_category):
+    table_name, column_en = database.MASTER_USAGE[p_category]
+    counts = {}
+    for r in backend.tables.get(table_name, []):
+        if r.get(column_en) is not None: counts[r[column_en]] = counts.get(r[column_en], 0) + 1
+    return [{'name': k, 'usage_count': v} for k, v in counts.items()]
+
+def test_usage_counts_use_one_aggregate_call(backend):
+    backend.tables['activities'] = ACTIVITIES
+    backend.functions['master_usage_counts'] = _master_usage_counts
+    assert database.get_usage_counts('activity') == {'面会': 2, '電話': 1}
+    assert backend.rpc_calls == ['master_usage_counts']
+    assert backend.calls == 0
+
+def test_usage_counts_fall_back_when_function_missing(backend):
+    backend.tables['activities'] = ACTIVITIES
+    assert database.get_usage_counts('activity') == {'面会': 2, '電話': 1}
+    assert backend.calls > 0
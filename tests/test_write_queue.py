@@ -0,0 +1,65 @@
+import pytest
+from modules import database
+from modules.constants import MAP_ACTIVITIES
+from modules.write_queue import WriteQueue
+from conftest import FakeApiError, wait_results
+
+ROWS = [{'activity_id': 1, 'person_id': 1, 'note': '初回'}, {'activity_id': 2, 'person_id': 1, 'note': '初回'}]
+
+def _note(backend, activity_id):
+    return next(r['note'] for r in backend.tables['activities'] if r['activity_id'] == activity_id)
+
+@pytest.fixture
+def queue(backend):
+    backend.tables['activities'] = [dict(r) for r in ROWS]
+    return WriteQueue(backend, batch_delay=0)
+
+def test_retry_is_sent_before_later_writes_to_the_same_row(backend, queue):
+    backend.failures = [FakeApiError('23514')]
+    first = queue.submit('activities', 'update', 'activity_id', 1, {'note': '1回目'})
+    assert wait_results(queue, 1)[0]['status'] == 'failed'
+    queue.submit('activities', 'update', 'activity_id', 1, {'note': '2回目'})
+    other = queue.submit('activities', 'update', 'activity_id', 2, {'note': '別の行'})
+    # 失敗した行への後続の書き込みは止まり、別の行は送られる
+    assert [r['op_id'] for r in wait_results(queue, 1)] == [other]
+    assert _note(backend, 1) == '初回'
+
+    queue.retry(first)
+    assert [r['status'] for r in wait_results(queue, 2)] == ['done', 'done']
+    assert _note(backend, 1) == '2回目'
+
+def test_forgetting_failed_insert_drops_its_later_writes(backend, queue):
+    backend.failures = [FakeApiError('23514')]
+    temp_id = queue.new_temp_id()
+    first = queue.submit('activities', 'insert', 'activity_id', temp_id, {'person_id': 1, 'note': '登録'})
+    wait_results(queue, 1)
+    later = queue.submit('activities', 'update', 'activity_id', temp_id, {'note': '訂正'})
+    queue.forget(first)
+    assert queue.status([first, later]) == []
+    assert len(backend.tables['activities']) == 2
+
+def test_finished_writes_are_pruned(backend, queue):
+    op_ids = [queue.submit('activities', 'update', 'activity_id', i, {'note': '更新'}) for i in (1, 2)]
+    wait_results(queue, 2)
+    assert queue.status(op_ids) == []
+    assert queue._ops == {}
+
+def test_unreachable_writes_move_to_the_journal(backend, queue, monkeypatch):
+    monkeypatch.setattr(database, 'get_write_queue', lambda: queue)
+    monkeypatch.setattr(database, '_session_owner', lambda: 'session-a')
+    backend.failures = [ConnectionRefusedError()]
+    database.insert_data("activities", {'person_id': 1, '記録日': '2025-01-03', '活動': '面会', '要点': '登録'}, MAP_ACTIVITIES)
+    results = wait_results(queue, 1)
+    temp_id = results[0]['target_id']
+    # 失敗を反映する前に届いた、同じ行への更新
+    database.update_data("activities", "activity_id", temp_id, {'要点': '訂正'}, MAP_ACTIVITIES)
+    queue._results.extend(results)
+    database.apply_write_results()
+
+    entries = backend.journal.pending()
+    assert [(e['kind'], e['owner'], e['attempted']) for e in entries] == [('insert', 'session-a', 0), ('update', 'session-a', 0)]
+    assert entries[1]['target_id'] == backend.journal.temp_id(entries[0]['seq'])
+    assert queue._ops == {}
+
+    assert database.replay_journal(force=True) == 2
+    assert [r['note'] for r in backend.tables['activities'] if r['activity_id'] > 2] == ['訂正']